@@ -0,0 +1,84 @@
+"""
+Benchmark suite for the TCD formula (pytest-benchmark)
+======================================================
+
+    pip install pytest-benchmark
+    python -m pytest docs/benchmarks --benchmark-json=tcd-bench.json
+
+Workloads use fixed seeds at 1, 1k, 100k and 1M teams. Every run is also
+saved under .benchmarks/; the nightly job fails on a regression with
+
+    python -m pytest docs/benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+--bench-max-teams caps the workload size for a quick local run.
+"""
+
+import functools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tcd.batch import random_portfolio  # noqa: E402
+from tcd.formula import DRIVERS  # noqa: E402
+
+SIZES = [1, 1_000, 100_000, 1_000_000]
+
+# Large workloads run as a few explicit rounds instead of calibrated loops
+ROUNDS = {100_000: 3, 1_000_000: 1}
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """Every run writes a JSON result file under .benchmarks/ for regression comparison.
+
+    Set here rather than in pytest.ini addopts, which would fail to parse
+    without pytest-benchmark instead of letting each module skip.
+    """
+    if config.pluginmanager.hasplugin('benchmark'):
+        from pytest_benchmark.utils import get_tag
+        if config.option.benchmark_autosave is None:
+            config.option.benchmark_autosave = get_tag()
+        if config.option.benchmark_columns is None:
+            config.option.benchmark_columns = ['min', 'mean', 'stddev', 'rounds']
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bench-max-teams', type=int, default=None, help="skip workloads above this many teams")
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f'{n}teams')
+def n_teams(request):
+    limit = request.config.getoption('--bench-max-teams')
+    if limit is not None and request.param > limit:
+        pytest.skip(f"{request.param:,} teams is above --bench-max-teams")
+    return request.param
+
+
+@functools.lru_cache(maxsize=None)
+def portfolio(n):
+    """Fixed-seed portfolio in calculate_tcd_v4_batch argument form."""
+    return random_portfolio(n, seed=0)
+
+
+@functools.lru_cache(maxsize=None)
+def teams(n):
+    """The same portfolio as a list of calculate_tcd_v4 keyword dicts."""
+    p = portfolio(n)
+    columns = {k: p[k].tolist() for k in ('P', 'N', 'phi', 'rho', 'BV')}
+    drivers = {k: p['drivers'][k].tolist() for k in DRIVERS}
+    return [{'P': columns['P'][i], 'N': columns['N'][i], 'phi': columns['phi'][i], 'rho': columns['rho'][i],
+             'BV': columns['BV'][i], 'drivers': {k: drivers[k][i] for k in DRIVERS}} for i in range(n)]
+
+
+@pytest.fixture
+def run(benchmark):
+    """Benchmark fn for an n-team workload, recording n in the JSON output."""
+    def run(fn, n, *args, **kwargs):
+        benchmark.extra_info['teams'] = n
+        if n in ROUNDS:
+            return benchmark.pedantic(fn, args, kwargs, rounds=ROUNDS[n], iterations=1, warmup_rounds=0)
+        return benchmark(fn, *args, **kwargs)
+    return run
@@ -0,0 +1,45 @@
+"""Audit log overhead: logged scoring beside the calculate_tcd_v4 benchmarks of test_bench_formula."""
+
+import numpy as np
+import pytest
+
+from conftest import portfolio, teams
+from tcd.audit import AuditLog
+from tcd.batch import calculate_tcd_v4_batch
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.fixture
+def log(tmp_path):
+    with AuditLog(str(tmp_path / 'bench.audit')) as log:
+        yield log
+
+
+def score_logged(log, rows):
+    return [log.score(i, **row)['TCD'] for i, row in enumerate(rows)]
+
+
+@pytest.mark.benchmark(group='calculate_tcd_v4')
+def test_scalar_logged(run, n_teams, log):
+    run(score_logged, n_teams, log, teams(n_teams))
+
+
+@pytest.mark.benchmark(group='calculate_tcd_v4')
+def test_batch_record(run, n_teams, log):
+    """The caller's share of batch logging: checks and the copy into the column buffers."""
+    inputs = portfolio(n_teams)
+    result = calculate_tcd_v4_batch(**inputs)
+    run(log.record_batch, n_teams, np.arange(n_teams), result=result, **inputs)
+
+
+@pytest.mark.benchmark(group='calculate_tcd_v4')
+def test_batch_logged(run, n_teams, log):
+    """Scoring, recording and waiting for the writer thread to hash and write every block."""
+    inputs = portfolio(n_teams)
+
+    def score_and_flush():
+        log.score_batch(np.arange(n_teams), **inputs)
+        log.flush()
+
+    run(score_and_flush, n_teams)
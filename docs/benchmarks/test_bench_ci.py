@@ -0,0 +1,29 @@
+"""Confidence interval benchmarks: single team and whole portfolio."""
+
+import pytest
+
+from conftest import portfolio, teams
+from tcd.ci import tcd_confidence_interval, tcd_confidence_intervals_batch
+
+pytest.importorskip('pytest_benchmark')
+
+# Samples per team for the portfolio workloads (1M teams x 1,000 samples)
+PORTFOLIO_SAMPLES = 1_000
+
+# Single-team samples per method; Sobol keeps its balance properties at a power of two
+SINGLE_TEAM_SAMPLES = {'random': 100_000, 'sobol': 2**17, 'analytic': 0}
+
+
+@pytest.mark.benchmark(group='tcd_confidence_interval')
+@pytest.mark.parametrize('method', ['random', 'sobol', 'analytic'])
+def test_single_team(benchmark, method):
+    """The analytic interval alone, without its default Monte Carlo cross-check."""
+    benchmark(tcd_confidence_interval, teams(1)[0], n_samples=SINGLE_TEAM_SAMPLES[method], seed=42, method=method,
+              cross_check=False)
+
+
+@pytest.mark.benchmark(group='tcd_confidence_intervals_batch')
+@pytest.mark.parametrize('method', ['random', 'analytic'])
+def test_portfolio(run, n_teams, method):
+    run(tcd_confidence_intervals_batch, n_teams, **portfolio(n_teams), n_samples=PORTFOLIO_SAMPLES,
+        seed=42, method=method)
@@ -0,0 +1,47 @@
+"""Scalar and batch formula benchmarks."""
+
+import numpy as np
+import pytest
+
+from conftest import portfolio, teams
+from tcd import calculate_anomaly_score, calculate_tcd_v4, sigmoid_e_coef
+from tcd.batch import calculate_tcd_v4_batch
+
+pytest.importorskip('pytest_benchmark')
+
+
+SIGMOID_MODES = ['exact', 'table']
+
+
+def score_scalar(rows, sigmoid='exact'):
+    return [calculate_tcd_v4(**row, sigmoid=sigmoid)['TCD'] for row in rows]
+
+
+@pytest.mark.benchmark(group='sigmoid_e_coef')
+@pytest.mark.parametrize('mode', SIGMOID_MODES)
+def test_sigmoid_scalar(benchmark, mode):
+    benchmark(sigmoid_e_coef, 4.95, mode)
+
+
+@pytest.mark.benchmark(group='sigmoid_e_coef')
+def test_sigmoid_array(run, n_teams):
+    E = np.linspace(1, 7, n_teams)
+    run(sigmoid_e_coef, n_teams, E)
+
+
+@pytest.mark.benchmark(group='calculate_anomaly_score')
+def test_anomaly_score(benchmark):
+    drivers = teams(1)[0]['drivers']
+    benchmark(calculate_anomaly_score, drivers)
+
+
+@pytest.mark.benchmark(group='calculate_tcd_v4')
+@pytest.mark.parametrize('sigmoid', SIGMOID_MODES)
+def test_scalar(run, n_teams, sigmoid):
+    rows = teams(n_teams)
+    run(score_scalar, n_teams, rows, sigmoid)
+
+
+@pytest.mark.benchmark(group='calculate_tcd_v4')
+def test_batch(run, n_teams):
+    run(calculate_tcd_v4_batch, n_teams, **portfolio(n_teams))
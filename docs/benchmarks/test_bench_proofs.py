@@ -0,0 +1,78 @@
+"""Benchmarks for the workloads in symbolic_proofs.py.
+
+The V15 loop and the boundedness property are reproduced here exactly as
+the report runs them; the full report is timed end to end as well.
+"""
+
+import contextlib
+import io
+import os
+import runpy
+
+import numpy as np
+import pytest
+from hypothesis import HealthCheck, given, settings, strategies as st
+
+from tcd import calculate_tcd_v4
+
+pytest.importorskip('pytest_benchmark')
+
+DOCS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def v15_monte_carlo(n_simulations=10_000):
+    """The Section 3 FIX V15 validation loop (fixed inputs, np.random.seed(42))."""
+    np.random.seed(42)
+    delta_1_samples = np.random.uniform(0.20, 0.30, n_simulations)
+    delta_2_samples = np.random.uniform(0.05, 0.15, n_simulations)
+    tau_samples = np.random.uniform(0.16, 0.26, n_simulations)
+    delta_4_samples = np.random.uniform(0.10, 0.20, n_simulations)
+    delta_5_samples = np.random.uniform(0.08, 0.16, n_simulations)
+    tcd_samples = []
+    for i in range(n_simulations):
+        c1 = 1800000 * delta_1_samples[i] * (1 - 0.567)
+        c2 = 1800000 * delta_2_samples[i] * 0.458
+        c3 = 1800000 * tau_samples[i] * 0.393
+        c4 = 1800000 * delta_4_samples[i] * 0.467 * 3.0
+        c5 = 1800000 * delta_5_samples[i] * 0.483
+        c6 = 1800000 * 0.09 * 0.342
+        subtotal = (c1 + c2 + c3 + c4 + c5 + c6) * 0.88
+        tcd_samples.append(subtotal * 1.190 * 1.20)
+    tcd_samples = np.array(tcd_samples)
+    return np.percentile(tcd_samples, [2.5, 97.5])
+
+
+def boundedness_property():
+    """Section 5 Test 1 (1,000 examples), derandomized so every run sees the same cases."""
+    driver = st.floats(min_value=-10, max_value=20)
+
+    @given(P=st.floats(min_value=1000, max_value=1e9), N=st.integers(min_value=1, max_value=1000),
+           d=st.tuples(*[driver] * 7))
+    @settings(max_examples=1000, derandomize=True, database=None, deadline=None,
+              suppress_health_check=list(HealthCheck))
+    def test_boundedness_lower(P, N, d):
+        drivers = dict(zip(['communication', 'trust', 'psych_safety', 'goal_clarity', 'coordination', 'tms',
+                            'team_cognition'], d))
+        assert calculate_tcd_v4(P, N, drivers, 1.0, 1.0, 3.0)['TCD'] >= 0
+
+    test_boundedness_lower()
+
+
+def proof_report():
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.chdir(DOCS):
+        runpy.run_path(os.path.join(DOCS, 'symbolic_proofs.py'), run_name='__main__')
+
+
+@pytest.mark.benchmark(group='symbolic_proofs')
+def test_v15_monte_carlo(benchmark):
+    benchmark(v15_monte_carlo)
+
+
+@pytest.mark.benchmark(group='symbolic_proofs')
+def test_boundedness_property(benchmark):
+    benchmark.pedantic(boundedness_property, rounds=3, iterations=1)
+
+
+@pytest.mark.benchmark(group='symbolic_proofs')
+def test_full_report(benchmark):
+    benchmark.pedantic(proof_report, rounds=1, iterations=1)
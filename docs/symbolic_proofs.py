@@ -7,10 +7,12 @@ This script provides PhD-level mathematical proofs using:
 - SymPy for symbolic mathematics and formal proofs
 - mpmath for arbitrary precision arithmetic
 - hypothesis for property-based testing
-- scipy for statistical validation
 
 All 15 vulnerabilities are addressed with formal proofs.
 
+This file is the proof report entry point (python symbolic_proofs.py). The
+formula itself is implemented in the importable tcd package next to it.
+
 Version: 4.0 (Peer-Review Ready)
 Date: December 24, 2025
 """
@@ -25,13 +27,17 @@ from sympy.core.relational import Relational
 import mpmath
 from mpmath import mp, mpf
 import numpy as np
-from scipy import stats, optimize
 from hypothesis import given, strategies as st, settings, assume
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional
 from decimal import Decimal, getcontext
 import json
 
+# The formula under test lives in the side-effect-free tcd package
+from tcd import (clamp, sigmoid_e_coef, team_size_factor, calculate_anomaly_score,
+                 gaming_penalty, calculate_tcd_v4, tcd_confidence_interval)
+from tcd.symcache import cached_expr
+
 # Set high precision for financial calculations
 mp.dps = 50  # 50 decimal places
 getcontext().prec = 50
@@ -465,7 +471,7 @@ print()
 # Symbolic derivative
 E_coef_sym = sp.Rational(18, 100) / (1 + exp(2 * (E - 4)))
 dE_coef_dE = diff(E_coef_sym, E)
-dE_coef_dE_simplified = simplify(dE_coef_dE)
+dE_coef_dE_simplified = cached_expr('simplify', simplify, dE_coef_dE)
 
 print("PROOF:")
 print(f"  dE_coef/dE = d/dE [0.18 / (1 + e^(2(E-4)))]")
@@ -512,6 +518,21 @@ print(f"  C₁ = P × 0.25 × 0.4333... = ${c1}")
 print(f"  Rounded to cents: ${float(c1):,.2f}")
 print()
 
+# The whole formula in exact arithmetic (calculate_tcd_v4 precision= option)
+print("FULL FORMULA IN EXACT ARITHMETIC (Section 6 scenario):")
+v5_team = dict(P=1800000, N=15, phi=1.20, rho=1.15, BV=3.0, drivers={
+    'communication': 4.2, 'trust': 5.1, 'psych_safety': 4.8, 'goal_clarity': 3.9,
+    'coordination': 4.5, 'tms': 4.0, 'team_cognition': 4.3})
+tcd_float = calculate_tcd_v4(**v5_team)['TCD']
+tcd_decimal = calculate_tcd_v4(**v5_team, precision='decimal')['TCD']
+tcd_mpmath = calculate_tcd_v4(**v5_team, precision='mpmath')['TCD']
+print(f"  Float:   TCD = ${tcd_float:,.10f}")
+print(f"  Decimal: TCD = ${tcd_decimal:,} (cent-exact)")
+print(f"  mpmath:  TCD = ${tcd_mpmath:,} (cent-exact)")
+print(f"  |float - cent-exact| = ${abs(Decimal(tcd_float) - tcd_decimal):.6f} "
+      f"{'✅ within one cent' if abs(Decimal(tcd_float) - tcd_decimal) <= Decimal('0.01') else '❌'}")
+print()
+
 # -----------------------------------------------------------------------------
 # FIX V6: Anti-Gaming - Driver Correlation Checks
 # -----------------------------------------------------------------------------
@@ -885,64 +906,29 @@ print("    δ₅ ∈ [0.08, 0.16] (95% CI)")
 print()
 
 print("THEOREM 15.1 (TCD Confidence Interval):")
-print("  TCD_95% = TCD_point × [0.75, 1.30]")
+print("  TCD_95% = [Q₀.₀₂₅, Q₉₇.₅] of TCD(δ₁, δ₂, τ, δ₄, δ₅)")
+print("  TCD is linear in the coefficients, so the interval is that of a weighted")
+print("  sum of independent uniforms; its relative width depends on the team")
 print()
 print("PROOF (Monte Carlo):")
-print("  1. Draw 10,000 samples from coefficient distributions")
+print("  1. Draw 100,000 samples from coefficient distributions")
 print("  2. Calculate TCD for each sample")
 print("  3. Compute 2.5th and 97.5th percentiles")
-print("  4. Result: [0.75 × TCD, 1.30 × TCD]")
-print()
-
-# Run Monte Carlo simulation
-print("MONTE CARLO VALIDATION:")
-np.random.seed(42)
-n_simulations = 10000
-
-# Coefficient distributions (uniform for simplicity)
-delta_1_samples = np.random.uniform(0.20, 0.30, n_simulations)
-delta_2_samples = np.random.uniform(0.05, 0.15, n_simulations)
-tau_samples = np.random.uniform(0.16, 0.26, n_simulations)
-delta_4_samples = np.random.uniform(0.10, 0.20, n_simulations)
-delta_5_samples = np.random.uniform(0.08, 0.16, n_simulations)
-
-# Fixed inputs for simulation
-P_sim = 1800000
-R_sim = 0.567
-Q_adj_sim = 0.458
-T_adj_sim = 0.393
-O_adj_sim = 0.467
-H_adj_sim = 0.483
-BV_sim = 3.0
-E_coef_sim = 0.09
-E_adj_sim = 0.342
-M_4C_sim = 1.190
-phi_sim = 1.20
-
-# Calculate TCD for each simulation
-tcd_samples = []
-for i in range(n_simulations):
-    c1 = P_sim * delta_1_samples[i] * (1 - R_sim)
-    c2 = P_sim * delta_2_samples[i] * Q_adj_sim
-    c3 = P_sim * tau_samples[i] * T_adj_sim
-    c4 = P_sim * delta_4_samples[i] * O_adj_sim * BV_sim
-    c5 = P_sim * delta_5_samples[i] * H_adj_sim
-    c6 = P_sim * E_coef_sim * E_adj_sim
-    subtotal = (c1 + c2 + c3 + c4 + c5 + c6) * 0.88  # With overlap discount
-    tcd = subtotal * M_4C_sim * phi_sim
-    tcd_samples.append(tcd)
-
-tcd_samples = np.array(tcd_samples)
-tcd_point = np.mean(tcd_samples)
-tcd_2_5 = np.percentile(tcd_samples, 2.5)
-tcd_97_5 = np.percentile(tcd_samples, 97.5)
-
-print(f"  Simulations: {n_simulations:,}")
+print("  4. Result: see the validation below (exact interval in Section 6)")
+print()
+
+# tcd_confidence_interval on the Section 6 team: every sample is the full
+# calculate_tcd_v4 formula (η and G included), so this is the Section 6
+# Monte Carlo interval
+print("MONTE CARLO VALIDATION (Section 6 team):")
+ci_v15 = tcd_confidence_interval(v5_team, n_samples=100000, seed=42)
+tcd_point = ci_v15['TCD']
+print(f"  Simulations: {ci_v15['n_samples']:,} (seed {ci_v15['seed']})")
 print(f"  Point estimate: ${tcd_point:,.0f}")
-print(f"  2.5th percentile: ${tcd_2_5:,.0f} ({tcd_2_5/tcd_point:.2f}x)")
-print(f"  97.5th percentile: ${tcd_97_5:,.0f} ({tcd_97_5/tcd_point:.2f}x)")
-print(f"  95% CI: [${tcd_2_5:,.0f}, ${tcd_97_5:,.0f}]")
-print(f"  Relative CI: [{tcd_2_5/tcd_point:.2f}, {tcd_97_5/tcd_point:.2f}]")
+print(f"  2.5th percentile: ${ci_v15['low']:,.0f} ({ci_v15['low']/tcd_point:.2f}x)")
+print(f"  97.5th percentile: ${ci_v15['high']:,.0f} ({ci_v15['high']/tcd_point:.2f}x)")
+print(f"  95% CI: [${ci_v15['low']:,.0f}, ${ci_v15['high']:,.0f}]")
+print(f"  Relative CI: [{ci_v15['low']/tcd_point:.2f}, {ci_v15['high']/tcd_point:.2f}]")
 print()
 
 # =============================================================================
@@ -1012,111 +998,6 @@ print("SECTION 5: PROPERTY-BASED TESTING (HYPOTHESIS)")
 print("=" * 100)
 print()
 
-# Implementation of the fixed formula for testing
-def clamp(x, a, b):
-    return max(a, min(x, b))
-
-def sigmoid_e_coef(E):
-    return 0.18 / (1 + np.exp(2 * (E - 4)))
-
-def team_size_factor(N):
-    if N < 5:
-        return 1.2
-    elif N <= 12:
-        return 1.0
-    else:
-        return 1 + 0.02 * (N - 12)
-
-def calculate_anomaly_score(drivers):
-    """Calculate anomaly score for gaming detection."""
-    correlations = [
-        ('trust', 'psych_safety', 1.5),
-        ('communication', 'coordination', 2.0),
-        ('goal_clarity', 'team_cognition', 2.5),
-    ]
-    total = 0
-    for d1, d2, tol in correlations:
-        diff = abs(drivers[d1] - drivers[d2])
-        total += max(0, diff - tol)
-    return total
-
-def gaming_penalty(anomaly_score):
-    return min(1.5, 1 + 0.1 * max(0, anomaly_score - 1.5))
-
-def calculate_tcd_v4(P, N, drivers, phi, rho, BV):
-    """Calculate TCD using v4.0 formula with all fixes."""
-    
-    # Input validation
-    if P <= 0:
-        raise ValueError("Payroll must be positive")
-    if N < 1:
-        raise ValueError("Team size must be at least 1")
-    
-    # Sanitize driver scores
-    d = {k: clamp(v, 1, 7) for k, v in drivers.items()}
-    
-    # Sanitize other inputs
-    phi = clamp(phi, 0.7, 1.4)
-    rho = clamp(rho, 0.8, 1.3)
-    BV = clamp(BV, 1, 10)
-    
-    # Calculate derived values
-    S_bar = P / N
-    
-    # Readiness score
-    avg_d = sum(d.values()) / 7
-    R = (avg_d - 1) / 6
-    
-    # Cost components
-    C1 = P * 0.25 * (1 - R)
-    
-    Q_adj = ((7 - d['communication']) + (7 - d['team_cognition'])) / 12
-    C2 = P * 0.10 * Q_adj
-    
-    T_adj = ((7 - d['trust']) + (7 - d['psych_safety'])) / 12 * rho
-    C3 = N * S_bar * 0.21 * T_adj
-    
-    O_adj = ((7 - d['coordination']) + (7 - d['goal_clarity'])) / 12
-    C4 = P * 0.15 * O_adj * BV
-    
-    H_adj = ((7 - d['tms']) + (7 - d['communication'])) / 12
-    C5 = P * 0.12 * H_adj
-    
-    # Continuous engagement coefficient
-    E = (d['trust'] + d['psych_safety']) / 2
-    E_coef = sigmoid_e_coef(E)
-    E_adj = (7 - E) / 6
-    C6 = P * E_coef * E_adj
-    
-    # Subtotal with overlap discount
-    subtotal = (C1 + C2 + C3 + C4 + C5 + C6) * 0.88
-    
-    # 4 C's multiplier
-    criteria = (d['team_cognition'] + d['goal_clarity'] + d['coordination']) / 3
-    commitment = (d['team_cognition'] + d['trust'] + d['goal_clarity']) / 3
-    collaboration = (d['tms'] + d['trust'] + d['psych_safety'] + d['coordination'] + d['communication']) / 5
-    change = (d['goal_clarity'] + d['coordination']) / 2
-    C_bar = (criteria + commitment + collaboration + change) / 4
-    M_4C = 1 + 0.5 * (1 - C_bar / 7)
-    
-    # Correction factors
-    eta = team_size_factor(N)
-    anomaly = calculate_anomaly_score(d)
-    G = gaming_penalty(anomaly)
-    
-    # Final TCD with ceiling cap (max 350% of payroll)
-    TCD_raw = subtotal * M_4C * phi * eta * G
-    TCD = min(TCD_raw, P * 3.5)  # Cap at 350% of payroll
-    
-    return {
-        'TCD': TCD,
-        'C1': C1, 'C2': C2, 'C3': C3, 'C4': C4, 'C5': C5, 'C6': C6,
-        'subtotal': subtotal,
-        'M_4C': M_4C, 'phi': phi, 'eta': eta, 'G': G,
-        'E': E, 'E_coef': E_coef,
-        'anomaly_score': anomaly
-    }
-
 # Property-based tests
 print("Running property-based tests with Hypothesis...")
 print()
@@ -1421,10 +1302,22 @@ print(f"  AS % OF PAYROLL:           {result['TCD']/1800000*100:>12.1f}%")
 print("  ═" * 35)
 print()
 
-# Confidence interval
-ci_low = result['TCD'] * 0.75
-ci_high = result['TCD'] * 1.30
-print(f"  95% CONFIDENCE INTERVAL: [${ci_low:,.0f}, ${ci_high:,.0f}]")
+# Confidence interval: exact from the sum-of-uniforms distribution over the
+# FIX V15 coefficient ranges, cross-checked against Monte Carlo sampling
+ci_exact = tcd_confidence_interval(
+    {'P': 1800000, 'N': 15, 'drivers': test_drivers, 'phi': 1.20, 'rho': 1.15, 'BV': 3.0},
+    n_samples=100000, seed=42, method='analytic', check_samples=100000
+)
+check = ci_exact['cross_check']
+print(f"  95% CONFIDENCE INTERVAL: [${ci_exact['low']:,.0f}, ${ci_exact['high']:,.0f}]")
+print(f"  (exact; relative [{ci_exact['low']/result['TCD']:.2f}, {ci_exact['high']/result['TCD']:.2f}])")
+ci = tcd_confidence_interval(
+    {'P': 1800000, 'N': 15, 'drivers': test_drivers, 'phi': 1.20, 'rho': 1.15, 'BV': 3.0},
+    n_samples=100000, seed=42
+)
+print(f"  Monte Carlo 95% CI:      [${ci['low']:,.0f}, ${ci['high']:,.0f}]")
+print(f"  ({ci['n_samples']:,} samples, seed 42; max relative difference from exact "
+      f"{check['max_rel_diff']:.2%} {'✅' if check['ok'] else '❌'})")
 print()
 
 print("=" * 100)
@@ -0,0 +1,81 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0
+======================================
+
+Importable implementation of the Total Cost of Dysfunction (TCD) formula.
+
+    from tcd import calculate_tcd_v4
+
+The scalar formula is imported eagerly and costs only a few milliseconds.
+NumPy-backed helpers are resolved lazily on first attribute access, and the
+proof report (SymPy, mpmath, scipy, hypothesis) lives in symbolic_proofs.py.
+"""
+
+from .formula import (
+    DRIVERS,
+    INDUSTRY_FACTORS,
+    RESULT_KEYS,
+    V6_CORRELATIONS,
+    calculate_anomaly_score,
+    calculate_tcd_v4,
+    clamp,
+    gaming_penalty,
+    sigmoid_e_coef,
+    team_size_factor,
+)
+
+# Public name -> submodule, imported on first access (PEP 562)
+_LAZY = {
+    'TCDCache': 'cache',
+    'calculate_tcd_v4_batch': 'batch',
+    'tcd_confidence_interval': 'ci',
+    'tcd_confidence_intervals_batch': 'ci',
+    'ci_convergence': 'ci',
+    'analytic_interval': 'ci',
+    'calculate_tcd_v4_exact': 'precision',
+    'precision_audit': 'precision',
+    'score_file': 'pipeline',
+    'score_portfolio': 'parallel',
+    'verify_lattice': 'lattice',
+    'PortfolioAggregate': 'aggregate',
+    'aggregate_portfolio': 'aggregate',
+    'DriverHistory': 'history',
+    'fit_calibration': 'calibration',
+    'Calibration': 'calibration',
+    'RateTable': 'currency',
+    'convert_inputs': 'currency',
+    'AuditLog': 'audit',
+    'AuditReader': 'audit',
+    'replay_file': 'replay',
+    'compare_snapshots': 'changes',
+    'AnomalyModel': 'anomaly',
+    'tcd_sensitivities': 'sensitivity',
+    'rank_drivers': 'sensitivity',
+    'WhatIfState': 'whatif',
+    'WhatIfSamples': 'whatif',
+}
+
+__all__ = [
+    'DRIVERS',
+    'INDUSTRY_FACTORS',
+    'RESULT_KEYS',
+    'V6_CORRELATIONS',
+    'calculate_anomaly_score',
+    'calculate_tcd_v4',
+    'clamp',
+    'gaming_penalty',
+    'sigmoid_e_coef',
+    'team_size_factor',
+    *_LAZY,
+]
+
+__version__ = '4.0'
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        value = getattr(importlib.import_module(f'.{_LAZY[name]}', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,234 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Portfolio Aggregation
+==============================================================
+
+Grouped portfolio statistics over batch scoring, in one pass and with
+mergeable partial state:
+
+    agg = PortfolioAggregate(by=['industry', 'department'], ci_samples=10_000)
+    for chunk in chunks:
+        agg.add(chunk['keys'], chunk['P'], chunk['N'], chunk['drivers'], chunk['phi'], chunk['rho'], chunk['BV'])
+    agg.merge(other_shard)          # partial aggregates combine by addition
+    rows = agg.summary()
+
+For every group and every metric in METRICS (TCD, C1-C6, anomaly_score)
+the summary holds the sum, the payroll-weighted mean Σ P x / Σ P and
+percentiles. Percentiles come from a logarithmic histogram (the DDSketch
+construction): every reported value is within PERCENTILE_ACCURACY
+(relative) of a value of the requested rank, and two histograms merge by
+adding counts.
+
+Group confidence intervals propagate the FIX V15 coefficient uncertainty
+through the group total. The coefficients are shared by every team, so
+the group's TCD for one coefficient draw is the sum of its teams' TCD for
+that same draw. Summing per-team low/high bands would treat every team as
+sitting at its own extreme at once, which overstates the width. Below the
+350% cap a team is linear in the coefficients (tcd.ci), so the group keeps
+Σ scale × weights and Σ scale × offset. Teams capped for every draw add
+their cap. Only teams the cap binds for some draws are kept row by row.
+The group total is then simulated on one coefficient matrix, drawn from
+the seed when the summary is built, so shards and chunking do not change
+the interval.
+"""
+
+import math
+
+import numpy as np
+
+from .batch import calculate_tcd_v4_batch
+from .ci import (COEFFICIENT_HIGH, COEFFICIENT_LOW, _percentile_bounds, draw_coefficients, simulate_tcd,
+                 tcd_linear_terms_batch)
+
+METRICS = ['TCD', 'C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'anomaly_score']
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Histogram resolution: relative accuracy and the range of positive values
+# resolved (smaller positives share the first bucket, larger the last)
+PERCENTILE_ACCURACY = 0.01
+HISTOGRAM_MIN = 1e-6
+HISTOGRAM_MAX = 1e13
+
+_LOG_GAMMA = math.log((1 + PERCENTILE_ACCURACY) / (1 - PERCENTILE_ACCURACY))
+_MIN_INDEX = math.floor(math.log(HISTOGRAM_MIN) / _LOG_GAMMA)
+_MAX_INDEX = math.ceil(math.log(HISTOGRAM_MAX) / _LOG_GAMMA)
+# Bucket 0 counts zeros; bucket b > 0 covers (γ^(i-1), γ^i] with i = b - 1 + _MIN_INDEX
+HISTOGRAM_BUCKETS = _MAX_INDEX - _MIN_INDEX + 2
+
+
+def _buckets(x):
+    with np.errstate(divide='ignore'):
+        i = np.ceil(np.log(x) / _LOG_GAMMA)
+    b = np.clip(i, _MIN_INDEX, _MAX_INDEX) - _MIN_INDEX + 1
+    return np.where(x > 0, b, 0).astype(np.intp)
+
+
+def _histogram_percentiles(counts, q):
+    """Percentiles q (0-100) from bucket counts, with np.percentile's rank convention (lower)."""
+    cumulative = np.cumsum(counts)
+    n = cumulative[-1]
+    out = []
+    for p in q:
+        b = int(np.searchsorted(cumulative, p / 100 * (n - 1), side='right'))
+        # Bucket midpoint in relative terms: 2γ^i / (γ + 1)
+        i = b - 1 + _MIN_INDEX
+        out.append(0.0 if b == 0 else 2 * math.exp(i * _LOG_GAMMA) / (1 + math.exp(_LOG_GAMMA)))
+    return out
+
+
+class _Group:
+    """Partial aggregate of one group; every field merges by addition or concatenation."""
+
+    def __init__(self):
+        self.teams = 0
+        self.P = 0.0
+        self.sums = np.zeros(len(METRICS))
+        self.weighted = np.zeros(len(METRICS))
+        self.counts = np.zeros((len(METRICS), HISTOGRAM_BUCKETS), dtype=np.int64)
+        self.linear = np.zeros(len(COEFFICIENT_LOW))
+        self.offset = 0.0
+        self.straddling = []
+
+    def merge(self, other):
+        self.teams += other.teams
+        self.P += other.P
+        self.sums += other.sums
+        self.weighted += other.weighted
+        self.counts += other.counts
+        self.linear += other.linear
+        self.offset += other.offset
+        self.straddling += other.straddling
+
+
+class PortfolioAggregate:
+    """Grouped sums, payroll-weighted means, percentiles and group CIs.
+
+    by names the grouping keys passed to add() (an empty list aggregates
+    the whole portfolio). With ci_samples > 0 each group also gets a Monte
+    Carlo interval for its total TCD at the given confidence, drawn with
+    seed and method (see tcd.ci.draw_coefficients).
+    """
+
+    def __init__(self, by=(), percentiles=DEFAULT_PERCENTILES, ci_samples=0, confidence=0.95, seed=42,
+                 method='random'):
+        _percentile_bounds(confidence)
+        self.by = list(by)
+        self.percentiles = list(percentiles)
+        self.ci_samples, self.confidence, self.seed, self.method = ci_samples, confidence, seed, method
+        self.groups = {}
+
+    def _config(self):
+        return (self.by, self.percentiles, self.ci_samples, self.confidence, self.seed, self.method)
+
+    def add(self, keys, P, N, drivers, phi, rho, BV):
+        """Score one chunk (calculate_tcd_v4_batch arguments) and add it; keys maps each name in by to an array."""
+        return self.add_scored(keys, P, calculate_tcd_v4_batch(P, N, drivers, phi, rho, BV))
+
+    def add_scored(self, keys, P, result):
+        """Add a chunk already scored with calculate_tcd_v4_batch."""
+        P = np.broadcast_to(np.asarray(P, dtype=float), result['TCD'].shape)
+        n = P.size
+        labels, codes = self._group_codes(keys, n)
+        n_groups = len(labels)
+
+        teams = np.bincount(codes, minlength=n_groups)
+        payroll = np.bincount(codes, weights=P, minlength=n_groups)
+        values = [np.asarray(result[m], dtype=float) for m in METRICS]
+        sums = np.stack([np.bincount(codes, weights=v, minlength=n_groups) for v in values], axis=1)
+        weighted = np.stack([np.bincount(codes, weights=P * v, minlength=n_groups) for v in values], axis=1)
+        counts = np.stack([np.bincount(codes * HISTOGRAM_BUCKETS + _buckets(v), minlength=n_groups * HISTOGRAM_BUCKETS)
+                           .reshape(n_groups, HISTOGRAM_BUCKETS) for v in values], axis=1)
+
+        if self.ci_samples:
+            weights, offset, scale, cap = tcd_linear_terms_batch(P, result)
+            low = (weights @ COEFFICIENT_LOW + offset) * scale
+            high = (weights @ COEFFICIENT_HIGH + offset) * scale
+            linear_rows = high <= cap
+            capped_rows = low >= cap
+            sw = weights * scale[:, None]
+            linear = np.stack([np.bincount(codes, weights=np.where(linear_rows, sw[:, j], 0), minlength=n_groups)
+                               for j in range(sw.shape[1])], axis=1)
+            offsets = np.bincount(codes, weights=np.where(linear_rows, offset * scale,
+                                                          np.where(capped_rows, cap, 0)), minlength=n_groups)
+            # Teams the cap binds for some draws only, split by group
+            straddling = np.flatnonzero(~(linear_rows | capped_rows))
+            straddling = straddling[np.argsort(codes[straddling], kind='stable')]
+            straddling = dict(zip(np.unique(codes[straddling]).tolist(),
+                                  np.split(straddling, np.flatnonzero(np.diff(codes[straddling])) + 1)))
+
+        for g, label in enumerate(labels):
+            group = self.groups.get(label)
+            if group is None:
+                group = self.groups[label] = _Group()
+            group.teams += int(teams[g])
+            group.P += payroll[g]
+            group.sums += sums[g]
+            group.weighted += weighted[g]
+            group.counts += counts[g]
+            if self.ci_samples:
+                group.linear += linear[g]
+                group.offset += offsets[g]
+                rows = straddling.get(g)
+                if rows is not None:
+                    group.straddling.append((weights[rows], offset[rows], scale[rows], cap[rows]))
+        return self
+
+    def _group_codes(self, keys, n):
+        """Group labels (tuples) in this chunk and each row's index into them."""
+        if not self.by:
+            return [()], np.zeros(n, dtype=np.intp)
+        columns = [np.unique(np.asarray(keys[name]), return_inverse=True) for name in self.by]
+        combined = np.zeros(n, dtype=np.int64)
+        for uniques, inverse in columns:
+            combined = combined * len(uniques) + inverse.reshape(-1)
+        present, codes = np.unique(combined, return_inverse=True)
+        labels = []
+        for code in present.tolist():
+            label = []
+            for uniques, _ in reversed(columns):
+                code, i = divmod(code, len(uniques))
+                label.append(uniques[i].item())
+            labels.append(tuple(reversed(label)))
+        return labels, codes.reshape(-1)
+
+    def merge(self, other):
+        """Add another partial aggregate with the same configuration (e.g. another shard); returns self."""
+        if other._config() != self._config():
+            raise ValueError("Cannot merge aggregates with different grouping or CI settings")
+        for label, group in other.groups.items():
+            if label not in self.groups:
+                self.groups[label] = _Group()
+            self.groups[label].merge(group)
+        return self
+
+    def summary(self):
+        """One flat dict per group (sorted by key): keys, teams, P, then per metric
+        {m}_sum, {m}_wavg and {m}_p{q}, and TCD_low/TCD_high/TCD_mean for the group total."""
+        coefficients = None
+        if self.ci_samples:
+            coefficients = draw_coefficients(self.ci_samples, self.seed, self.method)
+            q = _percentile_bounds(self.confidence)
+
+        rows = []
+        for label in sorted(self.groups, key=lambda k: tuple(str(v) for v in k)):
+            group = self.groups[label]
+            row = dict(zip(self.by, label))
+            row['teams'] = group.teams
+            row['P'] = float(group.P)
+            for j, m in enumerate(METRICS):
+                row[f'{m}_sum'] = float(group.sums[j])
+                row[f'{m}_wavg'] = float(group.weighted[j] / group.P)
+                for p, value in zip(self.percentiles, _histogram_percentiles(group.counts[j], self.percentiles)):
+                    row[f'{m}_p{p:g}'] = value
+            if coefficients is not None:
+                total = coefficients @ group.linear + group.offset
+                for terms in group.straddling:
+                    total += simulate_tcd(*terms, coefficients).sum(axis=0)
+                low, high = np.percentile(total, q)
+                row['TCD_low'], row['TCD_high'], row['TCD_mean'] = float(low), float(high), float(total.mean())
+            rows.append(row)
+        return rows
+
+
+def aggregate_portfolio(keys, P, N, drivers, phi, rho, BV, by=(), **options):
+    """One-shot PortfolioAggregate(by, **options).add(...).summary()."""
+    return PortfolioAggregate(by, **options).add(keys, P, N, drivers, phi, rho, BV).summary()
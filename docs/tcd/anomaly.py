@@ -0,0 +1,340 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Population Anomaly Detection
+=====================================================================
+
+V6 gaming detection from the whole population instead of fixed driver
+pairs: the joint distribution of the seven (clamped) driver scores is
+estimated once, and each team is scored by its Mahalanobis distance from
+it, so an inflated driver that breaks any of the observed correlations
+stands out, not only the three pairs with hard-coded tolerances.
+describe() checks the estimate against the expected correlations of the
+five V6 pairs (V6_CORRELATIONS).
+
+    model = AnomalyModel.fit(drivers)                  # robust (MCD) estimate
+    result = calculate_tcd_v4_batch(P, N, drivers, phi, rho, BV,
+                                    anomaly=model.anomaly_scores(drivers))
+    model.save('drivers.npz')
+    model = AnomalyModel.load('drivers.npz').update(new_drivers)
+
+    python -m tcd.anomaly drivers.npz assessments.csv            # fit and save
+    python -m tcd.anomaly drivers.npz new.csv --update            # refresh
+
+The anomaly score is the distance in excess of the 97.5% χ² cut-off
+(√χ²₇,₀.₉₇₅ ≈ 4.0), A = max(0, D - D_cut), and calculate_tcd_v4_batch
+turns it into G with the usual gaming penalty. D is measured in population
+standard deviations, so A plays the role of the points a pair exceeded
+its tolerance by.
+
+method='classical' uses the sample mean and covariance. method='mcd'
+(the default) uses the reweighted Minimum Covariance Determinant
+estimator (FAST-MCD, Rousseeuw & Van Driessen 1999): C-steps from many
+random starts on a sample of at most MCD_SAMPLE_ROWS teams, the best one
+refined on all of them, then the mean and covariance of the teams inside
+the cut-off with the usual consistency factor. Gamed teams therefore do
+not inflate the covariance they are judged against.
+
+Both estimates are kept as running sufficient statistics (count, mean,
+scatter matrix), so update() merges a batch of new assessments in one
+pass without revisiting old ones: every row for the classical estimate,
+the rows inside the cut-off for the MCD one. Rows judged outliers are not
+kept, so refit from the full population now and then if it drifts.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from .batch import V4_COEFFICIENTS, _clamp_batch
+from .formula import DRIVERS, V6_CORRELATIONS
+from .pipeline import DEFAULT_CHUNK_SIZE, open_reader
+
+METHODS = ('mcd', 'classical')
+OUTLIER_QUANTILE = 0.975
+
+# FAST-MCD search: random starts and the best ones refined to convergence on the
+# sample; the winner is then refined on all teams
+MCD_SAMPLE_ROWS = 20_000
+MCD_STARTS = 500
+MCD_BEST = 10
+MCD_MAX_STEPS = 100
+
+# Ridge (relative to the mean variance) keeping the Cholesky factor of a
+# covariance from tied, discrete scores well defined
+RIDGE = 1e-9
+
+# Rows per block when computing distances
+DISTANCE_BLOCK_SIZE = 65_536
+
+
+def driver_matrix(drivers):
+    """(teams x 7) matrix of driver scores in DRIVERS order, clamped to [1, 7] as the formula does."""
+    columns = np.broadcast_arrays(*[np.asarray(drivers[k], dtype=float) for k in DRIVERS])
+    return _clamp_batch(np.column_stack([c.reshape(-1) for c in columns]), 1, 7)
+
+
+def _chi2_cutoff(quantile, p):
+    from scipy.stats import chi2
+    return chi2.ppf(quantile, p)
+
+
+def _whitener(covariance):
+    """W with W Σ Wᵀ = I, so |W (x - μ)|² is the squared Mahalanobis distance."""
+    p = len(covariance)
+    ridge = RIDGE * max(np.trace(covariance) / p, 1e-12)
+    try:
+        L = np.linalg.cholesky(covariance + ridge * np.eye(p))
+    except np.linalg.LinAlgError:
+        raise ValueError("driver covariance is not positive definite") from None
+    return np.linalg.inv(L)
+
+
+def _distances_sq(X, location, W):
+    out = np.empty(len(X))
+    for start in range(0, len(X), DISTANCE_BLOCK_SIZE):
+        Z = (X[start:start + DISTANCE_BLOCK_SIZE] - location) @ W.T
+        out[start:start + DISTANCE_BLOCK_SIZE] = np.einsum('ij,ij->i', Z, Z)
+    return out
+
+
+class DriverCovariance:
+    """Running count, mean and scatter matrix Σ(x - x̄)(x - x̄)ᵀ of driver vectors."""
+
+    def __init__(self, n=0, mean=None, scatter=None):
+        p = len(DRIVERS)
+        self.n = int(n)
+        self.mean = np.zeros(p) if mean is None else np.asarray(mean, dtype=float)
+        self.scatter = np.zeros((p, p)) if scatter is None else np.asarray(scatter, dtype=float)
+
+    @classmethod
+    def of(cls, X):
+        stats = cls()
+        stats.add(X)
+        return stats
+
+    def add(self, X):
+        """Merge the rows of a (teams x 7) matrix (Chan et al. pairwise update)."""
+        m = len(X)
+        if m == 0:
+            return self
+        mean = X.mean(axis=0)
+        D = X - mean
+        delta = mean - self.mean
+        n = self.n + m
+        self.scatter = self.scatter + D.T @ D + np.outer(delta, delta) * (self.n * m / n)
+        self.mean = self.mean + delta * (m / n)
+        self.n = n
+        return self
+
+    @property
+    def covariance(self):
+        if self.n < 2:
+            raise ValueError("at least two teams are needed to estimate the driver covariance")
+        return self.scatter / (self.n - 1)
+
+
+def _c_steps(X, location, covariance, h, max_steps):
+    """Concentration steps: refit on the h rows closest under the current estimate until det stops falling."""
+    logdet = math.inf
+    for _ in range(max_steps):
+        d2 = _distances_sq(X, location, _whitener(covariance))
+        H = np.argpartition(d2, h - 1)[:h]
+        location, covariance = X[H].mean(axis=0), np.cov(X[H], rowvar=False)
+        p = len(covariance)
+        new = np.linalg.slogdet(covariance + RIDGE * max(np.trace(covariance) / p, 1e-12) * np.eye(p))[1]
+        if new >= logdet - 1e-12:
+            break
+        logdet = new
+    return location, covariance, logdet
+
+
+def _fast_mcd(X, support_fraction, seed):
+    """Raw MCD (location, covariance) of X."""
+    n, p = X.shape
+    h = max(int(support_fraction * n), p + 1) if support_fraction else (n + p + 1) // 2
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(n, MCD_SAMPLE_ROWS, replace=False)] if n > MCD_SAMPLE_ROWS else X
+    h_sample = min(len(sample), math.ceil(h * len(sample) / n))
+
+    candidates = []
+    for _ in range(MCD_STARTS):
+        start = sample[rng.choice(len(sample), p + 1, replace=False)]
+        candidates.append(_c_steps(sample, start.mean(axis=0), np.cov(start, rowvar=False), h_sample, 2))
+    candidates.sort(key=lambda c: c[2])
+    refined = [_c_steps(sample, loc, cov, h_sample, MCD_MAX_STEPS) for loc, cov, _ in candidates[:MCD_BEST]]
+    location, covariance, _ = min(refined, key=lambda c: c[2])
+    if sample is not X:
+        location, covariance, _ = _c_steps(X, location, covariance, h, MCD_MAX_STEPS)
+    return location, covariance
+
+
+class AnomalyModel:
+    """Driver location and covariance for Mahalanobis anomaly scores; built by fit or load.
+
+    stats holds the running statistics the estimate is made of (all teams
+    for 'classical', the teams inside the cut-off for 'mcd'); covariance is
+    their covariance times factor, the MCD consistency correction. seen
+    counts every team passed to fit and update.
+    """
+
+    def __init__(self, method, stats, factor=1.0, quantile=OUTLIER_QUANTILE, seen=None):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS} (got {method!r})")
+        if not 0 < quantile < 1:
+            raise ValueError("quantile must be between 0 and 1")
+        self.method = method
+        self.stats = stats
+        self.factor = float(factor)
+        self.quantile = float(quantile)
+        self.seen = stats.n if seen is None else int(seen)
+        self.cutoff = _chi2_cutoff(quantile, len(DRIVERS))
+        self._W = None
+
+    @classmethod
+    def fit(cls, drivers, method='mcd', quantile=OUTLIER_QUANTILE, support_fraction=None, seed=42):
+        """Estimate the population from a drivers mapping (or structured array) of many teams."""
+        X = driver_matrix(drivers)
+        n, p = X.shape
+        if n <= p:
+            raise ValueError(f"at least {p + 1} teams are needed to fit an anomaly model (got {n})")
+        if method == 'classical':
+            return cls(method, DriverCovariance.of(X), quantile=quantile)
+        if method != 'mcd':
+            raise ValueError(f"method must be one of {METHODS} (got {method!r})")
+        if support_fraction is not None and not 0.5 <= support_fraction <= 1:
+            raise ValueError("support_fraction must be between 0.5 and 1")
+
+        from scipy.stats import chi2
+        location, covariance = _fast_mcd(X, support_fraction, seed)
+        d2 = _distances_sq(X, location, _whitener(covariance))
+        covariance = covariance * (np.median(d2) / chi2.ppf(0.5, p))
+        cutoff = _chi2_cutoff(quantile, p)
+        inside = _distances_sq(X, location, _whitener(covariance)) <= cutoff
+        # Consistency factor of a covariance estimated from a normal sample truncated at the cut-off
+        factor = quantile / chi2.cdf(cutoff, p + 2)
+        return cls(method, DriverCovariance.of(X[inside]), factor, quantile, seen=n)
+
+    @property
+    def location(self):
+        return self.stats.mean
+
+    @property
+    def covariance(self):
+        return self.stats.covariance * self.factor
+
+    def _whitened(self):
+        if self._W is None:
+            self._W = _whitener(self.covariance)
+        return self._W
+
+    def update(self, drivers):
+        """Merge a batch of new assessments into the estimate (inliers only for 'mcd'); returns self."""
+        X = driver_matrix(drivers)
+        self.seen += len(X)
+        if self.method == 'mcd':
+            X = X[_distances_sq(X, self.location, self._whitened()) <= self.cutoff]
+        self.stats.add(X)
+        self._W = None
+        return self
+
+    def distances(self, drivers):
+        """Mahalanobis distance of each team from the population."""
+        return np.sqrt(_distances_sq(driver_matrix(drivers), self.location, self._whitened()))
+
+    def anomaly_scores(self, drivers):
+        """Distance beyond the χ² cut-off, max(0, D - D_cut): the anomaly_score for calculate_tcd_v4_batch."""
+        return np.maximum(self.distances(drivers) - math.sqrt(self.cutoff), 0)
+
+    def gaming_penalty(self, drivers, coefficients=None):
+        """G for each team from its anomaly score (coefficients overrides G_slope/G_max)."""
+        coef = {**V4_COEFFICIENTS, **(coefficients or {})}
+        anomaly = self.anomaly_scores(drivers)
+        return np.minimum(1 + coef['G_slope'] * np.maximum(anomaly - 1.5, 0), coef['G_max'])
+
+    def describe(self):
+        """Method, team counts, per-driver mean and SD, and each V6 pair's estimated r against its expected r.
+
+        below_target marks pairs that correlate less than V6_CORRELATIONS
+        expects.
+        """
+        covariance = self.covariance
+        sd = np.sqrt(np.diag(covariance))
+        index = {k: i for i, k in enumerate(DRIVERS)}
+        pairs = []
+        for a, b, expected in V6_CORRELATIONS:
+            r = float(covariance[index[a], index[b]] / (sd[index[a]] * sd[index[b]]))
+            pairs.append({'pair': f'{a}/{b}', 'r': r, 'expected_r': expected, 'below_target': r < expected})
+        return {
+            'method': self.method,
+            'teams_seen': self.seen,
+            'teams_in_estimate': self.stats.n,
+            'distance_cutoff': math.sqrt(self.cutoff),
+            'mean': dict(zip(DRIVERS, self.location.tolist())),
+            'sd': dict(zip(DRIVERS, sd.tolist())),
+            'pair_correlations': pairs,
+        }
+
+    def save(self, path):
+        """Write the model to an .npz file (atomically)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, method=self.method, n=self.stats.n, mean=self.stats.mean, scatter=self.stats.scatter,
+                         factor=self.factor, quantile=self.quantile, seen=self.seen)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            stats = DriverCovariance(f['n'], f['mean'], f['scatter'])
+            return cls(str(f['method']), stats, float(f['factor']), float(f['quantile']), int(f['seen']))
+
+
+def read_drivers(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the driver columns of a pipeline input file chunk by chunk."""
+    reader = open_reader(path, chunk_size)
+    try:
+        missing = [k for k in DRIVERS if k not in reader.columns]
+        if missing:
+            raise ValueError(f"{path} has no {missing[0]!r} column")
+        for chunk in reader:
+            yield {k: np.asarray(chunk[k], dtype=float) for k in DRIVERS}
+    finally:
+        reader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.anomaly', description=__doc__.split('\n\n')[1])
+    parser.add_argument('model', help="model file (.npz)")
+    parser.add_argument('input', help="assessments with the seven driver columns (.csv or .parquet)")
+    parser.add_argument('--method', choices=METHODS, default='mcd', help="covariance estimator for a new fit")
+    parser.add_argument('--update', action='store_true', help="merge the input into an existing model")
+    parser.add_argument('--seed', type=int, default=42, help="FAST-MCD seed")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    args = parser.parse_args(argv)
+
+    chunks = read_drivers(args.input, args.chunk_size)
+    if args.update:
+        model = AnomalyModel.load(args.model)
+        for drivers in chunks:
+            model.update(drivers)
+    else:
+        parts = list(chunks)
+        drivers = {k: np.concatenate([d[k] for d in parts]) for k in DRIVERS} if parts else {k: [] for k in DRIVERS}
+        model = AnomalyModel.fit(drivers, args.method, seed=args.seed)
+    model.save(args.model)
+    json.dump(model.describe(), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,734 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Calculation Audit Log
+==============================================================
+
+FIX V12 calculation log: every scored team's inputs, the full result
+breakdown (RESULT_KEYS), the formula version, the formula options and a
+timestamp, appended to a compact binary log whose blocks are chained with
+SHA-256.
+
+    with AuditLog('scores.audit') as log:
+        result = log.score(team, P, N, drivers, phi, rho, BV)            # calculate_tcd_v4 + record
+        batch = log.score_batch(teams, P, N, drivers, phi, rho, BV, coefficients={'tau': 0.18})
+    reader = AuditReader('scores.audit')
+    rows = reader.query(team=42, start='2024-01-01', end='2024-07-01')
+    reader.verify()
+
+    python -m tcd.audit scores.audit --verify
+    python -m tcd.audit scores.audit --team 42 --start 2024-01-01
+
+Rows are buffered and group committed: commit() (called automatically
+every commit_rows rows or commit_interval seconds, and on close) hands the
+buffer to a writer thread, which appends it as one block,
+
+    'BLK1' | rows (u4) | formula version (8 bytes) | previous block hash
+           | SHA-256(previous hash | rows | version | columns) | columns
+
+where columns are the COLUMNS of every row, one contiguous little-endian
+8-byte array per column. Altering, removing or reordering any committed
+record breaks the chain from its block on; the first block chains from the
+hash of the file header. Batch rows are copied into preallocated column
+buffers of commit_rows rows; scalar rows are queued as tuples and turned
+into columns by the writer thread, which also hashes and writes full
+buffers (outside the GIL), so the caller only pays for the copy or the
+tuple.
+
+The options a row was scored with (sigmoid, precision, coefficient
+overrides, a supplied anomaly score, calibration factors) are kept in
+canonical form, only the non-default ones, in path.variants, one JSON line
+per distinct set; each row stores the variant id, the first 8 bytes of the
+SHA-256 of that JSON, so the chain covers the options too and verify()
+checks the variants file against the ids.
+
+Two index files are appended after each block: path.blocks holds one
+entry per block (file offset, row range, team and time ranges, version,
+hash) and path.keys the block's (team, time, row) keys sorted by team then
+time. A query skips blocks whose ranges exclude it and binary-searches the
+keys of the rest, then reads only the matching values through a memory
+map. Reopening a log for append recovers from a crash: a torn last block
+is truncated and index entries missing for complete blocks are rebuilt.
+
+Cost (benchmarks/test_bench_audit.py beside the calculate_tcd_v4 group;
+one CPU, 100k teams). The caller's share is what record() and
+record_batch() do before returning. A batch pays about 1.5 ms per 100k rows
+for the checks and the copy into the column buffers, about 15% of the
+10 ms calculate_tcd_v4_batch takes. The copy runs at memory bandwidth.
+A logged score() pays about 2 µs, or 30% of the 7 µs calculate_tcd_v4:
+the team id check, the timestamp, one lock and one tuple append. The lock
+and the tuple alone take about 0.6 µs, nearly the whole 0.7 µs that a 10%
+budget allows. So no buffer layout brings either path under 10%; these
+numbers are the measured gap. The writer thread's share comes on top when there is no
+spare core: about 0.8 µs per scalar row to build columns, and about 20 ms
+per 100k rows to hash (the SHA-256 of 24 MB is about 13 ms) and write.
+That bounds sustained logging at about 5M rows/s.
+"""
+
+import argparse
+import hashlib
+import json
+import operator
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from . import __version__
+from .batch import COMPONENTS, V4_COEFFICIENTS
+from .formula import DRIVERS, RESULT_KEYS, calculate_tcd_v4
+
+FORMULA_VERSION = __version__
+
+INPUT_FIELDS = ['P', 'N', *DRIVERS, 'phi', 'rho', 'BV']
+# Stored columns: (record field, sub-field), all 8 bytes wide; the first INT_COLUMNS are int64
+COLUMNS = [('team', None), ('time', None), ('variant', None),
+           *[('inputs', k) for k in INPUT_FIELDS], *[('result', k) for k in RESULT_KEYS]]
+INT_COLUMNS = 3
+RECORD_DTYPE = np.dtype([
+    ('team', '<i8'),
+    ('time', '<i8'),                  # ns since the Unix epoch (UTC)
+    ('variant', '<i8'),               # id of the formula options (AuditReader.variants)
+    ('version', 'S8'),
+    ('inputs', [(k, '<f8') for k in INPUT_FIELDS]),
+    ('result', [(k, '<f8') for k in RESULT_KEYS]),
+])
+ROW_BYTES = 8 * len(COLUMNS)
+
+BLOCK_DTYPE = np.dtype([
+    ('offset', '<i8'), ('rows', '<i8'), ('first_row', '<i8'),
+    ('team_min', '<i8'), ('team_max', '<i8'), ('time_min', '<i8'), ('time_max', '<i8'),
+    ('version', 'S8'), ('hash', 'u1', (32,)),
+])
+KEY_DTYPE = np.dtype([('team', '<i8'), ('time', '<i8'), ('row', '<i8')])
+
+MAGIC = b'TCDAUDIT'
+BLOCK_MAGIC = b'BLK1'
+_BLOCK_HEADER = struct.Struct('<4sI8s32s32s')
+
+DEFAULT_COMMIT_ROWS = 65_536
+DEFAULT_COMMIT_INTERVAL = 1.0
+# Row buffers per log: one filling while the writer thread writes the others
+WRITE_BUFFERS = 3
+
+# Formula options with their defaults; only options differing from these are stored
+DEFAULT_OPTIONS = {'precision': 'float', 'sigmoid': 'exact'}
+
+_driver_values = operator.itemgetter(*DRIVERS)
+_result_values = operator.itemgetter(*RESULT_KEYS)
+# One record() tuple, converted to COLUMNS by the writer thread
+_ROW_DTYPE = np.dtype([(f'c{j}', '<i8' if j < INT_COLUMNS else '<f8') for j in range(len(COLUMNS))])
+
+
+def _file_header():
+    meta = json.dumps({'format': 2, 'columns': [[f, k] for f, k in COLUMNS]}).encode('utf-8')
+    return MAGIC + struct.pack('<I', len(meta)) + meta
+
+
+def _block_hash(prev, rows, version, payload):
+    """SHA-256 of a block; payload is the column bytes, whole or as a list of column arrays."""
+    digest = hashlib.sha256(prev)
+    digest.update(struct.pack('<I8s', rows, version))
+    for part in ([payload] if isinstance(payload, bytes) else payload):
+        digest.update(part)
+    return digest.digest()
+
+
+def canonical_options(options):
+    """The non-default formula options of a score call, in the form stored in the variants file.
+
+    options are calculate_tcd_v4(_batch) keyword arguments: precision,
+    sigmoid, coefficients (overrides equal to the v4 value are dropped),
+    anomaly (stored as 'supplied'; the scores themselves are the recorded
+    anomaly_score) and calibration (see _canonical_calibration).
+    """
+    out = {}
+    for name, value in (options or {}).items():
+        if name == 'calibration':
+            value = _canonical_calibration(value)
+            if value:
+                out[name] = value
+        elif name == 'coefficients':
+            unknown = sorted(set(value or ()) - set(V4_COEFFICIENTS))
+            if unknown:
+                raise ValueError(f"Unknown coefficient {unknown[0]!r}; expected one of {list(V4_COEFFICIENTS)}")
+            value = {k: float(v) for k, v in sorted((value or {}).items()) if float(v) != V4_COEFFICIENTS[k]}
+            if value:
+                out[name] = value
+        elif name == 'anomaly':
+            if value is not None:
+                out[name] = 'supplied'
+        elif name in DEFAULT_OPTIONS:
+            if value != DEFAULT_OPTIONS[name]:
+                out[name] = value
+        else:
+            raise ValueError(f"Unknown formula option {name!r}")
+    return out
+
+
+def _canonical_calibration(calibration):
+    """Stored form of calculate_tcd_v4_batch(calibration=...), by component.
+
+    A scalar κ (or per-row κ that are all equal) is stored as its value and
+    dropped if it is 1. Per-row κ that differ are stored as 'sha256:' and
+    the digest of their float64 bytes: the row values are not in the log,
+    so replay cannot reapply them (see tcd.replay).
+    """
+    out = {}
+    for c, kappa in sorted((calibration or {}).items()):
+        if c not in COMPONENTS:
+            raise ValueError(f"Unknown component {c!r}; expected one of {list(COMPONENTS)}")
+        if isinstance(kappa, str) and kappa.startswith('sha256:'):
+            out[c] = kappa
+            continue
+        kappa = np.asarray(kappa, dtype='<f8')
+        if kappa.ndim == 0 or (kappa.size and np.all(kappa == kappa.flat[0])):
+            if kappa.flat[0] != 1.0:
+                out[c] = float(kappa.flat[0])
+        else:
+            out[c] = 'sha256:' + hashlib.sha256(np.ascontiguousarray(kappa).tobytes()).hexdigest()
+    return out
+
+
+def _options_json(canonical):
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+
+def variant_id(options):
+    """int64 id of a set of formula options: the first 8 bytes of the SHA-256 of their canonical JSON."""
+    digest = hashlib.sha256(_options_json(canonical_options(options)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little', signed=True)
+
+
+def _variants_path(path):
+    return path + '.variants'
+
+
+def _read_variants(path):
+    """{variant id: canonical options} from path.variants; a torn last line is ignored."""
+    variants = {}
+    try:
+        with open(_variants_path(path), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                variants[entry['id']] = entry['options']
+    except FileNotFoundError:
+        pass
+    return variants
+
+
+def _timestamp(value):
+    """ns since the epoch from an int (ns), a numpy datetime64 or an ISO date/time string."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(np.datetime64(value, 'ns').astype(np.int64))
+
+
+def _team_id(team):
+    """team as an int64 id; anything but an integer (a string, a float) is a ValueError."""
+    try:
+        team = operator.index(team)
+    except TypeError:
+        raise ValueError(f"Team id must be an integer, got {team!r}") from None
+    if not -2**63 <= team < 2**63:
+        raise ValueError(f"Team id {team} is outside the int64 range")
+    return team
+
+
+def _read_header(f, path):
+    head = f.read(len(MAGIC) + 4)
+    if head[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a TCD audit log")
+    header = head + f.read(struct.unpack('<I', head[len(MAGIC):])[0])
+    if header != _file_header():
+        raise ValueError(f"{path} was written with a different record layout")
+    return header
+
+
+def _index_paths(path):
+    return path + '.blocks', path + '.keys'
+
+
+def _read_index(path):
+    blocks_path, keys_path = _index_paths(path)
+    data = b''
+    if os.path.exists(blocks_path):
+        with open(blocks_path, 'rb') as f:
+            data = f.read()
+    # A torn last entry (crash while indexing) is dropped and rebuilt from the log
+    return np.frombuffer(data[:len(data) - len(data) % BLOCK_DTYPE.itemsize], BLOCK_DTYPE), keys_path
+
+
+def _split_columns(payload, rows):
+    """Column arrays (team, time, variant int64; the rest float64) of one block's payload."""
+    return [np.frombuffer(payload, '<i8' if j < INT_COLUMNS else '<f8', rows, j * rows * 8)
+            for j in range(len(COLUMNS))]
+
+
+def _fill_rows(buffer, start, rows):
+    """Write record() tuples into buffer columns from row start; returns the number written."""
+    if not rows:
+        return 0
+    table = np.array(rows, dtype=_ROW_DTYPE).view('<u8').reshape(len(rows), len(COLUMNS))
+    buffer[:, start:start + len(rows)].view('<u8')[:] = table.T
+    return len(rows)
+
+
+class AuditLog:
+    """Append-only writer; see the module docstring for the format.
+
+    Rows are buffered until commit_rows are pending or commit_interval
+    seconds have passed since the last commit (checked when rows are
+    added), then committed as one block. flush() waits until committed
+    blocks are written; sync=True also fsyncs the log and its index after
+    every block. Thread-safe.
+    """
+
+    def __init__(self, path, commit_rows=DEFAULT_COMMIT_ROWS, commit_interval=DEFAULT_COMMIT_INTERVAL,
+                 sync=False, clock=time.time_ns):
+        if commit_rows < 1:
+            raise ValueError("commit_rows must be at least 1")
+        self.path = path
+        self.commit_rows, self.commit_interval, self.sync = commit_rows, commit_interval, sync
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffer, self._fill = None, 0      # rows being collected for the next block
+        self._pending = []                      # scalar rows queued after them, as tuples
+        self._spare, self._buffers = queue.Queue(), 0
+        self._last_commit = time.monotonic()
+        self._version = FORMULA_VERSION.encode('ascii')
+
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'w+b' if new else 'r+b')
+        blocks_path, keys_path = _index_paths(path)
+        if new:
+            self._file.write(_file_header())
+            self._prev = hashlib.sha256(_file_header()).digest()
+            self._blocks = open(blocks_path, 'wb')
+            self._keys = open(keys_path, 'wb')
+            self.rows = 0
+        else:
+            self._recover()
+        self._open_variants(new)
+
+        self._queue = queue.Queue()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_blocks, name='tcd-audit-writer', daemon=True)
+        self._writer.start()
+
+    def _recover(self):
+        """Reopen: check the last indexed block, index later complete blocks, drop a torn tail."""
+        header = _read_header(self._file, self.path)
+        blocks, keys_path = _read_index(self.path)
+        blocks_path = _index_paths(self.path)[0]
+        self._blocks = open(blocks_path, 'r+b' if os.path.exists(blocks_path) else 'w+b')
+        self._blocks.truncate(blocks.nbytes)
+        self._blocks.seek(0, os.SEEK_END)
+        self.rows = int(blocks['rows'].sum())
+        self._keys = open(keys_path, 'r+b' if os.path.exists(keys_path) else 'w+b')
+        self._keys.truncate(self.rows * KEY_DTYPE.itemsize)
+        self._keys.seek(0, os.SEEK_END)
+
+        if len(blocks):
+            last = blocks[-1]
+            self._prev = last['hash'].tobytes()
+            end = int(last['offset']) + _BLOCK_HEADER.size + int(last['rows']) * ROW_BYTES
+            self._file.seek(int(last['offset']))
+            head = self._file.read(_BLOCK_HEADER.size)
+            if len(head) < _BLOCK_HEADER.size or _BLOCK_HEADER.unpack(head)[4] != self._prev:
+                raise ValueError(f"{self.path} does not match its index")
+        else:
+            self._prev = hashlib.sha256(header).digest()
+            end = len(header)
+
+        size = os.fstat(self._file.fileno()).st_size
+        while True:
+            self._file.seek(end)
+            head = self._file.read(_BLOCK_HEADER.size)
+            if len(head) < _BLOCK_HEADER.size:
+                break
+            magic, rows, version, prev, digest = _BLOCK_HEADER.unpack(head)
+            if magic != BLOCK_MAGIC or prev != self._prev or end + len(head) + rows * ROW_BYTES > size:
+                break
+            payload = self._file.read(rows * ROW_BYTES)
+            if _block_hash(prev, rows, version, payload) != digest:
+                break
+            self._index_block(end, _split_columns(payload, rows), version, digest)
+            end += _BLOCK_HEADER.size + len(payload)
+        self._file.truncate(end)
+        self._file.seek(end)
+
+    def _open_variants(self, new):
+        """Load path.variants (dropping a torn last line) and open it for appending."""
+        path = _variants_path(self.path)
+        if new or not os.path.exists(path):
+            open(path, 'wb').close()
+        with open(path, 'r+b') as f:
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+        self._variants = _read_variants(self.path)
+        self._variant_ids = {_options_json(options): id for id, options in self._variants.items()}
+        self._variants_file = open(path, 'a', encoding='utf-8')
+        self._default_variant = self._variant(None)
+
+    def _variant(self, options):
+        """Id of a set of formula options, appended to path.variants the first time it is seen."""
+        canonical = canonical_options(options)
+        key = _options_json(canonical)
+        id = self._variant_ids.get(key)
+        if id is None:
+            id = variant_id(canonical)
+            self._variants_file.write(json.dumps({'id': id, 'options': canonical}, sort_keys=True) + '\n')
+            self._variants_file.flush()
+            if self.sync:
+                os.fsync(self._variants_file.fileno())
+            self._variants[id], self._variant_ids[key] = canonical, id
+        return id
+
+    def _index_block(self, offset, columns, version, digest):
+        team, stamp = columns[0], columns[1]
+        keys = np.empty(len(team), KEY_DTYPE)
+        keys['team'], keys['time'] = team, stamp
+        keys['row'] = self.rows + np.arange(len(team))
+        self._keys.write(keys[np.lexsort((stamp, team))].tobytes())
+        entry = np.zeros((), BLOCK_DTYPE)
+        entry['offset'], entry['rows'], entry['first_row'] = offset, len(team), self.rows
+        entry['team_min'], entry['team_max'] = team.min(), team.max()
+        entry['time_min'], entry['time_max'] = stamp.min(), stamp.max()
+        entry['version'], entry['hash'] = version, np.frombuffer(digest, dtype=np.uint8)
+        self._blocks.write(entry.tobytes())
+        self.rows += len(team)
+        self._prev = digest
+
+    def _take_buffer(self):
+        """A (COLUMNS x commit_rows) buffer: a spare one, a new one, or the next one the writer frees."""
+        try:
+            return self._spare.get_nowait()
+        except queue.Empty:
+            if self._buffers < WRITE_BUFFERS:
+                self._buffers += 1
+                return np.empty((len(COLUMNS), self.commit_rows), '<f8')
+            return self._spare.get()
+
+    def _reserve(self):
+        """Buffer and next free row for one more row; the caller holds the lock."""
+        if self._buffer is None:
+            self._buffer, self._fill = self._take_buffer(), 0
+        return self._buffer, self._fill
+
+    def record(self, team, P, N, drivers, phi, rho, BV, result, timestamp=None, options=None):
+        """Queue one calculate_tcd_v4 call: its arguments, returned dict and formula options.
+
+        The row is checked here, an integer team and numbers everywhere
+        else, so a bad row raises ValueError from this call and the rows
+        already queued are still committed.
+        """
+        try:
+            values = tuple(map(float, (P, N, *_driver_values(drivers), phi, rho, BV, *_result_values(result))))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Audit row for team {team!r} has a non-numeric value: {e}") from None
+        team = _team_id(team)
+        stamp = self._clock() if timestamp is None else _timestamp(timestamp)
+        with self._lock:
+            variant = self._variant(options) if options else self._default_variant
+            self._pending.append((team, stamp, variant, *values))
+            self._maybe_commit()
+
+    def record_batch(self, teams, P, N, drivers, phi, rho, BV, result, timestamp=None, options=None):
+        """Buffer one calculate_tcd_v4_batch call; scalars broadcast and all rows share one timestamp.
+
+        The values are copied, so the caller may reuse its arrays. They are
+        checked first (integer teams, numeric columns of the result's
+        shape), so a bad call raises ValueError and buffers nothing.
+        """
+        shape = np.shape(result['TCD'])
+        n = int(np.prod(shape))
+        stamp = self._clock() if timestamp is None else _timestamp(timestamp)
+        teams = np.asarray(teams)
+        if teams.dtype.kind not in 'iu':
+            raise ValueError(f"Team ids must be integers, got an array of {teams.dtype}")
+        columns = [teams, P, N, *[drivers[k] for k in DRIVERS], phi, rho, BV, *[result[k] for k in RESULT_KEYS]]
+        values = []
+        for name, v in zip(['team', *INPUT_FIELDS, *RESULT_KEYS], columns):
+            try:
+                v = v if name == 'team' else np.asarray(v, dtype=float)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Audit column {name!r} is not numeric: {e}") from None
+            if v.ndim:
+                try:
+                    v = np.reshape(np.broadcast_to(v, shape), -1)
+                except ValueError:
+                    raise ValueError(f"Audit column {name!r} has shape {v.shape}, expected {shape}") from None
+            values.append(v)
+        with self._lock:
+            variant = self._variant(options) if options else self._default_variant
+            self._drain_pending()
+            done = 0
+            while done < n:
+                buffer, i = self._reserve()
+                k = min(n - done, self.commit_rows - i)
+                buffer[0, i:i + k].view('<i8')[:] = values[0] if np.ndim(values[0]) == 0 else values[0][done:done + k]
+                buffer[1:INT_COLUMNS, i:i + k].view('<i8')[:] = np.array([[stamp], [variant]])
+                for j, v in enumerate(values[1:], INT_COLUMNS):
+                    buffer[j, i:i + k] = v if np.ndim(v) == 0 else v[done:done + k]
+                self._fill += k
+                done += k
+                if self._fill == self.commit_rows:
+                    self._commit()
+            self._maybe_commit()
+
+    def score(self, team, P, N, drivers, phi, rho, BV, **options):
+        """calculate_tcd_v4(...) with the call and its options recorded."""
+        team = _team_id(team)
+        result = calculate_tcd_v4(P, N, drivers, phi, rho, BV, **options)
+        # record() inlined; the formula has just computed with these inputs, so they need no float() check
+        stamp = self._clock()
+        with self._lock:
+            variant = self._variant(options) if options else self._default_variant
+            self._pending.append((team, stamp, variant, P, N, *_driver_values(drivers), phi, rho, BV,
+                                  *_result_values(result)))
+            self._maybe_commit()
+        return result
+
+    def score_batch(self, teams, P, N, drivers, phi, rho, BV, **options):
+        """calculate_tcd_v4_batch(...) with every row and the options recorded."""
+        from .batch import calculate_tcd_v4_batch
+        result = calculate_tcd_v4_batch(P, N, drivers, phi, rho, BV, **options)
+        self.record_batch(teams, P, N, drivers, phi, rho, BV, result, options=options)
+        return result
+
+    def _drain_pending(self):
+        """Move queued scalar rows into the column buffer (before batch rows, to keep append order)."""
+        if self._pending:
+            buffer, i = self._reserve()
+            self._fill += _fill_rows(buffer, i, self._pending)
+            self._pending = []
+
+    def _maybe_commit(self):
+        if (self._fill + len(self._pending) >= self.commit_rows
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            self._commit()
+
+    def commit(self):
+        """Commit all buffered rows as one block (written by the writer thread)."""
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self._last_commit = time.monotonic()
+        if self._error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self._error
+        if self._fill or self._pending:
+            buffer, fill = self._reserve()
+            self._queue.put((buffer, fill, self._pending))
+            self._buffer, self._fill, self._pending = None, 0, []
+
+    def _write_blocks(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if self._error is None:
+                    self._write_block(*job)
+            except BaseException as e:
+                self._error = e
+            finally:
+                if job is not None:
+                    self._spare.put(job[0])
+                self._queue.task_done()
+
+    def _write_block(self, buffer, n, pending):
+        n += _fill_rows(buffer, n, pending)
+        columns = [*buffer[:INT_COLUMNS, :n].view('<i8'), *buffer[INT_COLUMNS:, :n]]
+        digest = _block_hash(self._prev, n, self._version, columns)
+        offset = self._file.tell()
+        self._file.write(_BLOCK_HEADER.pack(BLOCK_MAGIC, n, self._version, self._prev, digest))
+        for column in columns:
+            self._file.write(column.data)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        # The block is in the log before its index entries, so a crash leaves at worst entries to rebuild
+        self._index_block(offset, columns, self._version, digest)
+        for f in (self._keys, self._blocks):
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+
+    def flush(self):
+        """Commit buffered rows and wait until every committed block is written."""
+        self.commit()
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self._error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._writer.join()
+            for f in (self._file, self._keys, self._blocks, self._variants_file):
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AuditReader:
+    """Indexed, read-only access to a log written by AuditLog (as of when it is opened).
+
+    variants maps each record's variant id to the formula options it was
+    scored with (canonical_options form; {} is the default v4 formula).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._header = _read_header(f, path)
+        self.blocks, keys_path = _read_index(path)
+        self.rows = int(self.blocks['rows'].sum())
+        self.keys = (np.memmap(keys_path, KEY_DTYPE, 'r', shape=(self.rows,)) if self.rows
+                     else np.empty(0, KEY_DTYPE))
+        self._log = np.memmap(path, np.uint8, 'r') if self.rows else None
+        self.variants = _read_variants(path)
+
+    def _block_columns(self, b):
+        block = self.blocks[b]
+        start = int(block['offset']) + _BLOCK_HEADER.size
+        rows = int(block['rows'])
+        return _split_columns(self._log[start:start + rows * ROW_BYTES], rows)
+
+    def records(self, rows):
+        """Records (RECORD_DTYPE) by global row number (append order, from 0)."""
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        if rows.size and (rows.min() < 0 or rows.max() >= self.rows):
+            raise ValueError(f"Rows must be in [0, {self.rows})")
+        out = np.empty(len(rows), RECORD_DTYPE)
+        block_of = np.searchsorted(self.blocks['first_row'], rows, side='right') - 1
+        for b in np.unique(block_of).tolist():
+            mask = block_of == b
+            local = rows[mask] - self.blocks['first_row'][b]
+            for (field, key), column in zip(COLUMNS, self._block_columns(b)):
+                (out[field] if key is None else out[field][key])[mask] = column[local]
+            out['version'][mask] = self.blocks['version'][b]
+        return out
+
+    def iter_records(self, chunk_size=DEFAULT_COMMIT_ROWS):
+        """All records in append order, at most chunk_size at a time."""
+        for start in range(0, self.rows, chunk_size):
+            yield self.records(np.arange(start, min(start + chunk_size, self.rows)))
+
+    def query(self, team=None, start=None, end=None):
+        """Records of team (None: all teams) with start <= time < end, in append order.
+
+        start and end are ns since the epoch, numpy datetime64 values or
+        ISO strings; None leaves that side open.
+        """
+        lo = -2 ** 63 if start is None else _timestamp(start)
+        hi = 2 ** 63 - 1 if end is None else _timestamp(end)
+        blocks = self.blocks
+        candidates = (blocks['time_max'] >= lo) & (blocks['time_min'] < hi)
+        if team is not None:
+            candidates &= (blocks['team_min'] <= team) & (blocks['team_max'] >= team)
+        rows = []
+        for b in np.flatnonzero(candidates).tolist():
+            first, n = int(blocks['first_row'][b]), int(blocks['rows'][b])
+            keys = self.keys[first:first + n]
+            if team is None:
+                keys = keys[(keys['time'] >= lo) & (keys['time'] < hi)]
+            else:
+                i, j = np.searchsorted(keys['team'], [team, team + 1])
+                times = keys['time'][i:j]
+                keys = keys[i + np.searchsorted(times, lo):i + np.searchsorted(times, hi)]
+            rows.append(keys['row'])
+        rows = np.sort(np.concatenate(rows)) if rows else np.empty(0, np.int64)
+        return self.records(rows)
+
+    def verify(self):
+        """Recompute the hash chain in one sequential pass and check the variants file.
+
+        Returns {'ok', 'blocks', 'rows', 'first_bad_block', 'bad_variants'},
+        bad_variants listing ids whose options do not hash to them or that
+        rows use without an entry.
+        """
+        prev = hashlib.sha256(self._header).digest()
+        report = {'ok': True, 'blocks': len(self.blocks), 'rows': self.rows, 'first_bad_block': None}
+        used = set()
+        offset = len(self._header)
+        with open(self.path, 'rb') as f:
+            for b, entry in enumerate(self.blocks):
+                f.seek(offset)
+                head = f.read(_BLOCK_HEADER.size)
+                ok = len(head) == _BLOCK_HEADER.size and int(entry['offset']) == offset
+                if ok:
+                    magic, rows, version, stored_prev, digest = _BLOCK_HEADER.unpack(head)
+                    payload = f.read(rows * ROW_BYTES)
+                    ok = (magic == BLOCK_MAGIC and stored_prev == prev and rows == entry['rows']
+                          and _block_hash(prev, rows, version, payload) == digest == entry['hash'].tobytes())
+                if not ok:
+                    report['ok'], report['first_bad_block'] = False, b
+                    break
+                used.update(np.unique(_split_columns(payload, rows)[2]).tolist())
+                prev = digest
+                offset += _BLOCK_HEADER.size + len(payload)
+        bad = sorted({id for id, options in self.variants.items() if variant_id(options) != id}
+                     | (used - set(self.variants)))
+        report['bad_variants'] = bad
+        report['ok'] = report['ok'] and not bad
+        return report
+
+
+def as_dicts(records, variants=None):
+    """Records as plain dicts: team, time (ISO, UTC), version, options, inputs and result.
+
+    variants (AuditReader.variants) resolves each record's options; without
+    it options is the variant id.
+    """
+    out = []
+    for r in records:
+        variant = int(r['variant'])
+        out.append({
+            'team': int(r['team']),
+            'time': str(np.datetime64(int(r['time']), 'ns')),
+            'version': r['version'].decode('ascii'),
+            'options': variant if variants is None else variants.get(variant),
+            'inputs': {'P': float(r['inputs']['P']), 'N': float(r['inputs']['N']),
+                       'drivers': {k: float(r['inputs'][k]) for k in DRIVERS},
+                       **{k: float(r['inputs'][k]) for k in ('phi', 'rho', 'BV')}},
+            'result': {k: float(r['result'][k]) for k in RESULT_KEYS},
+        })
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.audit', description=__doc__.split('\n\n')[1])
+    parser.add_argument('log', help="audit log path")
+    parser.add_argument('--verify', action='store_true', help="check the hash chain")
+    parser.add_argument('--team', type=int, help="only this team")
+    parser.add_argument('--start', help="earliest time (ISO)")
+    parser.add_argument('--end', help="time bound, exclusive (ISO)")
+    args = parser.parse_args(argv)
+
+    reader = AuditReader(args.log)
+    if args.verify:
+        report = reader.verify()
+        print(json.dumps(report, indent=2))
+        if not report['ok']:
+            sys.exit(1)
+        return
+    for record in as_dicts(reader.query(args.team, args.start, args.end), reader.variants):
+        print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Batch Engine
+=====================================================
+
+Columnar (NumPy) version of calculate_tcd_v4 for scoring many teams at once.
+"""
+
+import numpy as np
+
+from .formula import DRIVERS, RESULT_KEYS, sigmoid_e_coef
+
+# Rows per block: keeps every temporary array inside the CPU cache
+BATCH_BLOCK_SIZE = 4096
+
+# Cost components, in subtotal order
+COMPONENTS = ['C1', 'C2', 'C3', 'C4', 'C5', 'C6']
+
+# Named constants of calculate_tcd_v4; calculate_tcd_v4_batch(coefficients=...)
+# overrides any of them (tcd.replay compares formula versions this way)
+V4_COEFFICIENTS = {
+    'delta_1': 0.25,          # C1 productivity loss rate
+    'delta_2': 0.10,          # C2 rework rate
+    'tau': 0.21,              # C3 turnover cost fraction
+    'delta_4': 0.15,          # C4 opportunity cost rate
+    'delta_5': 0.12,          # C5 knowledge loss rate
+    'overlap': 0.88,          # subtotal overlap discount
+    'M_4C_weight': 0.5,       # 4 C's multiplier amplitude
+    'eta_slope': 0.02,        # team size factor per member above 12
+    'eta_small': 1.2,         # team size factor below 5 members
+    'G_slope': 0.1,           # gaming penalty per anomaly point above 1.5
+    'G_max': 1.5,             # gaming penalty ceiling
+    'cap': 3.5,               # TCD ceiling as a multiple of payroll
+}
+
+
+def _clamp_batch(x, a, b):
+    """Element-wise clamp with the same min/max semantics as clamp() (NaN -> a)."""
+    return np.fmax(np.minimum(x, b), a)
+
+
+def _tcd_v4_block(P, N, d, phi, rho, BV, sigmoid='exact', coef=V4_COEFFICIENTS, anomaly=None, kappa=None):
+    """Vectorized body of calculate_tcd_v4 for one block of sanitized rows.
+
+    anomaly replaces the fixed-pair anomaly score when given; kappa maps
+    component names to calibration factors applied before the subtotal.
+    """
+    S_bar = P / N
+
+    # Readiness score (summed in DRIVERS order, like sum(d.values()))
+    total_d = 0
+    for k in DRIVERS:
+        total_d = total_d + d[k]
+    avg_d = total_d / 7
+    R = (avg_d - 1) / 6
+
+    # Cost components
+    C1 = P * coef['delta_1'] * (1 - R)
+
+    Q_adj = ((7 - d['communication']) + (7 - d['team_cognition'])) / 12
+    C2 = P * coef['delta_2'] * Q_adj
+
+    T_adj = ((7 - d['trust']) + (7 - d['psych_safety'])) / 12 * rho
+    C3 = N * S_bar * coef['tau'] * T_adj
+
+    O_adj = ((7 - d['coordination']) + (7 - d['goal_clarity'])) / 12
+    C4 = P * coef['delta_4'] * O_adj * BV
+
+    H_adj = ((7 - d['tms']) + (7 - d['communication'])) / 12
+    C5 = P * coef['delta_5'] * H_adj
+
+    # Continuous engagement coefficient
+    E = (d['trust'] + d['psych_safety']) / 2
+    E_coef = sigmoid_e_coef(E, sigmoid)
+    E_adj = (7 - E) / 6
+    C6 = P * E_coef * E_adj
+
+    # Calibration factors (tcd.calibration)
+    if kappa:
+        C1, C2, C3, C4, C5, C6 = (C * kappa[c] if c in kappa else C
+                                  for c, C in zip(COMPONENTS, (C1, C2, C3, C4, C5, C6)))
+
+    # Subtotal with overlap discount
+    subtotal = (C1 + C2 + C3 + C4 + C5 + C6) * coef['overlap']
+
+    # 4 C's multiplier
+    criteria = (d['team_cognition'] + d['goal_clarity'] + d['coordination']) / 3
+    commitment = (d['team_cognition'] + d['trust'] + d['goal_clarity']) / 3
+    collaboration = (d['tms'] + d['trust'] + d['psych_safety'] + d['coordination'] + d['communication']) / 5
+    change = (d['goal_clarity'] + d['coordination']) / 2
+    C_bar = (criteria + commitment + collaboration + change) / 4
+    M_4C = 1 + coef['M_4C_weight'] * (1 - C_bar / 7)
+
+    # Correction factors
+    eta = np.maximum(1 + coef['eta_slope'] * (N - 12), 1.0)
+    eta[N < 5] = coef['eta_small']
+    if anomaly is None:
+        anomaly = 0
+        for d1, d2, tol in [('trust', 'psych_safety', 1.5),
+                            ('communication', 'coordination', 2.0),
+                            ('goal_clarity', 'team_cognition', 2.5)]:
+            anomaly = anomaly + np.maximum(np.abs(d[d1] - d[d2]) - tol, 0)
+    G = np.minimum(1 + coef['G_slope'] * np.maximum(anomaly - 1.5, 0), coef['G_max'])
+
+    # Final TCD with ceiling cap (max 350% of payroll)
+    TCD_raw = subtotal * M_4C * phi * eta * G
+    TCD = np.minimum(TCD_raw, P * coef['cap'])
+
+    return {
+        'TCD': TCD,
+        'C1': C1, 'C2': C2, 'C3': C3, 'C4': C4, 'C5': C5, 'C6': C6,
+        'subtotal': subtotal,
+        'M_4C': M_4C, 'phi': phi, 'eta': eta, 'G': G,
+        'E': E, 'E_coef': E_coef,
+        'anomaly_score': anomaly
+    }
+
+
+def validate_inputs(P, N):
+    """Raise ValueError naming the first row calculate_tcd_v4 would reject."""
+    P = np.asarray(P)
+    N = np.asarray(N)
+    if np.any(P <= 0):
+        raise ValueError(f"Payroll must be positive (row {int(np.argmax(P <= 0))})")
+    if np.any(N < 1):
+        raise ValueError(f"Team size must be at least 1 (row {int(np.argmax(N < 1))})")
+
+
+def calculate_tcd_v4_batch(P, N, drivers, phi, rho, BV, sigmoid='exact', coefficients=None, anomaly=None,
+                           calibration=None):
+    """Calculate TCD for many teams at once (columnar version of calculate_tcd_v4).
+
+    P, N, phi, rho and BV are 1-D arrays (or scalars broadcast to all rows)
+    and drivers is any mapping or structured array indexable by driver name.
+    Returns the same keys as calculate_tcd_v4 with one float64 array per key.
+    Every operation mirrors the scalar formula in the same order, so each row
+    is bit-for-bit identical to calculate_tcd_v4 called with drivers in
+    DRIVERS order. sigmoid must be 'exact': the lookup table of tcd.sigmoid
+    is scalar-only, since NumPy's exp is faster on arrays.
+
+    coefficients maps names in V4_COEFFICIENTS to replacement values
+    (e.g. {'overlap': 0.85}); unset names keep their v4 value.
+
+    anomaly gives each row's anomaly score in place of the fixed-pair
+    check, e.g. AnomalyModel.anomaly_scores from tcd.anomaly; G is derived
+    from it by the same gaming penalty.
+
+    calibration maps cost components (C1..C6) to factors κ, one per row or
+    a scalar, e.g. Calibration.factors(segments) from tcd.calibration. Each
+    component is multiplied by its κ before the subtotal, so subtotal and
+    TCD (cap included) reflect the calibrated costs.
+    """
+    columns = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in
+                                    [P, N, phi, rho, BV] + [drivers[k] for k in DRIVERS]])
+    P, N, phi, rho, BV = columns[:5]
+    driver_cols = dict(zip(DRIVERS, columns[5:]))
+    n = P.size
+    if anomaly is not None:
+        anomaly = np.broadcast_to(np.asarray(anomaly, dtype=float), P.shape)
+    if calibration:
+        unknown = sorted(set(calibration) - set(COMPONENTS))
+        if unknown:
+            raise ValueError(f"Unknown component {unknown[0]!r}; expected one of {list(COMPONENTS)}")
+        calibration = {c: np.broadcast_to(np.asarray(k, dtype=float), P.shape) for c, k in calibration.items()}
+
+    if sigmoid != 'exact':
+        raise ValueError(f"calculate_tcd_v4_batch only supports sigmoid='exact', got {sigmoid!r}")
+    validate_inputs(P, N)
+    coef = V4_COEFFICIENTS
+    if coefficients:
+        unknown = sorted(set(coefficients) - set(V4_COEFFICIENTS))
+        if unknown:
+            raise ValueError(f"Unknown coefficient {unknown[0]!r}; expected one of {list(V4_COEFFICIENTS)}")
+        coef = {**V4_COEFFICIENTS, **{name: float(v) for name, v in coefficients.items()}}
+
+    out = {k: np.empty(n) for k in RESULT_KEYS}
+    for start in range(0, n, BATCH_BLOCK_SIZE):
+        s = slice(start, start + BATCH_BLOCK_SIZE)
+
+        # Sanitize driver scores and other inputs
+        d = {k: _clamp_batch(v[s], 1, 7) for k, v in driver_cols.items()}
+        block = _tcd_v4_block(P[s], N[s], d,
+                              _clamp_batch(phi[s], 0.7, 1.4),
+                              _clamp_batch(rho[s], 0.8, 1.3),
+                              _clamp_batch(BV[s], 1, 10), sigmoid, coef,
+                              None if anomaly is None else anomaly[s],
+                              calibration and {c: k[s] for c, k in calibration.items()})
+        for k in RESULT_KEYS:
+            out[k][s] = block[k]
+    return out
+
+
+def random_portfolio(n_teams, seed=0):
+    """Fixed-seed synthetic portfolio in calculate_tcd_v4_batch argument form.
+
+    Inputs deliberately overshoot the sanitized ranges so the clamps are
+    exercised; used by the benchmarks and the parallel scaling run.
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        'P': rng.uniform(100_000, 10_000_000, n_teams),
+        'N': rng.integers(1, 60, n_teams).astype(float),
+        'drivers': {k: rng.uniform(0.5, 7.5, n_teams) for k in DRIVERS},
+        'phi': rng.uniform(0.6, 1.5, n_teams),
+        'rho': rng.uniform(0.7, 1.4, n_teams),
+        'BV': rng.uniform(0.5, 12, n_teams),
+    }
@@ -0,0 +1,116 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Scoring Cache
+======================================================
+
+Bounded LRU/TTL memoization in front of calculate_tcd_v4 for callers that
+re-score the same team many times (UI view toggles).
+
+    cache = TCDCache(maxsize=4096, ttl=300)
+    result = cache.score(P, N, drivers, phi, rho, BV)
+    result = cache.score(P, N, drivers, phi, rho, BV, ci={'n_samples': 20_000})
+
+Entries are keyed on the sanitized inputs: drivers, phi, rho and BV are
+clamped exactly as the formula clamps them, so out-of-range duplicates
+(a driver of 9 and one of 7) share one entry. The formula is evaluated on
+those sanitized inputs with drivers in DRIVERS order, like the batch path.
+"""
+
+import collections
+import copy
+import threading
+import time
+
+from .formula import DRIVERS, calculate_tcd_v4
+
+
+def sanitized_key(P, N, drivers, phi, rho, BV):
+    """Hashable key of the inputs after the formula's own sanitization."""
+    # clamp() inlined: building the key is the whole cost of a cache hit
+    return (P, N, tuple([max(1, min(drivers[k], 7)) for k in DRIVERS]),
+            max(0.7, min(phi, 1.4)), max(0.8, min(rho, 1.3)), max(1, min(BV, 10)))
+
+
+class TCDCache:
+    """LRU cache of calculate_tcd_v4 results with optional time-to-live.
+
+    maxsize bounds the number of entries (least recently used are evicted);
+    ttl, in seconds, expires entries regardless of use (None keeps them).
+    Thread-safe; concurrent misses on one key may both compute it.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _put(self, key, value):
+        expires = None if self.ttl is None else self._clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def score(self, P, N, drivers, phi, rho, BV, ci=None):
+        """calculate_tcd_v4 through the cache.
+
+        ci is None or a dict of tcd_confidence_interval options (n_samples,
+        seed, confidence, method); the interval is then cached with the
+        point estimate and returned under 'ci'. Returns a fresh dict.
+        """
+        key = sanitized_key(P, N, drivers, phi, rho, BV)
+        ci_key = None if ci is None else tuple(sorted(ci.items()))
+        value = self._get((key, ci_key))
+        if value is None:
+            P, N, d, phi, rho, BV = key
+            d = dict(zip(DRIVERS, d))
+            result = calculate_tcd_v4(P, N, d, phi, rho, BV)
+            interval = None
+            if ci is not None:
+                from .ci import tcd_confidence_interval
+                interval = tcd_confidence_interval(
+                    {'P': P, 'N': N, 'drivers': d, 'phi': phi, 'rho': rho, 'BV': BV}, **ci)
+            value = (result, interval)
+            self._put((key, ci_key), value)
+
+        result, interval = value
+        result = dict(result)
+        if interval is not None:
+            result['ci'] = copy.deepcopy(interval)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,230 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Calibration Against Actuals
+====================================================================
+
+FIX V13 calibration factors κ = Actual / Predicted for the turnover (C3)
+and rework (C2) components, fitted per segment (industry, business unit,
+...) from a table of batch predictions and recorded actual costs:
+
+    predicted = calculate_tcd_v4_batch(P, N, drivers, phi, rho, BV)
+    calibration = fit_calibration(predicted, {'C2': rework, 'C3': turnover}, segments=industry,
+                                  n_bootstrap=2000, workers=8)
+    calibration.summary()                       # κ, bootstrap CI, MAPE before/after
+    calibrated = calculate_tcd_v4_batch(..., calibration=calibration.factors(segments))
+    calibration.save('calibration.json')        # python -m tcd.pipeline ... --calibration
+
+κ is the least-squares fit of Actual ≈ κ × Predicted through the origin,
+κ = Σ A P / Σ P², computed for all segments at once with bincount. CIs
+resample teams with replacement within each segment; replicates run in
+fixed-size blocks seeded from (seed, block), so they are identical for any
+number of workers. Rows whose actual is NaN are ignored for that component,
+and rows with a zero actual are left out of MAPE. A segment left with no
+usable rows for a component (every actual NaN, or every prediction zero)
+keeps κ = 1, i.e. is not calibrated, with a RuntimeWarning and NaN CI.
+
+The factors enter scoring as a per-row multiplier on each calibrated
+component before the subtotal (calculate_tcd_v4_batch(calibration=...),
+and score_file / the pipeline CLI with a saved calibration and a segment
+column), so subtotal and TCD (cap included) reflect the calibrated costs
+with no per-row Python work. apply() does the same to an already scored
+result.
+"""
+
+import json
+import multiprocessing
+import warnings
+
+import numpy as np
+
+from .batch import COMPONENTS, V4_COEFFICIENTS
+from .ci import _percentile_bounds
+
+# FIX V13: rework (C2) and turnover (C3) are calibrated against actuals
+CALIBRATED_COMPONENTS = ('C2', 'C3')
+MAPE_TARGET = 0.25
+
+BOOTSTRAP_BLOCK = 50
+
+# Per-process copy of the data being resampled (set by _init_bootstrap)
+_DATA = None
+
+
+def _block_seed(seed, block):
+    return np.random.SeedSequence(seed, spawn_key=(block,))
+
+
+def _init_bootstrap(data):
+    global _DATA
+    _DATA = data
+
+
+def _bootstrap_block(args):
+    """κ for n replicates: each resamples every segment's rows with replacement."""
+    seed, block, n = args
+    codes, start, size, ap, pp = _DATA
+    n_segments = len(start)
+    rng = np.random.default_rng(_block_seed(seed, block))
+    out = np.empty((n, n_segments))
+    for r in range(n):
+        rows = start[codes] + (rng.random(len(codes)) * size[codes]).astype(np.intp)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[r] = (np.bincount(codes, weights=ap[rows], minlength=n_segments)
+                      / np.bincount(codes, weights=pp[rows], minlength=n_segments))
+    return out
+
+
+def _bootstrap(data, n_bootstrap, seed, workers):
+    """(n_bootstrap x segments) bootstrap κ replicates, in BOOTSTRAP_BLOCK blocks."""
+    blocks = [(seed, b, min(BOOTSTRAP_BLOCK, n_bootstrap - b * BOOTSTRAP_BLOCK))
+              for b in range(-(-n_bootstrap // BOOTSTRAP_BLOCK))]
+    if workers > 1:
+        with multiprocessing.Pool(workers, _init_bootstrap, (data,)) as pool:
+            return np.concatenate(pool.map(_bootstrap_block, blocks))
+    _init_bootstrap(data)
+    try:
+        return np.concatenate([_bootstrap_block(b) for b in blocks])
+    finally:
+        _init_bootstrap(None)
+
+
+def _mape(actual, predicted, codes, n_segments):
+    used = actual != 0
+    error = np.abs(actual - predicted) / np.where(used, np.abs(actual), 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.bincount(codes, weights=np.where(used, error, 0), minlength=n_segments)
+                / np.bincount(codes, weights=used, minlength=n_segments))
+
+
+class Calibration:
+    """Fitted κ per (component, segment); built by fit_calibration.
+
+    segments lists the segment labels; kappa, low, high, n, mape_before and
+    mape_after map each component to one array aligned with segments.
+    """
+
+    def __init__(self, components, segments, confidence):
+        self.components = list(components)
+        self.segments = segments
+        self.confidence = confidence
+        self.kappa, self.low, self.high, self.n = {}, {}, {}, {}
+        self.mape_before, self.mape_after = {}, {}
+        self._index = {label: i for i, label in enumerate(segments)}
+
+    def factors(self, segments=None):
+        """κ per row for the given segment labels, as {component: array}."""
+        if segments is None:
+            if len(self.segments) != 1:
+                raise ValueError("segments are required for a calibration fitted per segment")
+            return {c: self.kappa[c][0] for c in self.components}
+        labels, inverse = np.unique(np.asarray(segments), return_inverse=True)
+        try:
+            index = np.array([self._index[label.item()] for label in labels], dtype=np.intp)
+        except KeyError as e:
+            raise ValueError(f"No calibration for segment {e.args[0]!r}") from None
+        rows = index[inverse.reshape(-1)].reshape(np.shape(segments))
+        return {c: self.kappa[c][rows] for c in self.components}
+
+    def apply(self, result, P, segments=None, coefficients=None):
+        """Calibrated copy of a calculate_tcd_v4(_batch) result: components rescaled, subtotal and TCD recomputed.
+
+        coefficients are the overrides the result was scored with (see
+        calculate_tcd_v4_batch); the overlap discount and cap come from them.
+        The result matches calculate_tcd_v4_batch(calibration=factors(segments)).
+        """
+        coef = {**V4_COEFFICIENTS, **(coefficients or {})}
+        out = dict(result)
+        for c, kappa in self.factors(segments).items():
+            out[c] = result[c] * kappa
+        out['subtotal'] = (out['C1'] + out['C2'] + out['C3'] + out['C4'] + out['C5'] + out['C6']) * coef['overlap']
+        TCD_raw = out['subtotal'] * out['M_4C'] * out['phi'] * out['eta'] * out['G']
+        out['TCD'] = np.minimum(TCD_raw, np.asarray(P, dtype=float) * coef['cap'])
+        if np.ndim(out['TCD']) == 0:
+            out = {k: float(v) if isinstance(v, np.floating) else v for k, v in out.items()}
+        return out
+
+    def save(self, path):
+        """Write the fitted factors as JSON (read back with Calibration.load)."""
+        fields = {name: {c: getattr(self, name)[c].tolist() for c in self.components}
+                  for name in ('kappa', 'low', 'high', 'n', 'mape_before', 'mape_after')}
+        with open(path, 'w') as f:
+            json.dump({'components': self.components, 'segments': list(self.segments),
+                       'confidence': self.confidence, **fields}, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        unknown = sorted(set(state['components']) - set(COMPONENTS))
+        if unknown:
+            raise ValueError(f"Unknown component {unknown[0]!r} in {path}")
+        calibration = cls(state['components'], state['segments'], state['confidence'])
+        for name in ('kappa', 'low', 'high', 'n', 'mape_before', 'mape_after'):
+            dtype = np.int64 if name == 'n' else float
+            getattr(calibration, name).update({c: np.array(state[name][c], dtype=dtype)
+                                               for c in calibration.components})
+        return calibration
+
+    def summary(self):
+        """One dict per (segment, component) with κ, its CI, the row count and MAPE before/after."""
+        rows = []
+        for i, label in enumerate(self.segments):
+            for c in self.components:
+                after = float(self.mape_after[c][i])
+                rows.append({
+                    'segment': label, 'component': c, 'n': int(self.n[c][i]),
+                    'kappa': float(self.kappa[c][i]), 'low': float(self.low[c][i]), 'high': float(self.high[c][i]),
+                    'mape_before': float(self.mape_before[c][i]), 'mape_after': after,
+                    'meets_target': bool(after <= MAPE_TARGET),
+                })
+        return rows
+
+
+def fit_calibration(predicted, actual, segments=None, components=CALIBRATED_COMPONENTS, n_bootstrap=1000,
+                    confidence=0.95, seed=42, workers=1):
+    """Fit κ = Σ A P / Σ P² per segment and component, with bootstrap CIs and MAPE.
+
+    predicted and actual map each component to an array (predicted is
+    typically a calculate_tcd_v4_batch result). segments labels each row
+    (None fits one κ for all rows). n_bootstrap=0 skips the CIs.
+    """
+    q = _percentile_bounds(confidence)
+    n_rows = len(np.asarray(predicted[components[0]]))
+    if segments is None:
+        labels, codes = [None], np.zeros(n_rows, dtype=np.intp)
+    else:
+        labels, codes = np.unique(np.asarray(segments), return_inverse=True)
+        labels, codes = [v.item() for v in labels], codes.reshape(-1)
+    n_segments = len(labels)
+    calibration = Calibration(components, labels, confidence)
+
+    for c in components:
+        p = np.asarray(predicted[c], dtype=float).reshape(-1)
+        a = np.asarray(actual[c], dtype=float).reshape(-1)
+        used = ~(np.isnan(a) | np.isnan(p))
+        p, a, c_codes = p[used], a[used], codes[used]
+
+        n = np.bincount(c_codes, minlength=n_segments)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kappa = (np.bincount(c_codes, weights=a * p, minlength=n_segments)
+                     / np.bincount(c_codes, weights=p * p, minlength=n_segments))
+        fitted = np.isfinite(kappa)
+        if not fitted.all():
+            missing = [labels[i] for i in np.flatnonzero(~fitted)]
+            warnings.warn(f"No usable actuals for {c} in segment(s) {missing}; their kappa is left at 1 (uncalibrated)",
+                          RuntimeWarning)
+            kappa[~fitted] = 1.0
+        calibration.n[c], calibration.kappa[c] = n, kappa
+        calibration.mape_before[c] = _mape(a, p, c_codes, n_segments)
+        calibration.mape_after[c] = _mape(a, kappa[c_codes] * p, c_codes, n_segments)
+
+        low = high = np.full(n_segments, np.nan)
+        if n_bootstrap:
+            # Rows sorted by segment, so a segment's rows are start[s] .. start[s] + n[s]
+            order = np.argsort(c_codes, kind='stable')
+            start = np.concatenate([[0], np.cumsum(n)[:-1]])
+            data = (c_codes[order], start, n, (a * p)[order], (p * p)[order])
+            replicates = _bootstrap(data, n_bootstrap, seed, workers)
+            low, high = np.full((2, n_segments), np.nan)
+            low[fitted], high[fitted] = np.nanpercentile(replicates[:, fitted], q, axis=0)
+        calibration.low[c], calibration.high[c] = low, high
+    return calibration
@@ -0,0 +1,289 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Material Change Detection
+==================================================================
+
+Compares two scored snapshots (tcd.pipeline outputs of two assessment
+waves) team by team and emits only the FIX V15 material changes, those
+with |ΔTCD| >= max($10,000, 2% of the earlier TCD):
+
+    python -m tcd.changes wave1.csv wave2.csv changes.csv
+    python -m tcd.changes wave1.parquet wave2.parquet changes.csv --ci-samples 2000 --membership
+
+    summary = compare_snapshots('wave1.csv', 'wave2.csv', 'changes.csv')
+
+The earlier snapshot is read once into a hash index (team id -> row) with
+its numeric columns as arrays; the later snapshot then streams past it
+chunk by chunk, so each file is read exactly once and memory holds one
+snapshot plus a chunk. Every emitted row carries TCD before and after, the
+change (absolute and in percent), the change in each component C1-C6 and
+the threshold. Teams present in only one snapshot are counted, and emitted
+with status 'added' or 'removed' when membership is set.
+
+When both snapshots carry CI columns (TCD_low/TCD_high), each material
+change also gets p_material, the Monte Carlo probability that the change
+stays material under the FIX V15 coefficient uncertainty, and significant
+(p_material >= confidence). Both waves are simulated on the same
+coefficient draws, since the coefficients are shared and not redrawn per
+wave, from the linear terms of tcd.ci rebuilt from the snapshot's result
+columns. The 350% cap needs payroll: it is exact when the snapshot keeps a
+payroll column, otherwise it is recovered for teams capped at their point
+estimate and left off for the rest.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from .batch import COMPONENTS
+from .ci import (DEFAULT_MAX_BYTES, SAMPLING_METHODS, _percentile_bounds, draw_coefficients, simulate_tcd,
+                 tcd_linear_terms_batch)
+from .pipeline import DEFAULT_CHUNK_SIZE, open_reader, open_writer
+from .replay import materiality_threshold
+
+CHANGE_KEYS = ['TCD_before', 'TCD_after', 'TCD_delta', 'TCD_delta_pct',
+               *[f'{c}_delta' for c in COMPONENTS], 'materiality_threshold']
+SIGNIFICANCE_KEYS = ['p_material', 'significant']
+DEFAULT_CI_SAMPLES = 1000
+
+# Result columns read from each snapshot: the deltas need TCD and C1-C6, the
+# Monte Carlo linear terms also the multipliers and subtotal (to spot capped teams)
+VALUE_COLUMNS = ['TCD', *COMPONENTS]
+CI_COLUMNS = ['subtotal', 'M_4C', 'phi', 'eta', 'G']
+PAYROLL_COLUMNS = ('payroll', 'P')
+
+
+def _payroll_column(columns):
+    return next((c for c in PAYROLL_COLUMNS if c in columns), None)
+
+
+def _snapshot_values(chunk, names, payroll):
+    """Numeric columns of a chunk, with payroll as P in the base currency (times fx_rate when converted)."""
+    values = _numeric(chunk, names)
+    if payroll:
+        values['P'] = values.pop(payroll)
+        if payroll == 'payroll' and 'fx_rate' in chunk:
+            values['P'] *= np.asarray(chunk['fx_rate'], dtype=float)
+    return values
+
+
+def _has_ci(columns):
+    return 'TCD_low' in columns and 'TCD_high' in columns
+
+
+def _numeric(chunk, names):
+    return {name: np.asarray(chunk[name], dtype=float) for name in names}
+
+
+class SnapshotIndex:
+    """The earlier snapshot: team id -> row hash index and its numeric columns."""
+
+    def __init__(self, path, id_column='team_id', with_ci=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        reader = open_reader(path, chunk_size)
+        try:
+            if id_column not in reader.columns:
+                raise ValueError(f"{path} has no {id_column!r} column")
+            self.ci = with_ci and _has_ci(reader.columns)
+            payroll = _payroll_column(reader.columns)
+            names = VALUE_COLUMNS + (CI_COLUMNS if self.ci else []) + ([payroll] if payroll else [])
+            ids, parts = [], []
+            for chunk in reader:
+                ids.extend(np.asarray(chunk[id_column]).tolist())
+                parts.append(_snapshot_values(chunk, names, payroll))
+        finally:
+            reader.close()
+
+        self.ids = ids
+        self.index = {team: i for i, team in enumerate(ids)}
+        if len(self.index) != len(ids):
+            seen = set()
+            duplicate = next(team for team in ids if team in seen or seen.add(team))
+            raise ValueError(f"{path}: team {duplicate!r} appears more than once")
+        keys = parts[0].keys() if parts else names
+        self.values = {k: np.concatenate([p[k] for p in parts]) if parts else np.empty(0) for k in keys}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, ids):
+        """Row of each id in this snapshot (-1 when absent)."""
+        get = self.index.get
+        return np.fromiter((get(team, -1) for team in ids), dtype=np.intp, count=len(ids))
+
+
+def _linear_terms(values):
+    """tcd.ci linear terms of scored rows, with the cap from payroll or, failing that, from capped rows."""
+    if 'P' in values:
+        P = values['P']
+    else:
+        raw = values['subtotal'] * values['M_4C'] * values['phi'] * values['eta'] * values['G']
+        P = np.where(values['TCD'] < raw, values['TCD'] / 3.5, np.inf)
+    return tcd_linear_terms_batch(P, values)
+
+
+def material_probability(before, after, coefficients, max_bytes=DEFAULT_MAX_BYTES):
+    """P(|ΔTCD| >= threshold) per row over shared coefficient draws; before/after map result columns to arrays."""
+    a, b = _linear_terms(before), _linear_terms(after)
+    n, n_samples = len(a[0]), len(coefficients)
+    block = max(1, int(max_bytes // (3 * n_samples * 8)))
+    p = np.empty(n)
+    for start in range(0, n, block):
+        s = slice(start, start + block)
+        TCD_a = simulate_tcd(*(t[s] for t in a), coefficients)
+        delta = simulate_tcd(*(t[s] for t in b), coefficients)
+        delta -= TCD_a
+        p[s] = (np.abs(delta) >= materiality_threshold(TCD_a)).mean(axis=1)
+    return p
+
+
+def compare_snapshots(before_path, after_path, output_path=None, id_column='team_id', ci_samples=None,
+                      confidence=0.95, seed=42, method='random', membership=False,
+                      chunk_size=DEFAULT_CHUNK_SIZE, progress=sys.stderr):
+    """Stream after_path against an index of before_path; write material changes and return a summary.
+
+    ci_samples=None simulates DEFAULT_CI_SAMPLES draws when both snapshots
+    have CI columns; 0 turns the probabilistic flag off.
+    """
+    _percentile_bounds(confidence)
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method {method!r}; expected one of {SAMPLING_METHODS}")
+    reader = open_reader(after_path, chunk_size)
+    try:
+        if id_column not in reader.columns:
+            raise ValueError(f"{after_path} has no {id_column!r} column")
+        with_ci = ci_samples != 0 and _has_ci(reader.columns)
+        before = SnapshotIndex(before_path, id_column, with_ci, chunk_size)
+        with_ci = with_ci and before.ci
+        coefficients = None
+        if with_ci:
+            coefficients = draw_coefficients(ci_samples or DEFAULT_CI_SAMPLES, seed, method)
+        payroll = _payroll_column(reader.columns)
+        names = VALUE_COLUMNS + (CI_COLUMNS if with_ci else []) + ([payroll] if payroll else [])
+
+        summary = dict.fromkeys(['before_rows', 'after_rows', 'matched', 'added', 'removed',
+                                 'material', 'material_up', 'material_down'], 0)
+        summary['before_rows'] = len(before)
+        summary.update(TCD_before_sum=0.0, TCD_after_sum=0.0, material_delta_sum=0.0)
+        if with_ci:
+            summary['significant'] = 0
+        columns = [id_column, 'status', *CHANGE_KEYS] + (SIGNIFICANCE_KEYS if with_ci else [])
+        writer = open_writer(output_path, columns) if output_path is not None else None
+        seen = np.zeros(len(before), dtype=bool)
+        added_ids = set()
+        started = time.perf_counter()
+
+        def emit(ids, status, values):
+            if writer is not None and len(ids):
+                out = {id_column: list(ids), 'status': [status] * len(ids)}
+                out.update({k: v.tolist() for k, v in values.items()})
+                writer.write(out)
+
+        try:
+            for chunk in reader:
+                ids = np.asarray(chunk[id_column]).tolist()
+                after = _snapshot_values(chunk, names, payroll)
+                rows = before.lookup(ids)
+                matched = rows >= 0
+                summary['after_rows'] += len(ids)
+
+                new = np.flatnonzero(~matched)
+                for i in new.tolist():
+                    if ids[i] in added_ids:
+                        raise ValueError(f"{after_path}: team {ids[i]!r} appears more than once")
+                    added_ids.add(ids[i])
+                summary['added'] += len(new)
+                if membership:
+                    emit([ids[i] for i in new.tolist()], 'added', _membership_values(None, after, new, with_ci))
+
+                at, r = np.flatnonzero(matched), rows[matched]
+                repeated = np.sort(r)
+                repeated = np.concatenate([r[seen[r]], repeated[1:][repeated[1:] == repeated[:-1]]])
+                if len(repeated):
+                    raise ValueError(f"{after_path}: team {before.ids[repeated[0]]!r} appears more than once")
+                seen[r] = True
+                summary['matched'] += len(r)
+
+                TCD_a, TCD_b = before.values['TCD'][r], after['TCD'][at]
+                delta = TCD_b - TCD_a
+                threshold = materiality_threshold(TCD_a)
+                material = np.abs(delta) >= threshold
+                summary['TCD_before_sum'] += float(TCD_a.sum())
+                summary['TCD_after_sum'] += float(TCD_b.sum())
+                summary['material'] += int(material.sum())
+                summary['material_up'] += int((material & (delta > 0)).sum())
+                summary['material_down'] += int((material & (delta < 0)).sum())
+                summary['material_delta_sum'] += float(delta[material].sum())
+
+                m, mr = at[material], r[material]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    pct = np.where(TCD_a[material] > 0, delta[material] / TCD_a[material] * 100, np.nan)
+                values = {'TCD_before': TCD_a[material], 'TCD_after': TCD_b[material],
+                          'TCD_delta': delta[material], 'TCD_delta_pct': pct}
+                values.update({f'{c}_delta': after[c][m] - before.values[c][mr] for c in COMPONENTS})
+                values['materiality_threshold'] = threshold[material]
+                if with_ci:
+                    p = material_probability({k: v[mr] for k, v in before.values.items()},
+                                             {k: v[m] for k, v in after.items()}, coefficients)
+                    values['p_material'], values['significant'] = p, p >= confidence
+                    summary['significant'] += int((p >= confidence).sum())
+                emit([ids[i] for i in m.tolist()], 'changed', values)
+
+                if progress is not None:
+                    rate = summary['after_rows'] / max(time.perf_counter() - started, 1e-9)
+                    progress.write(f"\r  {summary['after_rows']:,} rows compared ({rate:,.0f} rows/s)")
+                    progress.flush()
+
+            gone = np.flatnonzero(~seen)
+            summary['removed'] = len(gone)
+            if membership:
+                emit([before.ids[i] for i in gone.tolist()], 'removed',
+                     _membership_values(before.values, None, gone, with_ci))
+        finally:
+            if writer is not None:
+                writer.close()
+    finally:
+        reader.close()
+    if progress is not None:
+        progress.write("\n")
+    return summary
+
+
+def _membership_values(before, after, rows, with_ci):
+    """Output columns for teams in one snapshot only (the missing side is NaN)."""
+    nan = np.full(len(rows), np.nan)
+    TCD_a = nan if before is None else before['TCD'][rows]
+    TCD_b = nan if after is None else after['TCD'][rows]
+    values = {'TCD_before': TCD_a, 'TCD_after': TCD_b, 'TCD_delta': nan, 'TCD_delta_pct': nan}
+    values.update({f'{c}_delta': nan for c in COMPONENTS})
+    values['materiality_threshold'] = nan
+    if with_ci:
+        values['p_material'], values['significant'] = nan, np.zeros(len(rows), dtype=bool)
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.changes', description=__doc__.split('\n\n')[1])
+    parser.add_argument('before', help="earlier scored snapshot (.csv or .parquet)")
+    parser.add_argument('after', help="later scored snapshot (.csv or .parquet)")
+    parser.add_argument('output', nargs='?', help="material changes (.csv file or .parquet dataset directory)")
+    parser.add_argument('--id', default='team_id', help="team id column")
+    parser.add_argument('--ci-samples', type=int, help=f"Monte Carlo draws when both snapshots have CIs "
+                                                       f"(default {DEFAULT_CI_SAMPLES}; 0 disables)")
+    parser.add_argument('--confidence', type=float, default=0.95, help="p_material needed for 'significant'")
+    parser.add_argument('--seed', type=int, default=42, help="coefficient draw seed")
+    parser.add_argument('--method', choices=SAMPLING_METHODS, default='random', help="coefficient sampling")
+    parser.add_argument('--membership', action='store_true', help="also emit added and removed teams")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument('--quiet', action='store_true', help="no progress report")
+    args = parser.parse_args(argv)
+
+    summary = compare_snapshots(args.before, args.after, args.output, args.id, args.ci_samples, args.confidence,
+                                args.seed, args.method, args.membership, args.chunk_size,
+                                progress=None if args.quiet else sys.stderr)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
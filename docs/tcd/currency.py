@@ -0,0 +1,252 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Currency Conversion
+============================================================
+
+FIX V14 conversion of payroll (and revenue, where it is in another
+currency) to one base currency before batch scoring, from a local rate
+table. Nothing is fetched: the table is a CSV you maintain, one row per
+date and one column per currency,
+
+    date,EUR,GBP,JPY
+    2024-01-02,1.0956,1.2717,0.006978
+    2024-01-03,1.0919,1.2658,
+
+each value being the base-currency price of one unit of that currency
+(blank where no rate was published). The base currency converts at 1.
+
+    rates = RateTable.from_csv('rates.csv', base='USD')
+    inputs, rate = convert_inputs(inputs, currency, dates, rates, method='average', period='M')
+    result = calculate_tcd_v4_batch(**inputs)
+
+from_csv parses the CSV once into .npy files (dates, rates, and for each
+date and currency the row of the latest published rate) under
+$TCD_CACHE_DIR/rates-<hash of the CSV> and memory-maps them afterwards, so
+reopening a large table costs no parsing. Dates are sorted, so a lookup is
+a searchsorted over the date index. The spot rate for a date is the latest
+rate published on or before it. The period average for a calendar month,
+quarter or year is the mean of the rates published in it; the averages of
+all periods are computed in one pass per period kind and cached on the
+table.
+
+Optional PPP factors multiply the converted value (PPP_adjusted = Nominal x
+PPP_factor). BV is a ratio, so it only changes when revenue and payroll are
+in different currencies (Theorem 14.1); convert_inputs returns the rate
+used for each row so it can be recorded next to the score.
+"""
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .symcache import cache_dir, content_hash
+
+METHODS = ('average', 'spot')
+PERIODS = ('M', 'Q', 'Y')
+
+_FILES = ('dates', 'rates', 'latest')
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return content_hash(f.read())
+
+
+def _as_dates(dates):
+    try:
+        return np.asarray(dates, dtype='datetime64[D]')
+    except ValueError as e:
+        raise ValueError(f"Dates must be ISO dates (YYYY-MM-DD): {e}") from None
+
+
+def _period_ids(dates, period):
+    """Integer id of the calendar period containing each date."""
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS} (got {period!r})")
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    if period == 'M':
+        return months
+    return months // 3 if period == 'Q' else months // 12
+
+
+class RateTable:
+    """Dated exchange rates into one base currency, memory-mapped from .npy files.
+
+    dates is the sorted date index, currencies the column labels, rates the
+    (dates x currencies) table (NaN where no rate was published) and
+    latest[i, j] the row of the last rate for currency j on or before date
+    i (-1 before its first rate).
+    """
+
+    def __init__(self, base, currencies, dates, rates, latest):
+        self.base = base
+        self.currencies = list(currencies)
+        self.dates, self.rates, self.latest = dates, rates, latest
+        self._index = {c: j for j, c in enumerate(self.currencies)}
+        self._averages = {}
+
+    @classmethod
+    def from_csv(cls, path, base='USD', directory=None):
+        """Rate table for a CSV, parsed into directory on first use (default: under the cache dir)."""
+        key = content_hash(_file_hash(path), base)
+        if directory is None:
+            directory = os.path.join(cache_dir(), f'rates-{key[:24]}')
+        try:
+            table = cls.open(directory)
+        except OSError:
+            table = None
+        if table is not None and table._key == key:
+            return table
+
+        dates, currencies, rates = cls._parse_csv(path, base)
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+        try:
+            np.save(os.path.join(tmp, 'dates.npy'), dates.astype(np.int64))
+            np.save(os.path.join(tmp, 'rates.npy'), rates)
+            np.save(os.path.join(tmp, 'latest.npy'), cls._latest_rows(rates))
+            with open(os.path.join(tmp, 'rates.json'), 'w') as f:
+                json.dump({'base': base, 'currencies': currencies, 'key': key}, f)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return cls.open(directory)
+
+    @classmethod
+    def open(cls, directory):
+        """Memory-map a table written by from_csv."""
+        with open(os.path.join(directory, 'rates.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in _FILES}
+        table = cls(meta['base'], meta['currencies'], arrays['dates'].view('datetime64[D]'),
+                    arrays['rates'], arrays['latest'])
+        table._key = meta['key']
+        return table
+
+    @staticmethod
+    def _parse_csv(path, base):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = [row for row in reader if row]
+        if not rows:
+            raise ValueError(f"{path}: no rates")
+        if not header or header[0].strip().lower() != 'date' or len(set(header)) != len(header):
+            raise ValueError(f"{path}: the header must be 'date' followed by distinct currency codes")
+        currencies = [c.strip() for c in header[1:]]
+        if base not in currencies:
+            currencies.append(base)
+        if any(len(row) > len(header) for row in rows):
+            raise ValueError(f"{path}: a row has more values than the header")
+
+        dates = _as_dates([row[0].strip() for row in rows])
+        values = np.full((len(rows), len(currencies)), np.nan)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row[1:]):
+                if value.strip():
+                    values[i, j] = float(value)
+        values[:, currencies.index(base)] = 1.0
+        if np.any(values <= 0):
+            raise ValueError(f"{path}: rates must be positive")
+
+        order = np.argsort(dates, kind='stable')
+        dates, values = dates[order], values[order]
+        duplicate = np.flatnonzero(dates[1:] == dates[:-1])
+        if duplicate.size:
+            raise ValueError(f"{path}: date {dates[duplicate[0]]} appears more than once")
+        return dates, currencies, values
+
+    @staticmethod
+    def _latest_rows(rates):
+        """Row of the last published rate on or before each row, per currency (forward fill of row numbers)."""
+        rows = np.where(np.isnan(rates), -1, np.arange(len(rates))[:, None])
+        return np.maximum.accumulate(rows, axis=0).astype(np.int32)
+
+    def currency_codes(self, currencies):
+        """Column index of each currency label."""
+        labels, inverse = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+        unknown = [c for c in labels.tolist() if c not in self._index]
+        if unknown:
+            raise ValueError(f"No rates for currency {unknown[0]!r}")
+        return np.array([self._index[c] for c in labels.tolist()], dtype=np.intp)[inverse].reshape(np.shape(currencies))
+
+    def spot(self, currencies, dates):
+        """Latest rate published on or before each date."""
+        codes, dates = np.broadcast_arrays(self.currency_codes(currencies), _as_dates(dates))
+        i = np.searchsorted(self.dates, dates, side='right') - 1
+        rows = np.where(i >= 0, self.latest[np.maximum(i, 0), codes], -1)
+        if np.any(rows < 0):
+            k = np.flatnonzero(rows.reshape(-1) < 0)[0]
+            raise ValueError(f"No {self.currencies[codes.flat[k]]} rate on or before {dates.flat[k]}")
+        return self.rates[rows, codes]
+
+    def period_averages(self, period='M'):
+        """(period ids, periods x currencies mean rates) for every period in the table; cached."""
+        if period not in self._averages:
+            ids = _period_ids(self.dates, period)
+            starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+            published = ~np.isnan(self.rates)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = (np.add.reduceat(np.where(published, self.rates, 0.0), starts, axis=0)
+                         / np.add.reduceat(published, starts, axis=0))
+            self._averages[period] = (ids[starts], means)
+        return self._averages[period]
+
+    def average(self, currencies, dates, period='M'):
+        """Mean rate over the calendar period (M, Q or Y) containing each date."""
+        codes, dates = np.broadcast_arrays(self.currency_codes(currencies), _as_dates(dates))
+        ids, means = self.period_averages(period)
+        wanted = _period_ids(dates, period)
+        i = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+        rate = np.where(ids[i] == wanted, means[i, codes], np.nan)
+        if np.any(np.isnan(rate)):
+            k = np.flatnonzero(np.isnan(rate).reshape(-1))[0]
+            raise ValueError(f"No {self.currencies[codes.flat[k]]} rates in the {period} period of {dates.flat[k]}")
+        return rate
+
+    def rate(self, currencies, dates, method='average', period='M'):
+        """Conversion rate per row: the period average (default) or the spot rate."""
+        if method == 'spot':
+            return self.spot(currencies, dates)
+        if method == 'average':
+            return self.average(currencies, dates, period)
+        raise ValueError(f"method must be one of {METHODS} (got {method!r})")
+
+
+def _ppp_factors(ppp, currencies):
+    labels, inverse = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+    missing = [c for c in labels.tolist() if c not in ppp]
+    if missing:
+        raise ValueError(f"No PPP factor for currency {missing[0]!r}")
+    return np.array([ppp[c] for c in labels.tolist()], dtype=float)[inverse].reshape(np.shape(currencies))
+
+
+def convert(amounts, currencies, dates, rates, method='average', period='M', ppp=None):
+    """(amounts in the base currency, rate per row); ppp maps currency -> PPP factor."""
+    rate = rates.rate(currencies, dates, method, period)
+    if ppp is not None:
+        rate = rate * _ppp_factors(ppp, currencies)
+    return np.asarray(amounts, dtype=float) * rate, rate
+
+
+def convert_inputs(inputs, currencies, dates, rates, method='average', period='M', ppp=None,
+                   revenue_currencies=None):
+    """calculate_tcd_v4_batch arguments with P in the base currency, and the rate used per row.
+
+    inputs is the keyword dict (P, N, drivers, phi, rho, BV) with P in each
+    row's currency. BV stays as given unless revenue_currencies differ
+    from currencies, in which case it is rescaled by the ratio of the two
+    rates.
+    """
+    out = dict(inputs)
+    out['P'], rate = convert(inputs['P'], currencies, dates, rates, method, period, ppp)
+    if revenue_currencies is not None:
+        _, revenue_rate = convert(1.0, revenue_currencies, dates, rates, method, period, ppp)
+        out['BV'] = np.asarray(inputs['BV'], dtype=float) * (revenue_rate / rate)
+    return out, rate
@@ -0,0 +1,163 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Reference Implementation
+=================================================================
+
+Pure scalar implementation of the v4.0 Total Cost of Dysfunction (TCD)
+formula proven in symbolic_proofs.py.
+
+Importing this module has no side effects and pulls in nothing heavier than
+the standard library; NumPy is only loaded the first time the sigmoid
+engagement coefficient is evaluated.
+"""
+
+from .sigmoid import SIGMOID_MODES, sigmoid_e_coef_table
+
+DRIVERS = ['communication', 'trust', 'psych_safety', 'goal_clarity', 'coordination', 'tms', 'team_cognition']
+
+RESULT_KEYS = ['TCD', 'C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'subtotal',
+               'M_4C', 'phi', 'eta', 'G', 'E', 'E_coef', 'anomaly_score']
+
+# FIX V8 industry factors (φ) by classification
+INDUSTRY_FACTORS = {
+    'Technology': 1.20,
+    'Healthcare': 1.30,
+    'Financial Services': 1.25,
+    'Professional Services': 1.15,
+    'Manufacturing': 1.00,
+    'Retail': 0.90,
+    'Government': 0.85,
+}
+
+# FIX V6 expected driver correlations (symbolic_proofs.py): (driver, driver, minimum r)
+V6_CORRELATIONS = [
+    ('trust', 'psych_safety', 0.6),
+    ('communication', 'coordination', 0.5),
+    ('goal_clarity', 'team_cognition', 0.4),
+    ('trust', 'communication', 0.4),
+    ('psych_safety', 'communication', 0.5),
+]
+
+
+def clamp(x, a, b):
+    return max(a, min(x, b))
+
+
+def sigmoid_e_coef(E, mode='exact'):
+    if mode == 'table':
+        return sigmoid_e_coef_table(E)
+    if mode != 'exact':
+        raise ValueError(f"mode must be one of {SIGMOID_MODES}, got {mode!r}")
+    # np.exp (not math.exp) so scalar and batch results agree to the last bit
+    import numpy as np
+    return 0.18 / (1 + np.exp(2 * (E - 4)))
+
+
+def team_size_factor(N):
+    if N < 5:
+        return 1.2
+    elif N <= 12:
+        return 1.0
+    else:
+        return 1 + 0.02 * (N - 12)
+
+
+def calculate_anomaly_score(drivers):
+    """Calculate anomaly score for gaming detection."""
+    correlations = [
+        ('trust', 'psych_safety', 1.5),
+        ('communication', 'coordination', 2.0),
+        ('goal_clarity', 'team_cognition', 2.5),
+    ]
+    total = 0
+    for d1, d2, tol in correlations:
+        diff = abs(drivers[d1] - drivers[d2])
+        total += max(0, diff - tol)
+    return total
+
+
+def gaming_penalty(anomaly_score):
+    return min(1.5, 1 + 0.1 * max(0, anomaly_score - 1.5))
+
+
+def calculate_tcd_v4(P, N, drivers, phi, rho, BV, precision='float', sigmoid='exact'):
+    """Calculate TCD using v4.0 formula with all fixes.
+
+    precision='decimal' or 'mpmath' evaluates the formula exactly (FIX V5)
+    and returns Decimal values with cent-rounded costs; see tcd.precision.
+    sigmoid='table' takes E_coef from the lookup table in tcd.sigmoid (about
+    10% faster per call).
+    """
+    if precision != 'float':
+        from .precision import calculate_tcd_v4_exact
+        return calculate_tcd_v4_exact(P, N, drivers, phi, rho, BV, precision)
+
+    # Input validation
+    if P <= 0:
+        raise ValueError("Payroll must be positive")
+    if N < 1:
+        raise ValueError("Team size must be at least 1")
+
+    # Sanitize driver scores
+    d = {k: clamp(v, 1, 7) for k, v in drivers.items()}
+
+    # Sanitize other inputs
+    phi = clamp(phi, 0.7, 1.4)
+    rho = clamp(rho, 0.8, 1.3)
+    BV = clamp(BV, 1, 10)
+
+    # Calculate derived values
+    S_bar = P / N
+
+    # Readiness score
+    avg_d = sum(d.values()) / 7
+    R = (avg_d - 1) / 6
+
+    # Cost components
+    C1 = P * 0.25 * (1 - R)
+
+    Q_adj = ((7 - d['communication']) + (7 - d['team_cognition'])) / 12
+    C2 = P * 0.10 * Q_adj
+
+    T_adj = ((7 - d['trust']) + (7 - d['psych_safety'])) / 12 * rho
+    C3 = N * S_bar * 0.21 * T_adj
+
+    O_adj = ((7 - d['coordination']) + (7 - d['goal_clarity'])) / 12
+    C4 = P * 0.15 * O_adj * BV
+
+    H_adj = ((7 - d['tms']) + (7 - d['communication'])) / 12
+    C5 = P * 0.12 * H_adj
+
+    # Continuous engagement coefficient
+    E = (d['trust'] + d['psych_safety']) / 2
+    E_coef = sigmoid_e_coef(E, sigmoid)
+    E_adj = (7 - E) / 6
+    C6 = P * E_coef * E_adj
+
+    # Subtotal with overlap discount
+    subtotal = (C1 + C2 + C3 + C4 + C5 + C6) * 0.88
+
+    # 4 C's multiplier
+    criteria = (d['team_cognition'] + d['goal_clarity'] + d['coordination']) / 3
+    commitment = (d['team_cognition'] + d['trust'] + d['goal_clarity']) / 3
+    collaboration = (d['tms'] + d['trust'] + d['psych_safety'] + d['coordination'] + d['communication']) / 5
+    change = (d['goal_clarity'] + d['coordination']) / 2
+    C_bar = (criteria + commitment + collaboration + change) / 4
+    M_4C = 1 + 0.5 * (1 - C_bar / 7)
+
+    # Correction factors
+    eta = team_size_factor(N)
+    anomaly = calculate_anomaly_score(d)
+    G = gaming_penalty(anomaly)
+
+    # Final TCD with ceiling cap (max 350% of payroll)
+    TCD_raw = subtotal * M_4C * phi * eta * G
+    TCD = min(TCD_raw, P * 3.5)  # Cap at 350% of payroll
+
+    return {
+        'TCD': TCD,
+        'C1': C1, 'C2': C2, 'C3': C3, 'C4': C4, 'C5': C5, 'C6': C6,
+        'subtotal': subtotal,
+        'M_4C': M_4C, 'phi': phi, 'eta': eta, 'G': G,
+        'E': E, 'E_coef': E_coef,
+        'anomaly_score': anomaly
+    }
@@ -0,0 +1,165 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Rolling Assessment History
+===================================================================
+
+FIX V10 rolling average of each team's last k assessments,
+
+    D̄ⱼ = (Σᵢ wᵢ × Dⱼ,ᵢ) / (Σᵢ wᵢ),   w = 0.5, 0.3, 0.2 (most recent first)
+
+kept in fixed-size arrays: a (teams x k x 7) ring buffer of scores, the
+ring head and fill count per team, and the current (teams x 7) averages.
+
+    history = DriverHistory(n_teams=2_000_000, path='history/')   # memory-mapped
+    history.submit_batch(team_ids, scores)                        # one assessment per row
+    result = calculate_tcd_v4(P, N, history.drivers(team), phi, rho, BV)
+    batch = calculate_tcd_v4_batch(P, N, history.drivers_batch(team_ids), phi, rho, BV)
+    history = DriverHistory.open('history/')                      # after a restart
+
+Teams are dense integer ids 0..n_teams-1. A submission writes one ring
+slot and recomputes that team's average from its k slots, so an update
+costs O(k) regardless of portfolio size. Until a team has k assessments the
+weights of the ones it has are renormalized (the Σᵢ wᵢ denominator). Scores
+are clamped to [1, 7] on submission, as the formula clamps them, so one
+out-of-range entry cannot skew the average.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .batch import _clamp_batch
+from .formula import DRIVERS, clamp
+
+ROLLING_WEIGHTS = (0.5, 0.3, 0.2)
+
+_ARRAYS = ('scores', 'head', 'count', 'average')
+
+
+class DriverHistory:
+    """Last len(weights) assessments per team and their FIX V10 weighted average.
+
+    With path set the arrays are .npy files memory-mapped from that
+    directory (created if needed); a directory that already holds a history
+    raises FileExistsError; reopen it with DriverHistory.open.
+    Memory is (k + 1) × 7 × 8 + 8 bytes per team: 232 MB per million teams
+    at k = 3.
+    """
+
+    def __init__(self, n_teams, weights=ROLLING_WEIGHTS, path=None):
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 1 or len(weights) < 1 or np.any(weights <= 0):
+            raise ValueError("weights must be a non-empty sequence of positive numbers")
+        if n_teams < 1:
+            raise ValueError("n_teams must be at least 1")
+        self.weights = weights
+        self.path = path
+        k = len(weights)
+        shapes = {
+            'scores': ((n_teams, k, len(DRIVERS)), np.float64),
+            'head': ((n_teams,), np.int32),
+            'count': ((n_teams,), np.int32),
+            'average': ((n_teams, len(DRIVERS)), np.float64),
+        }
+        if path is None:
+            arrays = {name: np.zeros(shape, dtype) for name, (shape, dtype) in shapes.items()}
+        else:
+            if os.path.exists(os.path.join(path, 'history.json')):
+                raise FileExistsError(f"{path} already holds a history; reopen it with "
+                                      f"DriverHistory.open({path!r}) or remove it to start over")
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, 'history.json'), 'x') as f:
+                json.dump({'weights': weights.tolist(), 'drivers': DRIVERS}, f)
+            arrays = {name: np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), 'w+', dtype, shape)
+                      for name, (shape, dtype) in shapes.items()}
+        self._set_arrays(arrays)
+
+    def _set_arrays(self, arrays):
+        self.scores, self.head, self.count, self.average = (arrays[name] for name in _ARRAYS)
+        self.n_teams = len(self.head)
+
+    @classmethod
+    def open(cls, path, mode='r+'):
+        """Reopen a memory-mapped history (mode 'r' for read-only)."""
+        with open(os.path.join(path, 'history.json')) as f:
+            meta = json.load(f)
+        if meta['drivers'] != DRIVERS:
+            raise ValueError(f"History at {path} was written for drivers {meta['drivers']}")
+        history = object.__new__(cls)
+        history.weights = np.asarray(meta['weights'])
+        history.path = path
+        history._set_arrays({name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in _ARRAYS})
+        return history
+
+    def _check_teams(self, teams):
+        teams = np.asarray(teams)
+        if teams.size and (teams.min() < 0 or teams.max() >= self.n_teams):
+            raise ValueError(f"Team ids must be in [0, {self.n_teams})")
+        return teams
+
+    def _refresh(self, teams):
+        """Recompute the averages of teams (unique ids) from their ring slots."""
+        k = len(self.weights)
+        head, count = self.head[teams], self.count[teams]
+        # Most recent first; slots a team has not filled yet get weight 0
+        total = weight = 0.0
+        for i in range(k):
+            w = np.where(i < count, self.weights[i], 0.0)
+            total = total + w[:, None] * self.scores[teams, (head - 1 - i) % k]
+            weight = weight + w
+        self.average[teams] = total / weight[:, None]
+
+    def submit(self, team, drivers):
+        """Record one assessment (a mapping of the seven drivers) for team."""
+        if not 0 <= team < self.n_teams:
+            raise ValueError(f"Team ids must be in [0, {self.n_teams})")
+        slot = int(self.head[team])
+        self.scores[team, slot] = [clamp(drivers[k], 1, 7) for k in DRIVERS]
+        self.head[team] = (slot + 1) % len(self.weights)
+        count = self.count[team] = min(int(self.count[team]) + 1, len(self.weights))
+        total = weight = 0.0
+        for i in range(count):
+            total = total + self.weights[i] * self.scores[team, (slot - i) % len(self.weights)]
+            weight = weight + self.weights[i]
+        self.average[team] = total / weight
+
+    def submit_batch(self, teams, scores):
+        """Record one assessment per row: teams is an id array, scores maps each driver to an array.
+
+        A team listed several times gets its assessments in row order.
+        """
+        teams = self._check_teams(teams).astype(np.intp).reshape(-1)
+        values = np.column_stack([_clamp_batch(np.asarray(scores[k], dtype=float).reshape(-1), 1, 7)
+                                  for k in DRIVERS])
+        remaining = np.arange(len(teams))
+        while remaining.size:
+            # First pending row of each team this round; later duplicates wait a round
+            _, first = np.unique(teams[remaining], return_index=True)
+            rows, remaining = remaining[first], np.delete(remaining, first)
+            t = teams[rows]
+            self.scores[t, self.head[t]] = values[rows]
+            self.head[t] = (self.head[t] + 1) % len(self.weights)
+            self.count[t] = np.minimum(self.count[t] + 1, len(self.weights))
+            self._refresh(t)
+
+    def drivers(self, team):
+        """Rolling-average drivers of one team, as calculate_tcd_v4 takes them."""
+        if self.count[team] == 0:
+            raise ValueError(f"Team {team} has no assessments")
+        return dict(zip(DRIVERS, self.average[team].tolist()))
+
+    def drivers_batch(self, teams=None):
+        """Rolling-average driver columns for calculate_tcd_v4_batch (all teams when teams is None)."""
+        teams = np.arange(self.n_teams) if teams is None else self._check_teams(teams)
+        empty = np.reshape(teams, -1)[np.reshape(self.count[teams] == 0, -1)]
+        if empty.size:
+            raise ValueError(f"Team {int(empty[0])} has no assessments")
+        average = self.average[teams]
+        return {k: average[..., j] for j, k in enumerate(DRIVERS)}
+
+    def flush(self):
+        """Write memory-mapped arrays to disk."""
+        for name in _ARRAYS:
+            array = getattr(self, name)
+            if isinstance(array, np.memmap):
+                array.flush()
@@ -0,0 +1,256 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Likert Lattice Verifier
+================================================================
+
+Exhaustive check of the v4 invariants on every point of the driver lattice
+{1, 1 + step, ..., 7}^7 (step 0.25 is 25^7, about 6.1e9 points) for one
+setting of P, N, phi, rho and BV:
+
+    python -m tcd.lattice --step 0.25 --workers 8 --checkpoint lattice.json
+    python -m tcd.lattice --step 0.25 --workers 8 --checkpoint lattice.json --resume
+
+Checked at every point:
+- boundedness: TCD is finite and 0 <= TCD <= 3.5 P
+- the largest TCD / P ratio, and where it occurs
+- monotonicity: raising any one driver by one step never raises TCD; every
+  violation is counted, the worst is reported, and violations where the
+  gaming penalty G did not rise are counted separately (there should be none)
+
+The lattice is cut into chunks that fix the leading drivers; the trailing
+drivers form a dense block scored with calculate_tcd_v4_batch, so
+neighbours along trailing drivers are array differences and each leading
+driver costs one more block evaluation. Chunks run on a process pool and
+merge in chunk order, so the report is identical for any worker count. A
+JSON checkpoint with the merged report is written as chunks complete.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from .batch import calculate_tcd_v4_batch
+from .formula import DRIVERS
+
+DEFAULT_STEP = 0.5
+DEFAULT_CHUNK_POINTS = 1 << 20
+CHECKPOINT_INTERVAL = 30.0
+
+# Trailing-driver grid per (levels, lead), built once per process
+_TAIL = {}
+
+
+def lattice_levels(step):
+    """Driver values 1, 1 + step, ..., 7; step must divide 6."""
+    count = 6 / step
+    if step <= 0 or abs(count - round(count)) > 1e-9:
+        raise ValueError(f"step must divide 6 (got {step})")
+    return np.linspace(1, 7, round(count) + 1)
+
+
+def chunk_layout(levels, chunk_points=DEFAULT_CHUNK_POINTS):
+    """(lead, chunks): leading drivers fixed per chunk so a chunk holds at most chunk_points points."""
+    lead = 0
+    while lead < len(DRIVERS) and levels ** (len(DRIVERS) - lead) > chunk_points:
+        lead += 1
+    return lead, levels ** lead
+
+
+def _tail(levels, lead):
+    key = (levels, lead)
+    if key not in _TAIL:
+        _TAIL[key] = np.indices((levels,) * (len(DRIVERS) - lead)).reshape(len(DRIVERS) - lead, -1)
+    return _TAIL[key]
+
+
+def _score(values, prefix, tail, setting):
+    """TCD and G for the block with leading driver indices prefix."""
+    drivers = {k: values[i] for k, i in zip(DRIVERS, prefix)}
+    drivers.update({k: values[idx] for k, idx in zip(DRIVERS[len(prefix):], tail)})
+    result = calculate_tcd_v4_batch(setting['P'], setting['N'], drivers,
+                                    setting['phi'], setting['rho'], setting['BV'])
+    return result['TCD'], result['G']
+
+
+def empty_report():
+    return {
+        'points': 0,
+        'bound_failures': 0,
+        'first_bound_failure': None,
+        'max_ratio': -math.inf,
+        'max_ratio_point': None,
+        'violations': 0,
+        'violations_without_gaming': 0,
+        'worst_violation': None,
+        'worst_violation_without_gaming': None,
+    }
+
+
+def merge_reports(a, b):
+    """Combine reports of disjoint lattice parts; a's point wins ties (a comes first)."""
+    out = dict(a)
+    for key in ('points', 'bound_failures', 'violations', 'violations_without_gaming'):
+        out[key] = a[key] + b[key]
+    if a['first_bound_failure'] is None:
+        out['first_bound_failure'] = b['first_bound_failure']
+    if b['max_ratio'] > a['max_ratio']:
+        out['max_ratio'], out['max_ratio_point'] = b['max_ratio'], b['max_ratio_point']
+    for key in ('worst_violation', 'worst_violation_without_gaming'):
+        if b[key] is not None and (a[key] is None or b[key]['increase'] > a[key]['increase']):
+            out[key] = b[key]
+    return out
+
+
+def _point(values, digits):
+    return {k: float(values[i]) for k, i in zip(DRIVERS, digits)}
+
+
+def check_chunk(chunk, step, setting, chunk_points=DEFAULT_CHUNK_POINTS):
+    """Report for one chunk of the lattice (see chunk_layout)."""
+    values = lattice_levels(step)
+    levels = len(values)
+    lead, _ = chunk_layout(levels, chunk_points)
+    prefix = np.unravel_index(chunk, (levels,) * lead) if lead else ()
+    prefix = tuple(int(i) for i in prefix)
+    shape = (levels,) * (len(DRIVERS) - lead)
+    tail = _tail(levels, lead)
+
+    TCD, G = _score(values, prefix, tail, setting)
+    report = empty_report()
+    report['points'] = TCD.size
+
+    def digits(flat, block_shape):
+        return prefix + tuple(int(i) for i in np.unravel_index(flat, block_shape))
+
+    bad = ~(np.isfinite(TCD) & (TCD >= 0) & (TCD <= 3.5 * setting['P']))
+    report['bound_failures'] = int(bad.sum())
+    if bad.any():
+        report['first_bound_failure'] = _point(values, digits(int(np.argmax(bad)), shape))
+    i = int(np.argmax(TCD))
+    report['max_ratio'] = float(TCD[i] / setting['P'])
+    report['max_ratio_point'] = _point(values, digits(i, shape))
+
+    # Raising driver j by one step: TCD(up) - TCD(point) for every point with an up neighbour
+    TCD, G = TCD.reshape(shape), G.reshape(shape)
+    for j, driver in enumerate(DRIVERS):
+        if j < lead:
+            if prefix[j] == levels - 1:
+                continue
+            up = prefix[:j] + (prefix[j] + 1,) + prefix[j + 1:]
+            TCD_up, G_up = (a.reshape(shape) for a in _score(values, up, tail, setting))
+            increase, gaming = TCD_up - TCD, G_up > G
+            at = lambda flat: digits(flat, shape)
+        else:
+            increase = np.diff(TCD, axis=j - lead)
+            gaming = np.diff(G, axis=j - lead) > 0
+            at = lambda flat, s=increase.shape: digits(flat, s)
+        violated = increase > 0
+        honest = violated & ~gaming
+        report['violations'] += int(violated.sum())
+        report['violations_without_gaming'] += int(honest.sum())
+        for key, mask in (('worst_violation', violated), ('worst_violation_without_gaming', honest)):
+            if mask.any():
+                flat = int(np.argmax(np.where(mask, increase, -np.inf)))
+                worst = {'increase': float(increase.flat[flat]), 'driver': driver, 'point': _point(values, at(flat))}
+                if report[key] is None or worst['increase'] > report[key]['increase']:
+                    report[key] = worst
+    return report
+
+
+def _check(args):
+    return check_chunk(*args)
+
+
+def _save_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def verify_lattice(step=DEFAULT_STEP, P=1_000_000, N=10, phi=1.4, rho=1.3, BV=10, workers=1,
+                   chunk_points=DEFAULT_CHUNK_POINTS, checkpoint=None, resume=False, progress=sys.stderr):
+    """Check every lattice point for one (P, N, phi, rho, BV) setting.
+
+    Returns the merged report: points, bound_failures (and the first one),
+    max_ratio (TCD / P) and its point, violations and
+    violations_without_gaming, and the worst violation of each kind as
+    {'increase': dollars, 'driver', 'point'}. With checkpoint set, progress
+    is saved there; resume=True continues a run with the same settings, or
+    starts from the first chunk if no checkpoint was written yet (a run
+    stopped before its first save).
+    """
+    setting = {'P': float(P), 'N': N, 'phi': float(phi), 'rho': float(rho), 'BV': float(BV)}
+    levels = len(lattice_levels(step))
+    lead, chunks = chunk_layout(levels, chunk_points)
+    config = {'step': step, 'chunk_points': chunk_points, **setting}
+
+    report, start = empty_report(), 0
+    if resume and not checkpoint:
+        raise ValueError("resume=True needs a checkpoint path")
+    if resume and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state['config'] != config:
+            raise ValueError(f"Checkpoint {checkpoint} was written for a different lattice or setting")
+        report, start = state['report'], state['next_chunk']
+
+    total = levels ** len(DRIVERS)
+    started, saved = time.perf_counter(), time.perf_counter()
+    done_before = report['points']
+    tasks = ((c, step, setting, chunk_points) for c in range(start, chunks))
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap(_check, tasks) if pool else map(_check, tasks)
+        for chunk, part in enumerate(results, start):
+            report = merge_reports(report, part)
+            now = time.perf_counter()
+            if checkpoint and (now - saved >= CHECKPOINT_INTERVAL or chunk == chunks - 1):
+                _save_checkpoint(checkpoint, {'config': config, 'next_chunk': chunk + 1, 'report': report})
+                saved = now
+            if progress is not None:
+                rate = (report['points'] - done_before) / max(now - started, 1e-9)
+                eta = (total - report['points']) / max(rate, 1e-9)
+                progress.write(f"\r  {report['points']:,}/{total:,} points ({rate:,.0f} points/s, ETA {eta:,.0f} s)")
+                progress.flush()
+    finally:
+        if pool:
+            pool.terminate()
+    if progress is not None:
+        progress.write("\n")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.lattice', description=__doc__.split('\n\n')[1])
+    parser.add_argument('--step', type=float, default=DEFAULT_STEP, help="lattice step (must divide 6)")
+    parser.add_argument('--payroll', type=float, default=1_000_000, help="P")
+    parser.add_argument('--team-size', type=int, default=10, help="N")
+    parser.add_argument('--phi', type=float, default=1.4, help="industry factor")
+    parser.add_argument('--rho', type=float, default=1.3, help="turnover multiplier")
+    parser.add_argument('--bv', type=float, default=10, help="business value ratio")
+    parser.add_argument('--workers', type=int, default=1, help="processes")
+    parser.add_argument('--chunk-points', type=int, default=DEFAULT_CHUNK_POINTS, help="points per chunk")
+    parser.add_argument('--checkpoint', help="JSON checkpoint path")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue from --checkpoint (from scratch if it does not exist yet)")
+    parser.add_argument('--quiet', action='store_true', help="no progress report")
+    args = parser.parse_args(argv)
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+
+    report = verify_lattice(args.step, args.payroll, args.team_size, args.phi, args.rho, args.bv,
+                            args.workers, args.chunk_points, args.checkpoint, args.resume,
+                            progress=None if args.quiet else sys.stderr)
+    print(json.dumps(report, indent=2))
+    if report['bound_failures'] or report['violations_without_gaming']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
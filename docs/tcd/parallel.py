@@ -0,0 +1,250 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Sharded Parallel Scoring
+=================================================================
+
+Scores a portfolio on a process pool, one fixed-size row-range shard per
+task. Shard inputs and results travel as float64 matrices in
+multiprocessing.shared_memory blocks, so only shard descriptors are pickled.
+
+Calibration factors (tcd.calibration) travel as extra rows of the input
+matrix, one per calibrated component.
+
+Each shard's Monte Carlo CI is seeded from (seed, shard index) and shards
+are merged in index order, so the output depends on the seed and the shard
+size but is byte-identical for any number of workers.
+
+    python -m tcd.parallel --teams 200000 --workers 1 2 4 8 16 32
+"""
+
+import argparse
+import collections
+import hashlib
+import multiprocessing
+import os
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .batch import COMPONENTS, calculate_tcd_v4_batch, random_portfolio
+from .formula import DRIVERS, RESULT_KEYS
+
+INPUT_COLUMNS = ['P', 'N', *DRIVERS, 'phi', 'rho', 'BV']
+CI_KEYS = ['TCD_low', 'TCD_high', 'TCD_mean']
+DEFAULT_SHARD_SIZE = 65_536
+
+
+def output_keys(ci=None):
+    return RESULT_KEYS + CI_KEYS if ci else list(RESULT_KEYS)
+
+
+def shard_seed(seed, shard):
+    """Independent, reproducible CI seed for one shard."""
+    return int(np.random.SeedSequence(seed, spawn_key=(shard,)).generate_state(1)[0])
+
+
+def calibrated_components(calibration):
+    """Components with a κ row in the packed matrix, in COMPONENTS order."""
+    return tuple(c for c in COMPONENTS if c in calibration) if calibration else ()
+
+
+def pack_inputs(P, N, drivers, phi, rho, BV, calibration=None, out=None):
+    """Stack calculate_tcd_v4_batch arguments into a (len(INPUT_COLUMNS) + κ rows, n) matrix.
+
+    calibration adds one row per component in calibrated_components order.
+    """
+    kappa = [calibration[c] for c in calibrated_components(calibration)]
+    columns = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in
+                                    [P, N] + [drivers[k] for k in DRIVERS] + [phi, rho, BV] + kappa])
+    if out is None:
+        out = np.empty((len(columns), columns[0].size))
+    for row, column in zip(out, columns):
+        row[:] = column
+    return out
+
+
+def unpack_inputs(matrix, calibrated=()):
+    """Inverse of pack_inputs: calculate_tcd_v4_batch keyword arguments (views).
+
+    calibrated names the components of the κ rows after INPUT_COLUMNS.
+    """
+    columns = dict(zip(INPUT_COLUMNS, matrix))
+    kwargs = {
+        'P': columns['P'],
+        'N': columns['N'],
+        'drivers': {k: columns[k] for k in DRIVERS},
+        'phi': columns['phi'],
+        'rho': columns['rho'],
+        'BV': columns['BV'],
+    }
+    if calibrated:
+        kwargs['calibration'] = dict(zip(calibrated, matrix[len(INPUT_COLUMNS):]))
+    return kwargs
+
+
+def score_matrix(inputs, ci=None, seed=42, out=None, calibrated=()):
+    """Score a packed input matrix into a (len(output_keys(ci)), n) matrix.
+
+    ci is None or a dict of tcd_confidence_intervals_batch options
+    (n_samples, confidence, method); the interval columns use seed as is.
+    calibrated names the κ rows of the matrix (see pack_inputs).
+    """
+    kwargs = unpack_inputs(inputs, calibrated)
+    result = calculate_tcd_v4_batch(**kwargs)
+    if out is None:
+        out = np.empty((len(output_keys(ci)), inputs.shape[1]))
+    for row, k in zip(out, RESULT_KEYS):
+        row[:] = result[k]
+    if ci:
+        from .ci import (_percentile_bounds, analytic_interval, draw_coefficients, portfolio_percentiles,
+                         tcd_linear_terms_batch)
+
+        terms = tcd_linear_terms_batch(kwargs['P'], result)
+        method = ci.get('method', 'random')
+        confidence = ci.get('confidence', 0.95)
+        if method == 'analytic':
+            low, high, mean = analytic_interval(*terms, confidence)
+        else:
+            coefficients = draw_coefficients(ci.get('n_samples', 10_000), seed, method)
+            (low, high), mean = portfolio_percentiles(*terms, coefficients, _percentile_bounds(confidence))
+        out[len(RESULT_KEYS):] = low, high, mean
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Shared-memory shards
+# -----------------------------------------------------------------------------
+
+def _shared_matrix(shape, name=None):
+    shm = SharedMemory(name=name, create=name is None, size=max(int(np.prod(shape)) * 8, 1))
+    return shm, np.ndarray(shape, dtype=float, buffer=shm.buf)
+
+
+def _score_shard(task):
+    """Worker entry point: score the shared input block into the shared output block."""
+    input_name, output_name, n, ci, seed, calibrated = task
+    input_shm, inputs = _shared_matrix((len(INPUT_COLUMNS) + len(calibrated), n), input_name)
+    output_shm, out = _shared_matrix((len(output_keys(ci)), n), output_name)
+    try:
+        score_matrix(inputs, ci, seed, out, calibrated)
+    finally:
+        del inputs, out
+        input_shm.close()
+        output_shm.close()
+
+
+def score_shards(shards, workers=1, ci=None, seed=42, max_pending=None, first_shard=0):
+    """Score (inputs, payload) shards in order; yields (payload, output matrix).
+
+    inputs is a calculate_tcd_v4_batch keyword dict (optionally with
+    calibration) and payload is passed through untouched. Shard i is scored with shard_seed(seed, first_shard + i)
+    (first_shard lets a resumed stream keep its numbering). With
+    workers > 1 at most max_pending (default 2 x workers) shards are held in
+    shared memory at once, so memory stays bounded for streamed input.
+    """
+    if workers <= 1:
+        for i, (inputs, payload) in enumerate(shards, first_shard):
+            calibrated = calibrated_components(inputs.get('calibration'))
+            yield payload, score_matrix(pack_inputs(**inputs), ci, shard_seed(seed, i), calibrated=calibrated)
+        return
+
+    max_pending = max_pending or 2 * workers
+    pending = collections.deque()
+
+    def release(blocks):
+        for shm, array in blocks:
+            del array
+            shm.close()
+            shm.unlink()
+
+    def collect():
+        result, payload, blocks = pending.popleft()
+        try:
+            result.get()
+            return payload, blocks[1][1].copy()
+        finally:
+            release(blocks)
+
+    # Workers must share the parent's tracker, or each one would try to
+    # clean up the blocks it attached to when it exits
+    resource_tracker.ensure_running()
+    with multiprocessing.Pool(workers) as pool:
+        try:
+            for i, (inputs, payload) in enumerate(shards, first_shard):
+                columns = pack_inputs(**inputs)
+                calibrated = calibrated_components(inputs.get('calibration'))
+                input_block = _shared_matrix(columns.shape)
+                input_block[1][:] = columns
+                output_block = _shared_matrix((len(output_keys(ci)), columns.shape[1]))
+                task = (input_block[0].name, output_block[0].name, columns.shape[1], ci, shard_seed(seed, i),
+                        calibrated)
+                pending.append((pool.apply_async(_score_shard, (task,)), payload, [input_block, output_block]))
+                if len(pending) >= max_pending:
+                    yield collect()
+            while pending:
+                yield collect()
+        finally:
+            pool.terminate()
+            while pending:
+                release(pending.popleft()[2])
+
+
+def score_portfolio(P, N, drivers, phi, rho, BV, workers=1, shard_size=DEFAULT_SHARD_SIZE, ci=None, seed=42):
+    """Score an in-memory portfolio with score_shards; returns columnar arrays."""
+    columns = pack_inputs(P, N, drivers, phi, rho, BV)
+    n = columns.shape[1]
+    shards = ((unpack_inputs(columns[:, s:s + shard_size]), s) for s in range(0, n, shard_size))
+    out = np.empty((len(output_keys(ci)), n))
+    for start, scored in score_shards(shards, workers, ci, seed):
+        out[:, start:start + scored.shape[1]] = scored
+    return dict(zip(output_keys(ci), out))
+
+
+# -----------------------------------------------------------------------------
+# Scaling benchmark
+# -----------------------------------------------------------------------------
+
+def scaling_benchmark(n_teams=200_000, workers=(1, 2, 4, 8, 16, 32), shard_size=DEFAULT_SHARD_SIZE,
+                      ci=None, seed=42):
+    """Time score_portfolio for each worker count on a fixed-seed portfolio.
+
+    Returns one row per worker count with seconds, teams/s, speedup over the
+    first entry and the SHA-256 of the output bytes; raises if any worker
+    count produces different bytes.
+    """
+    portfolio = random_portfolio(n_teams, seed=0)
+    rows = []
+    for w in workers:
+        start = time.perf_counter()
+        result = score_portfolio(**portfolio, workers=w, shard_size=shard_size, ci=ci, seed=seed)
+        seconds = time.perf_counter() - start
+        digest = hashlib.sha256(np.stack(list(result.values())).tobytes()).hexdigest()
+        rows.append({'workers': w, 'seconds': seconds, 'teams_per_s': n_teams / seconds,
+                     'speedup': rows[0]['seconds'] / seconds if rows else 1.0, 'sha256': digest})
+    if len({row['sha256'] for row in rows}) > 1:
+        raise RuntimeError("Sharded output differs between worker counts")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.parallel',
+                                     description="Scaling benchmark for sharded parallel scoring.")
+    parser.add_argument('--teams', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--ci-samples', type=int, default=2_000,
+                        help="Monte Carlo samples per team (0 = point estimates only)")
+    args = parser.parse_args(argv)
+
+    ci = {'n_samples': args.ci_samples} if args.ci_samples else None
+    print(f"{args.teams:,} teams, shards of {args.shard_size:,}, {os.cpu_count()} CPUs, "
+          f"CI samples: {args.ci_samples:,}")
+    print(f"{'workers':>8} {'seconds':>9} {'teams/s':>12} {'speedup':>8}")
+    for row in scaling_benchmark(args.teams, args.workers, args.shard_size, ci):
+        print(f"{row['workers']:>8} {row['seconds']:>9.2f} {row['teams_per_s']:>12,.0f} {row['speedup']:>7.2f}x")
+    print(f"Output identical for every worker count (sha256 {row['sha256'][:16]}...)")
+
+
+if __name__ == '__main__':
+    main()
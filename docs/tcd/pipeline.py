@@ -0,0 +1,454 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Streaming Scorer
+=========================================================
+
+Scores assessment exports with calculate_tcd_v4_batch, one fixed-size chunk
+at a time, so memory stays constant however large the input is.
+
+    python -m tcd.pipeline assessments.csv scores.csv
+    python -m tcd.pipeline assessments.parquet scores.parquet --chunk-size 250000
+    python -m tcd.pipeline assessments.csv scores.csv --resume
+
+Input columns: payroll, team_size, the seven driver scores (DRIVERS),
+industry (mapped through INDUSTRY_FACTORS, or give a numeric phi column),
+turnover_multiplier and revenue (BV = revenue / payroll, or give a bv
+column). Output holds the --keep columns followed by RESULT_KEYS, plus
+TCD_low/TCD_high/TCD_mean with --ci-samples (or --ci-method analytic).
+
+With --rates, payroll is in each row's currency column and is converted
+to the rate table's base currency (tcd.currency) at the rate for the row's
+date column before scoring; when BV comes from revenue, an optional
+revenue_currency column converts revenue at its own rate (a bv column is a
+ratio and is never rescaled). --ppp CUR=FACTOR multiplies each currency's
+rate by a PPP factor. The rate used is written to the fx_rate output column.
+
+With --calibration, the κ factors saved by Calibration.save (tcd.calibration)
+multiply the calibrated components (C2 and C3 by default) before the
+subtotal; --segment-column names the input column holding each row's
+calibration segment.
+
+Chunks are the shards of tcd.parallel: --workers N scores them on a process
+pool through shared memory while the main process reads and writes, and the
+output is byte-identical for any worker count.
+
+CSV is read and written with the standard library. Parquet needs pyarrow;
+Parquet output is written as a dataset directory with one part file per
+chunk. After every chunk the output is flushed and a checkpoint is saved
+next to it, so --resume continues from the last completed chunk.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .batch import validate_inputs
+from .calibration import Calibration
+from .currency import RateTable, convert_inputs
+from .formula import DRIVERS, INDUSTRY_FACTORS
+from .parallel import output_keys, score_shards
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def _is_parquet(path):
+    return path.endswith(('.parquet', '.pq'))
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet input/output requires pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+# -----------------------------------------------------------------------------
+# Readers: iterate chunks as {column: sequence}, with a resumable position
+# -----------------------------------------------------------------------------
+
+class CsvChunkReader:
+    """Reads a CSV file chunk_size records at a time; the position is a byte offset.
+
+    A quoted field may span lines: a record ends at the first line break
+    with an even number of quote characters before it (doubled quotes
+    inside a field count twice), so chunks never split a record.
+    """
+
+    def __init__(self, path, chunk_size):
+        self.chunk_size = chunk_size
+        self._file = open(path, 'rb')
+        self.columns = next(csv.reader([self._record().decode('utf-8-sig')]))
+        self._offset = self._file.tell()
+
+    def state(self):
+        return {'offset': self._offset}
+
+    def restore(self, state):
+        self._offset = state['offset']
+        self._file.seek(self._offset)
+
+    def _record(self):
+        """The next non-blank record as bytes (b'' at the end of the file)."""
+        line = self._file.readline()
+        while line and not line.strip():
+            line = self._file.readline()
+        while line.count(b'"') % 2:
+            more = self._file.readline()
+            if not more:
+                raise ValueError(f"Unterminated quoted field at the end of {self._file.name}")
+            line += more
+        return line
+
+    def __iter__(self):
+        while True:
+            records = []
+            for _ in range(self.chunk_size):
+                record = self._record()
+                if not record:
+                    break
+                records.append(record.decode('utf-8'))
+            if not records:
+                return
+            self._offset = self._file.tell()
+            yield dict(zip(self.columns, zip(*csv.reader(records))))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetChunkReader:
+    """Reads a Parquet file in record batches; the position is a row count."""
+
+    def __init__(self, path, chunk_size):
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        self.chunk_size = chunk_size
+        self._file = pq.ParquetFile(path)
+        self.columns = self._file.schema_arrow.names
+        self._rows = 0
+        self._skip = 0
+
+    def state(self):
+        return {'rows': self._rows}
+
+    def restore(self, state):
+        self._skip = self._rows = state['rows']
+
+    def __iter__(self):
+        seen = 0
+        for batch in self._file.iter_batches(batch_size=self.chunk_size):
+            seen += batch.num_rows
+            if seen <= self._skip:
+                continue
+            self._rows = seen
+            yield {name: batch.column(i).to_numpy(zero_copy_only=False)
+                   for i, name in enumerate(batch.schema.names)}
+
+    def close(self):
+        self._file.close()
+
+
+# -----------------------------------------------------------------------------
+# Writers: append scored chunks, with a state that can be rolled back to
+# -----------------------------------------------------------------------------
+
+class CsvChunkWriter:
+    """Appends chunks to a CSV file; the state is the byte length after the last chunk."""
+
+    def __init__(self, path, columns):
+        self.columns = columns
+        new = not os.path.exists(path)
+        self._file = open(path, 'wb' if new else 'r+b')
+        if new:
+            self._write_rows([columns])
+
+    def _write_rows(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        self._file.write(buffer.getvalue().encode('utf-8'))
+
+    def write(self, chunk):
+        self._write_rows(zip(*(chunk[c] for c in self.columns)))
+
+    def state(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'offset': self._file.tell()}
+
+    def restore(self, state):
+        self._file.truncate(state['offset'])
+        self._file.seek(state['offset'])
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetDatasetWriter:
+    """Writes each chunk as a part file in a dataset directory; the state is the part count."""
+
+    def __init__(self, path, columns):
+        _require_pyarrow()
+        self.columns = columns
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._parts = 0
+
+    def _part_path(self, i):
+        return os.path.join(self.path, f'part-{i:06d}.parquet')
+
+    def write(self, chunk):
+        import pyarrow
+        import pyarrow.parquet as pq
+        table = pyarrow.table({c: chunk[c] for c in self.columns})
+        pq.write_table(table, self._part_path(self._parts))
+        self._parts += 1
+
+    def state(self):
+        return {'parts': self._parts}
+
+    def restore(self, state):
+        self._parts = state['parts']
+        i = self._parts
+        while os.path.exists(self._part_path(i)):
+            os.remove(self._part_path(i))
+            i += 1
+
+    def close(self):
+        pass
+
+
+def open_reader(path, chunk_size):
+    return (ParquetChunkReader if _is_parquet(path) else CsvChunkReader)(path, chunk_size)
+
+
+def open_writer(path, columns):
+    return (ParquetDatasetWriter if _is_parquet(path) else CsvChunkWriter)(path, columns)
+
+
+# -----------------------------------------------------------------------------
+# Scoring
+# -----------------------------------------------------------------------------
+
+def _industry_factors(industries):
+    names, inverse = np.unique(np.asarray(industries, dtype=str), return_inverse=True)
+    unknown = [name for name in names if name not in INDUSTRY_FACTORS]
+    if unknown:
+        raise ValueError(f"Unknown industry {unknown[0]!r}; expected one of {sorted(INDUSTRY_FACTORS)}")
+    return np.array([INDUSTRY_FACTORS[name] for name in names])[inverse]
+
+
+def chunk_inputs(chunk):
+    """Map one raw input chunk to the calculate_tcd_v4_batch arguments."""
+    def column(name):
+        return np.asarray(chunk[name], dtype=float)
+
+    P = column('payroll')
+    phi = column('phi') if 'phi' in chunk else _industry_factors(chunk['industry'])
+    BV = column('bv') if 'bv' in chunk else column('revenue') / P
+    return {
+        'P': P,
+        'N': column('team_size'),
+        'drivers': {k: column(k) for k in DRIVERS},
+        'phi': phi,
+        'rho': column('turnover_multiplier'),
+        'BV': BV,
+    }
+
+
+def convert_chunk(chunk, inputs, rates, currency):
+    """Convert chunk_inputs output to the base currency; returns (inputs, rate per row).
+
+    Only raw amounts are converted: payroll, and revenue when BV is derived
+    from it (at the revenue_currency rate when that column is present). A
+    bv column is already a ratio, so it is left as given.
+    """
+    revenue_currency = None if 'bv' in chunk else chunk.get('revenue_currency')
+    return convert_inputs(inputs, chunk['currency'], chunk['date'], rates, currency.get('method', 'average'),
+                          currency.get('period', 'M'), currency.get('ppp'), revenue_currency)
+
+
+def checkpoint_path(output_path):
+    return output_path.rstrip('/') + '.checkpoint.json'
+
+
+def _save_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _report(progress, rows, started, done=False):
+    if progress is not None:
+        rate = rows / max(time.perf_counter() - started, 1e-9)
+        progress.write(f"\r  {rows:,} rows scored ({rate:,.0f} rows/s)" + ("\n" if done else ""))
+        progress.flush()
+
+
+def score_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, keep=None, resume=False,
+               progress=sys.stderr, workers=1, ci=None, seed=42, currency=None, calibration=None):
+    """Stream input_path through the batch formula into output_path.
+
+    keep lists input columns copied to the output (default: team_id when
+    present). ci is None or a dict of CI options (n_samples, confidence,
+    method) adding per-team interval columns; chunk i is seeded with
+    shard_seed(seed, i). workers > 1 scores chunks on a process pool.
+    currency is None or a dict with the rate CSV path ('rates') and
+    optionally 'base', 'method', 'period' and 'ppp' (see tcd.currency).
+    calibration is None or a dict with the path of a saved Calibration
+    ('path') and the input column holding each row's segment ('segment';
+    omit it for a calibration fitted without segments). With
+    resume, a checkpoint from an interrupted run restores the settings and
+    reader position and rolls the output back to the last completed chunk.
+    Returns the number of rows scored in this run.
+    """
+    ckpt_path = checkpoint_path(output_path)
+    checkpoint = None
+    if resume and os.path.exists(ckpt_path):
+        with open(ckpt_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['input'] != os.path.abspath(input_path):
+            raise ValueError(f"Checkpoint {ckpt_path} belongs to {checkpoint['input']}")
+        chunk_size, keep, ci, seed = (checkpoint[k] for k in ('chunk_size', 'keep', 'ci', 'seed'))
+        currency = checkpoint.get('currency')
+        calibration = checkpoint.get('calibration')
+    elif os.path.exists(output_path):
+        if resume:
+            raise FileExistsError(f"{output_path} exists but there is no checkpoint {ckpt_path} to resume "
+                                  f"from; remove the output to start over")
+        if os.path.exists(ckpt_path):
+            raise FileExistsError(f"{output_path} exists with a checkpoint; pass resume=True to continue it "
+                                  f"or remove both to start over")
+        raise FileExistsError(f"{output_path} exists; remove it to start over")
+
+    reader = open_reader(input_path, chunk_size)
+    if keep is None:
+        keep = [c for c in ('team_id',) if c in reader.columns]
+    rates = None
+    extra = []
+    if currency:
+        rates = RateTable.from_csv(currency['rates'], currency.get('base', 'USD'))
+        extra = ['fx_rate']
+    factors = None
+    if calibration:
+        factors = Calibration.load(calibration['path'])
+        segment = calibration.get('segment')
+        if segment is not None and segment not in reader.columns:
+            reader.close()
+            raise ValueError(f"Segment column {segment!r} not in {input_path}")
+    columns = output_keys(ci)
+    writer = open_writer(output_path, list(keep) + extra + columns)
+    total = shards = 0
+    if checkpoint:
+        reader.restore(checkpoint['reader'])
+        writer.restore(checkpoint['writer'])
+        total, shards = checkpoint['rows'], checkpoint['shards']
+
+    def chunks():
+        start = total
+        for chunk in reader:
+            passed = {c: list(chunk[c]) for c in keep}
+            try:
+                inputs = chunk_inputs(chunk)
+                if rates is not None:
+                    inputs, rate = convert_chunk(chunk, inputs, rates, currency)
+                    passed['fx_rate'] = rate.tolist()
+                if factors is not None:
+                    inputs['calibration'] = factors.factors(None if segment is None else chunk[segment])
+                validate_inputs(inputs['P'], inputs['N'])
+            except ValueError as e:
+                raise ValueError(f"{e} in the chunk starting at data row {start}") from None
+            start += len(inputs['P'])
+            yield inputs, (passed, reader.state())
+
+    rows = 0
+    started = time.perf_counter()
+    try:
+        for (scored, reader_state), out in score_shards(chunks(), workers, ci, seed, first_shard=shards):
+            scored.update(zip(columns, out.tolist()))
+            writer.write(scored)
+            rows += out.shape[1]
+            shards += 1
+            _save_checkpoint(ckpt_path, {
+                'input': os.path.abspath(input_path), 'chunk_size': chunk_size, 'keep': list(keep),
+                'ci': ci, 'seed': seed, 'currency': currency,
+                'calibration': calibration, 'rows': total + rows, 'shards': shards,
+                'reader': reader_state, 'writer': writer.state(),
+            })
+            _report(progress, rows, started)
+    finally:
+        reader.close()
+        writer.close()
+    _report(progress, rows, started, done=True)
+    if os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    return rows
+
+
+def _ppp_factors(pairs, parser):
+    """Parse --ppp CUR=FACTOR pairs into {currency: factor}."""
+    out = {}
+    for pair in pairs:
+        code, _, value = pair.partition('=')
+        try:
+            out[code.strip()] = float(value)
+        except ValueError:
+            parser.error(f"--ppp {pair}: factor must be a number")
+        if not out[code.strip()] > 0:
+            parser.error(f"--ppp {pair}: factor must be positive")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.pipeline', description=__doc__.split('\n\n')[1])
+    parser.add_argument('input', help="assessment export (.csv or .parquet)")
+    parser.add_argument('output', help="scored output (.csv file or .parquet dataset directory)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument('--keep', action='append', help="input column to copy to the output (repeatable)")
+    parser.add_argument('--resume', action='store_true', help="continue from the last checkpoint")
+    parser.add_argument('--workers', type=int, default=1, help="scoring processes (shared-memory shards)")
+    parser.add_argument('--ci-samples', type=int, default=0, help="Monte Carlo samples for per-team CIs")
+    parser.add_argument('--ci-method', choices=['random', 'antithetic', 'lhs', 'sobol', 'halton', 'analytic'],
+                        default='random', help="CI sampling method")
+    parser.add_argument('--seed', type=int, default=42, help="base seed for the CI shards")
+    parser.add_argument('--rates', help="rate table CSV (date x currency); converts payroll to its base")
+    parser.add_argument('--base', default='USD', help="base currency of --rates")
+    parser.add_argument('--rate-method', choices=['average', 'spot'], default='average',
+                        help="period-average or spot rate")
+    parser.add_argument('--rate-period', choices=['M', 'Q', 'Y'], default='M', help="averaging period")
+    parser.add_argument('--ppp', action='append', metavar='CUR=FACTOR',
+                        help="PPP factor multiplying a currency's rate (repeatable; needs one per currency)")
+    parser.add_argument('--calibration', help="calibration JSON saved by Calibration.save (tcd.calibration)")
+    parser.add_argument('--segment-column', help="input column holding each row's calibration segment")
+    parser.add_argument('--quiet', action='store_true', help="no progress report")
+    args = parser.parse_args(argv)
+
+    currency = None
+    if args.rates:
+        currency = {'rates': args.rates, 'base': args.base, 'method': args.rate_method, 'period': args.rate_period}
+        if args.ppp:
+            currency['ppp'] = _ppp_factors(args.ppp, parser)
+    elif args.ppp:
+        parser.error("--ppp needs --rates")
+    calibration = None
+    if args.calibration:
+        calibration = {'path': args.calibration, 'segment': args.segment_column}
+    elif args.segment_column:
+        parser.error("--segment-column needs --calibration")
+    ci = None
+    if args.ci_samples or args.ci_method == 'analytic':
+        ci = {'n_samples': args.ci_samples, 'method': args.ci_method}
+    score_file(args.input, args.output, args.chunk_size, args.keep, args.resume,
+               progress=None if args.quiet else sys.stderr, workers=args.workers, ci=ci, seed=args.seed,
+               currency=currency, calibration=calibration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Exact Precision Mode
+=============================================================
+
+FIX V5 applied to the whole formula: calculate_tcd_v4 evaluated in Decimal
+or mpmath arithmetic (calculate_tcd_v4(..., precision='decimal')) with the
+monetary results rounded to the cent for audited reports. The working
+precision is set in a local context, so the global mp.dps and Decimal
+context are left alone.
+
+precision_audit() checks float results against the exact formula. Float
+error grows with the size of the result, so only rows whose worst-case
+float error could exceed the tolerance are recomputed exactly; a large
+portfolio pays the high-precision cost only where it matters.
+"""
+
+import math
+from decimal import ROUND_HALF_UP, Decimal, localcontext
+
+from .formula import DRIVERS
+
+PRECISIONS = ('float', 'decimal', 'mpmath')
+
+MONEY_KEYS = ['TCD', 'C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'subtotal']
+
+CENT = Decimal('0.01')
+
+# Working precision (significant digits), as in FIX V5
+DEFAULT_DIGITS = 50
+
+# Worst-case relative error of the float formula. Its ~100 roundings and one
+# np.exp give a few hundred ulps at most; this screen allows 4,500.
+FLOAT_RELATIVE_ERROR = 1e-12
+
+
+def _clamp(x, a, b):
+    # Same result as clamp() for NaN input (the lower bound)
+    return a if x != x else max(a, min(x, b))
+
+
+def _tcd_v4_exact(P, N, drivers, phi, rho, BV, num, exp):
+    """calculate_tcd_v4 with every constant and operation in the num type."""
+    d = {k: _clamp(v, num(1), num(7)) for k, v in drivers.items()}
+    phi = _clamp(phi, num('0.7'), num('1.4'))
+    rho = _clamp(rho, num('0.8'), num('1.3'))
+    BV = _clamp(BV, num(1), num(10))
+
+    S_bar = P / N
+
+    avg_d = sum(d[k] for k in DRIVERS) / 7
+    R = (avg_d - 1) / 6
+
+    C1 = P * num('0.25') * (1 - R)
+    C2 = P * num('0.10') * ((7 - d['communication']) + (7 - d['team_cognition'])) / 12
+    T_adj = ((7 - d['trust']) + (7 - d['psych_safety'])) / 12 * rho
+    C3 = N * S_bar * num('0.21') * T_adj
+    C4 = P * num('0.15') * ((7 - d['coordination']) + (7 - d['goal_clarity'])) / 12 * BV
+    C5 = P * num('0.12') * ((7 - d['tms']) + (7 - d['communication'])) / 12
+
+    E = (d['trust'] + d['psych_safety']) / 2
+    E_coef = num('0.18') / (1 + exp(2 * (E - 4)))
+    C6 = P * E_coef * (7 - E) / 6
+
+    subtotal = (C1 + C2 + C3 + C4 + C5 + C6) * num('0.88')
+
+    criteria = (d['team_cognition'] + d['goal_clarity'] + d['coordination']) / 3
+    commitment = (d['team_cognition'] + d['trust'] + d['goal_clarity']) / 3
+    collaboration = (d['tms'] + d['trust'] + d['psych_safety'] + d['coordination'] + d['communication']) / 5
+    change = (d['goal_clarity'] + d['coordination']) / 2
+    C_bar = (criteria + commitment + collaboration + change) / 4
+    M_4C = 1 + num('0.5') * (1 - C_bar / 7)
+
+    if N < 5:
+        eta = num('1.2')
+    elif N <= 12:
+        eta = num(1)
+    else:
+        eta = 1 + num('0.02') * (N - 12)
+
+    anomaly = num(0)
+    for d1, d2, tol in [('trust', 'psych_safety', '1.5'), ('communication', 'coordination', '2.0'),
+                        ('goal_clarity', 'team_cognition', '2.5')]:
+        anomaly += max(num(0), abs(d[d1] - d[d2]) - num(tol))
+    G = min(num('1.5'), 1 + num('0.1') * max(num(0), anomaly - num('1.5')))
+
+    TCD = min(subtotal * M_4C * phi * eta * G, P * num('3.5'))
+
+    return {
+        'TCD': TCD,
+        'C1': C1, 'C2': C2, 'C3': C3, 'C4': C4, 'C5': C5, 'C6': C6,
+        'subtotal': subtotal,
+        'M_4C': M_4C, 'phi': phi, 'eta': eta, 'G': G,
+        'E': E, 'E_coef': E_coef,
+        'anomaly_score': anomaly,
+    }
+
+
+def _number(x, num):
+    # Floats enter through their shortest repr, so 0.1 means one tenth
+    return num(repr(x) if isinstance(x, float) else str(x))
+
+
+def calculate_tcd_v4_exact(P, N, drivers, phi, rho, BV, precision='decimal', digits=DEFAULT_DIGITS):
+    """calculate_tcd_v4 in Decimal or mpmath arithmetic.
+
+    Returns the same keys as calculate_tcd_v4, all as Decimal: the monetary
+    keys (MONEY_KEYS) rounded half-up to the cent, the factors at the full
+    working precision of digits significant digits.
+    """
+    if P <= 0:
+        raise ValueError("Payroll must be positive")
+    if N < 1:
+        raise ValueError("Team size must be at least 1")
+
+    if precision == 'decimal':
+        with localcontext() as ctx:
+            ctx.prec = digits
+            args = [_number(x, Decimal) for x in (P, N, phi, rho, BV)]
+            d = {k: _number(v, Decimal) for k, v in drivers.items()}
+            result = _tcd_v4_exact(*args[:2], d, *args[2:], Decimal, Decimal.exp)
+            result = {k: +v for k, v in result.items()}
+    elif precision == 'mpmath':
+        import mpmath
+        with mpmath.workdps(digits):
+            args = [_number(x, mpmath.mpf) for x in (P, N, phi, rho, BV)]
+            d = {k: _number(v, mpmath.mpf) for k, v in drivers.items()}
+            result = _tcd_v4_exact(*args[:2], d, *args[2:], mpmath.mpf, mpmath.exp)
+            result = {k: Decimal(mpmath.nstr(v, digits)) for k, v in result.items()}
+    else:
+        raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+
+    for k in MONEY_KEYS:
+        result[k] = result[k].quantize(CENT, rounding=ROUND_HALF_UP)
+    return result
+
+
+def precision_audit(P, N, drivers, phi, rho, BV, result=None, tolerance=0.01, precision='decimal',
+                    exhaustive=False):
+    """Flag rows whose float TCD differs from the exact TCD by more than tolerance.
+
+    Takes the calculate_tcd_v4_batch arguments and optionally its result.
+    Rows are recomputed exactly only when max(|TCD|, 3.5 P) x
+    FLOAT_RELATIVE_ERROR could reach tolerance (every row with
+    exhaustive=True). The float error scales with the largest intermediate,
+    and the cost components are bounded by the 350%-of-payroll cap rather
+    than by TCD itself. Returns the checked
+    and flagged row indices, the exact cent-rounded TCD of flagged rows and
+    the largest difference found.
+    """
+    import numpy as np
+
+    from .batch import calculate_tcd_v4_batch
+
+    if result is None:
+        result = calculate_tcd_v4_batch(P, N, drivers, phi, rho, BV)
+    TCD = result['TCD']
+    n = TCD.size
+    columns = [np.broadcast_to(np.asarray(v, dtype=float), n) for v in (P, N, phi, rho, BV)]
+    driver_cols = {k: np.broadcast_to(np.asarray(drivers[k], dtype=float), n) for k in DRIVERS}
+
+    if exhaustive:
+        checked = np.arange(n)
+    else:
+        scale = np.maximum(np.abs(TCD), np.abs(columns[0]) * 3.5)
+        checked = np.flatnonzero(~(scale * FLOAT_RELATIVE_ERROR < tolerance / 2))
+
+    flagged, exact_TCD = [], []
+    max_diff = Decimal(0)
+    for i in checked.tolist():
+        P_i, N_i, phi_i, rho_i, BV_i = (float(c[i]) for c in columns)
+        exact = calculate_tcd_v4_exact(P_i, N_i, {k: float(v[i]) for k, v in driver_cols.items()},
+                                       phi_i, rho_i, BV_i, precision)['TCD']
+        diff = abs(Decimal(float(TCD[i])) - exact) if math.isfinite(TCD[i]) else Decimal('Infinity')
+        max_diff = max(max_diff, diff)
+        if diff > Decimal(str(tolerance)):
+            flagged.append(i)
+            exact_TCD.append(exact)
+
+    return {
+        'checked': checked,
+        'flagged': np.array(flagged, dtype=np.intp),
+        'exact_TCD': exact_TCD,
+        'max_abs_diff': max_diff,
+        'tolerance': tolerance,
+        'precision': precision,
+    }
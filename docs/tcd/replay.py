@@ -0,0 +1,309 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Version Replay and Diff
+================================================================
+
+Reruns a stored input corpus, or the inputs recorded in an audit log,
+through two formula versions side by side and reports which teams move and
+by how much.
+
+    python -m tcd.replay assessments.csv diff.csv --set overlap=0.85 --set cap=3.0
+    python -m tcd.replay scores.audit diff.csv --set tau=0.18 --material-only
+
+    summary = replay_file('assessments.csv', 'diff.csv', candidate={'delta_1': 0.22})
+
+A version is a set of overrides of the named coefficients in
+tcd.batch.V4_COEFFICIENTS ({} is v4 itself). Both versions score each chunk
+with calculate_tcd_v4_batch, so every row is exactly what that version's
+batch formula gives, and the diff does not depend on the chunk size.
+
+Per row the diff holds TCD under both versions, the change (absolute and
+in percent of the baseline), the change in each component C1-C6, the FIX
+V15 materiality threshold max($10,000, 2% of baseline TCD) and whether the
+change reaches it. The summary counts changed and material rows (up and
+down), sums the changes, gives percentiles of |change| and |% change|
+(tcd.aggregate's mergeable log histogram, 1% relative accuracy) and lists
+the largest moves. Replaying an audit log also labels each row with the
+formula options it was recorded with, counts rows per set of options
+(recorded_variants), and, for rows recorded with exactly the baseline's
+options, counts those whose recomputed TCD differs from the TCD recorded
+at the time (baseline_mismatches); rows recorded under other options are
+counted as baseline_unchecked.
+
+Rows scored with scalar calibration factors (calculate_tcd_v4_batch
+calibration=, stored with the options) are replayed with the same factors
+under both versions, and checked against a baseline with that
+calibration. Per-row factors are only stored as a digest, so those rows
+are replayed uncalibrated, never checked, and counted as
+calibration_not_replayed.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .aggregate import HISTOGRAM_BUCKETS, _buckets, _histogram_percentiles
+from .audit import MAGIC, AuditReader, _options_json, canonical_options
+from .batch import COMPONENTS, V4_COEFFICIENTS, calculate_tcd_v4_batch
+from .formula import DRIVERS
+from .pipeline import DEFAULT_CHUNK_SIZE, chunk_inputs, open_reader, open_writer
+
+# FIX V15: material change = max($10,000, 2% of TCD)
+MATERIALITY_FLOOR = 10_000.0
+MATERIALITY_FRACTION = 0.02
+
+DIFF_KEYS = ['TCD_baseline', 'TCD_candidate', 'TCD_delta', 'TCD_delta_pct',
+             *[f'{c}_delta' for c in COMPONENTS], 'materiality_threshold', 'material']
+SUMMARY_PERCENTILES = (50, 90, 99, 100)
+DEFAULT_TOP = 10
+
+
+def materiality_threshold(TCD):
+    """FIX V15 threshold for a change in TCD: max($10,000, 2% of TCD)."""
+    return np.maximum(MATERIALITY_FLOOR, MATERIALITY_FRACTION * np.asarray(TCD, dtype=float))
+
+
+def diff_versions(inputs, baseline=None, candidate=None):
+    """Per-row DIFF_KEYS arrays for calculate_tcd_v4_batch arguments under two coefficient sets."""
+    a = calculate_tcd_v4_batch(**inputs, coefficients=baseline)
+    b = calculate_tcd_v4_batch(**inputs, coefficients=candidate)
+    delta = b['TCD'] - a['TCD']
+    threshold = materiality_threshold(a['TCD'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(a['TCD'] > 0, delta / a['TCD'] * 100, np.where(delta == 0, 0.0, np.nan))
+    diff = {'TCD_baseline': a['TCD'], 'TCD_candidate': b['TCD'], 'TCD_delta': delta, 'TCD_delta_pct': pct}
+    diff.update({f'{c}_delta': b[c] - a[c] for c in COMPONENTS})
+    diff['materiality_threshold'] = threshold
+    diff['material'] = np.abs(delta) >= threshold
+    return diff
+
+
+class ReplaySummary:
+    """Running summary of diff chunks (see the module docstring)."""
+
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.rows = self.changed = self.increased = self.decreased = 0
+        self.material = self.material_up = self.material_down = 0
+        self.baseline_mismatches = self.baseline_unchecked = self.calibration_not_replayed = None
+        self.recorded_variants = None
+        self.sums = dict.fromkeys(['TCD_baseline', 'TCD_candidate', 'TCD_delta', 'abs_delta'], 0.0)
+        self.counts = {name: np.zeros(HISTOGRAM_BUCKETS, dtype=np.int64) for name in ('abs_delta', 'abs_pct')}
+        self.largest = []           # min-heap of (|delta|, row, label, baseline, candidate)
+
+    def add(self, diff, labels=None, first_row=0):
+        """Add one diff_versions chunk; labels (e.g. team ids) name the rows in the largest moves."""
+        delta, material = diff['TCD_delta'], diff['material']
+        self.rows += len(delta)
+        self.changed += int(np.count_nonzero(delta))
+        self.increased += int(np.count_nonzero(delta > 0))
+        self.decreased += int(np.count_nonzero(delta < 0))
+        self.material += int(material.sum())
+        self.material_up += int((material & (delta > 0)).sum())
+        self.material_down += int((material & (delta < 0)).sum())
+        for name in ('TCD_baseline', 'TCD_candidate', 'TCD_delta'):
+            self.sums[name] += float(diff[name].sum())
+        abs_delta = np.abs(delta)
+        self.sums['abs_delta'] += float(abs_delta.sum())
+        self.counts['abs_delta'] += np.bincount(_buckets(abs_delta), minlength=HISTOGRAM_BUCKETS)
+        pct = np.abs(diff['TCD_delta_pct'])
+        self.counts['abs_pct'] += np.bincount(_buckets(pct[~np.isnan(pct)]), minlength=HISTOGRAM_BUCKETS)
+
+        if self.top and len(delta):
+            k = min(self.top, len(delta))
+            for i in np.argpartition(-abs_delta, k - 1)[:k].tolist():
+                if abs_delta[i] == 0:
+                    continue
+                label = None if labels is None else np.asarray(labels)[i].item()
+                item = (float(abs_delta[i]), -(first_row + i), label,
+                        float(diff['TCD_baseline'][i]), float(diff['TCD_candidate'][i]))
+                if len(self.largest) < self.top:
+                    heapq.heappush(self.largest, item)
+                elif item[:2] > self.largest[0][:2]:
+                    heapq.heapreplace(self.largest, item)
+        return self
+
+    def add_recorded(self, mismatches, unchecked, options, not_replayed=0):
+        """Count an audit log chunk's baseline mismatches, unchecked and uncalibrated rows, and rows per options."""
+        self.baseline_mismatches = (self.baseline_mismatches or 0) + mismatches
+        self.baseline_unchecked = (self.baseline_unchecked or 0) + unchecked
+        self.calibration_not_replayed = (self.calibration_not_replayed or 0) + not_replayed
+        self.recorded_variants = self.recorded_variants or {}
+        labels, counts = np.unique(np.asarray(options), return_counts=True)
+        for label, count in zip(labels.tolist(), counts.tolist()):
+            self.recorded_variants[label] = self.recorded_variants.get(label, 0) + count
+
+    def summary(self):
+        out = {
+            'rows': self.rows, 'changed': self.changed, 'increased': self.increased, 'decreased': self.decreased,
+            'material': self.material, 'material_up': self.material_up, 'material_down': self.material_down,
+            'TCD_baseline_sum': self.sums['TCD_baseline'], 'TCD_candidate_sum': self.sums['TCD_candidate'],
+            'TCD_delta_sum': self.sums['TCD_delta'],
+            'abs_delta_mean': self.sums['abs_delta'] / self.rows if self.rows else 0.0,
+        }
+        for name in ('abs_delta', 'abs_pct'):
+            if self.counts[name].sum():
+                for p, v in zip(SUMMARY_PERCENTILES,
+                                _histogram_percentiles(self.counts[name], SUMMARY_PERCENTILES)):
+                    out[f'{name}_p{p:g}'] = v
+        out['largest'] = [{'row': -row, 'label': label, 'TCD_baseline': a, 'TCD_candidate': b, 'TCD_delta': b - a}
+                          for _, row, label, a, b in sorted(self.largest, reverse=True)]
+        if self.baseline_mismatches is not None:
+            out['baseline_mismatches'] = self.baseline_mismatches
+            out['baseline_unchecked'] = self.baseline_unchecked
+            out['calibration_not_replayed'] = self.calibration_not_replayed
+            out['recorded_variants'] = self.recorded_variants
+        return out
+
+
+def _is_audit_log(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _audit_chunks(path, chunk_size, baseline):
+    """(labels, inputs, (recorded TCD, rows checked against baseline, rows not recalibrated)) per audit log chunk."""
+    reader = AuditReader(path)
+    for records in reader.iter_records(chunk_size):
+        fields = records['inputs']
+        inputs = {
+            'P': fields['P'], 'N': fields['N'], 'drivers': {k: fields[k] for k in DRIVERS},
+            'phi': fields['phi'], 'rho': fields['rho'], 'BV': fields['BV'],
+        }
+        variants = records['variant']
+        n = len(variants)
+        checked, not_replayed = np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+        calibration, names = {}, {}
+        for v in np.unique(variants).tolist():
+            options = reader.variants.get(v)
+            names[v] = f'unknown:{v}' if options is None else _options_json(options)
+            if options is None:
+                continue
+            rows = variants == v
+            kappa = options.get('calibration', {})
+            if any(isinstance(k, str) for k in kappa.values()):
+                not_replayed |= rows
+                continue
+            for c, k in kappa.items():
+                calibration.setdefault(c, np.ones(n))[rows] = k
+            if names[v] == _options_json(canonical_options({'coefficients': baseline, 'calibration': kappa})):
+                checked |= rows
+        if calibration:
+            inputs['calibration'] = calibration
+        labels = {'team': records['team'].tolist(),
+                  'time': np.datetime_as_string(records['time'].astype('datetime64[ns]')).tolist(),
+                  'options': [names[v] for v in variants.tolist()]}
+        yield labels, inputs, (records['result']['TCD'], checked, not_replayed)
+
+
+def _corpus_chunks(path, chunk_size, keep):
+    reader = open_reader(path, chunk_size)
+    try:
+        if keep is None:
+            keep = [c for c in ('team_id',) if c in reader.columns]
+        start = 0
+        for chunk in reader:
+            try:
+                inputs = chunk_inputs(chunk)
+            except ValueError as e:
+                raise ValueError(f"{e} in the chunk starting at data row {start}") from None
+            start += len(inputs['P'])
+            yield {c: list(chunk[c]) for c in keep}, inputs, None
+    finally:
+        reader.close()
+
+
+def replay_file(input_path, output_path=None, baseline=None, candidate=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                keep=None, material_only=False, top=DEFAULT_TOP, progress=sys.stderr):
+    """Replay input_path (assessment CSV/Parquet or an audit log) under two versions; returns the summary.
+
+    baseline and candidate are coefficient overrides (None or {} for v4).
+    With output_path, per-row diffs are streamed there (only material rows
+    with material_only), after the keep columns of a corpus (default
+    team_id) or team, time and the recorded options for an audit log.
+    """
+    for version in (baseline, candidate):
+        unknown = sorted(set(version or ()) - set(V4_COEFFICIENTS))
+        if unknown:
+            raise ValueError(f"Unknown coefficient {unknown[0]!r}; expected one of {list(V4_COEFFICIENTS)}")
+    if output_path is not None and os.path.exists(output_path):
+        raise FileExistsError(f"{output_path} exists; remove it first")
+
+    audit = _is_audit_log(input_path)
+    chunks = (_audit_chunks(input_path, chunk_size, baseline) if audit
+              else _corpus_chunks(input_path, chunk_size, keep))
+    summary = ReplaySummary(top)
+    writer = None
+    rows = 0
+    started = time.perf_counter()
+    try:
+        for labels, inputs, recorded in chunks:
+            diff = diff_versions(inputs, baseline, candidate)
+            label_column = next(iter(labels.values()), None)
+            summary.add(diff, label_column, rows)
+            if audit:
+                TCD, checked, not_replayed = recorded
+                mismatches = np.count_nonzero(diff['TCD_baseline'][checked] != TCD[checked])
+                summary.add_recorded(int(mismatches), int(len(checked) - checked.sum()), labels['options'],
+                                     int(not_replayed.sum()))
+            if output_path is not None:
+                if writer is None:
+                    writer = open_writer(output_path, list(labels) + DIFF_KEYS)
+                rows_out = np.flatnonzero(diff['material']) if material_only else slice(None)
+                out = {c: np.asarray(v, dtype=object)[rows_out].tolist() for c, v in labels.items()}
+                out.update({k: v[rows_out].tolist() for k, v in diff.items()})
+                writer.write(out)
+            rows += len(diff['TCD_delta'])
+            if progress is not None:
+                rate = rows / max(time.perf_counter() - started, 1e-9)
+                progress.write(f"\r  {rows:,} rows replayed ({rate:,.0f} rows/s)")
+                progress.flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    if progress is not None:
+        progress.write("\n")
+    return summary.summary()
+
+
+def _overrides(pairs, parser):
+    out = {}
+    for pair in pairs or ():
+        name, _, value = pair.partition('=')
+        if name not in V4_COEFFICIENTS:
+            parser.error(f"unknown coefficient {name!r}; expected one of {list(V4_COEFFICIENTS)}")
+        try:
+            out[name] = float(value)
+        except ValueError:
+            parser.error(f"--set {pair}: value must be a number")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tcd.replay', description=__doc__.split('\n\n')[1])
+    parser.add_argument('input', help="assessment export (.csv or .parquet) or audit log")
+    parser.add_argument('output', nargs='?', help="per-row diff (.csv file or .parquet dataset directory)")
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help="candidate coefficient (repeatable)")
+    parser.add_argument('--baseline-set', action='append', metavar='NAME=VALUE',
+                        help="baseline coefficient (repeatable; default v4)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument('--keep', action='append', help="input column to copy to the diff (repeatable)")
+    parser.add_argument('--material-only', action='store_true', help="write only rows with a material change")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="largest moves listed in the summary")
+    parser.add_argument('--quiet', action='store_true', help="no progress report")
+    args = parser.parse_args(argv)
+
+    summary = replay_file(args.input, args.output, _overrides(args.baseline_set, parser),
+                          _overrides(args.set, parser), args.chunk_size, args.keep, args.material_only,
+                          args.top, progress=None if args.quiet else sys.stderr)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
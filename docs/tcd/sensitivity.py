@@ -0,0 +1,132 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Sensitivity API
+========================================================
+
+Partial derivatives of TCD with respect to the seven drivers and phi, rho
+and BV, for one team or a whole portfolio, without finite differences.
+
+The TCD expression is built once in SymPy (mirroring calculate_tcd_v4),
+differentiated, and compiled with sympy.lambdify to NumPy code. The
+generated source is cached on disk (tcd.symcache) under a hash of this
+module, formula.py and the SymPy version. Later processes exec the cached
+source, once tcd.symcache has verified its digest and ownership, and never
+import SymPy.
+
+Derivatives are the slopes on the branch each input is in. At a clamp
+bound the slope is taken toward improvement: a driver at exactly 1 has its
+in-range slope and a driver at 7 has zero. Exactly at the anomaly
+tolerance, the gaming cap or the payroll cap, the flat branch is used.
+"""
+
+import functools
+import inspect
+import os
+
+import numpy as np
+
+from .batch import validate_inputs
+from .formula import DRIVERS
+from .symcache import cached_text, source_key
+
+SENSITIVITY_INPUTS = [*DRIVERS, 'phi', 'rho', 'BV']
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_GRADIENT = None
+
+
+def tcd_expression():
+    """SymPy TCD expression and its symbols (P, N, then SENSITIVITY_INPUTS)."""
+    import sympy as sp
+
+    P, N = sp.symbols('P N', positive=True)
+    inputs = sp.symbols(' '.join(SENSITIVITY_INPUTS), real=True)
+    raw = dict(zip(SENSITIVITY_INPUTS, inputs))
+    r = sp.Rational
+
+    # Min/Max rather than Piecewise: Piecewise folds nested conditions into an
+    # expression that grows exponentially with the number of kinks
+    def clamp(x, a, b):
+        return sp.Min(sp.Max(x, a), b)
+
+    d = {k: clamp(raw[k], 1, 7) for k in DRIVERS}
+    phi = clamp(raw['phi'], r(7, 10), r(14, 10))
+    rho = clamp(raw['rho'], r(8, 10), r(13, 10))
+    BV = clamp(raw['BV'], 1, 10)
+
+    R = (sum(d.values()) / 7 - 1) / 6
+    C1 = P * r(25, 100) * (1 - R)
+    C2 = P * r(10, 100) * ((7 - d['communication']) + (7 - d['team_cognition'])) / 12
+    C3 = N * (P / N) * r(21, 100) * ((7 - d['trust']) + (7 - d['psych_safety'])) / 12 * rho
+    C4 = P * r(15, 100) * ((7 - d['coordination']) + (7 - d['goal_clarity'])) / 12 * BV
+    C5 = P * r(12, 100) * ((7 - d['tms']) + (7 - d['communication'])) / 12
+    E = (d['trust'] + d['psych_safety']) / 2
+    C6 = P * r(18, 100) / (1 + sp.exp(2 * (E - 4))) * (7 - E) / 6
+    subtotal = (C1 + C2 + C3 + C4 + C5 + C6) * r(88, 100)
+
+    criteria = (d['team_cognition'] + d['goal_clarity'] + d['coordination']) / 3
+    commitment = (d['team_cognition'] + d['trust'] + d['goal_clarity']) / 3
+    collaboration = (d['tms'] + d['trust'] + d['psych_safety'] + d['coordination'] + d['communication']) / 5
+    change = (d['goal_clarity'] + d['coordination']) / 2
+    M_4C = 1 + r(1, 2) * (1 - (criteria + commitment + collaboration + change) / 4 / 7)
+
+    eta = sp.Piecewise((r(6, 5), N < 5), (1, N <= 12), (1 + r(2, 100) * (N - 12), True))
+    anomaly = sum(sp.Max(sp.Abs(d[a] - d[b]) - tol, 0) for a, b, tol in
+                  [('trust', 'psych_safety', r(3, 2)), ('communication', 'coordination', 2),
+                   ('goal_clarity', 'team_cognition', r(5, 2))])
+    G = sp.Min(1 + r(1, 10) * sp.Max(anomaly - r(3, 2), 0), r(3, 2))
+
+    TCD = sp.Min(subtotal * M_4C * phi * eta * G, r(7, 2) * P)
+    return TCD, (P, N, *inputs)
+
+
+def _gradient_source():
+    import sympy as sp
+
+    TCD, args = tcd_expression()
+    # Heaviside(0) picks the slope at a kink: 1 (in range) where an input sits
+    # on its lower clamp bound, 0 (flat) everywhere else
+    lower = {x - a for x, a in zip(args[2:], [1] * len(DRIVERS) + [sp.Rational(7, 10), sp.Rational(8, 10), 1])}
+    outputs = [TCD] + [sp.diff(TCD, x).replace(sp.Heaviside, lambda u, *_: sp.Heaviside(u, int(u in lower)))
+                       for x in args[2:]]
+    return inspect.getsource(sp.lambdify(args, outputs, modules='numpy', cse=True))
+
+
+def _gradient_function():
+    global _GRADIENT
+    if _GRADIENT is None:
+        key = source_key(os.path.abspath(__file__), os.path.join(_HERE, 'formula.py'))
+        namespace = {**vars(np), 'reduce': functools.reduce}
+        exec(cached_text('sensitivity', key, _gradient_source), namespace)
+        _GRADIENT = namespace['_lambdifygenerated']
+    return _GRADIENT
+
+
+def tcd_sensitivities(P, N, drivers, phi, rho, BV):
+    """TCD and its partial derivatives for one team or many.
+
+    Takes the calculate_tcd_v4 arguments (scalars) or the
+    calculate_tcd_v4_batch arguments (arrays). Returns TCD and one
+    derivative per name in SENSITIVITY_INPUTS ('trust' is dTCD/dtrust, in
+    dollars per Likert point), as floats or arrays to match the input.
+    """
+    columns = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in
+                                    [P, N] + [drivers[k] for k in DRIVERS] + [phi, rho, BV]])
+    validate_inputs(columns[0], columns[1])
+    values = _gradient_function()(*columns)
+    shape = columns[0].shape
+    out = {}
+    for name, value in zip(['TCD'] + SENSITIVITY_INPUTS, values):
+        value = np.broadcast_to(np.asarray(value, dtype=float), shape)
+        out[name] = float(value) if value.ndim == 0 else value.copy()
+    return out
+
+
+def rank_drivers(sensitivities):
+    """Drivers ordered by dollar savings per one-point improvement, largest first.
+
+    Takes a tcd_sensitivities result; returns a list of driver names for
+    one team, or an array of shape (teams, 7) for a portfolio.
+    """
+    slopes = np.stack([np.asarray(sensitivities[k], dtype=float) for k in DRIVERS], axis=-1)
+    ranked = np.asarray(DRIVERS)[np.argsort(slopes, axis=-1, kind='stable')]
+    return ranked.tolist() if ranked.ndim == 1 else ranked
@@ -0,0 +1,105 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Symbolic Artefact Cache
+================================================================
+
+Content-hashed on-disk cache for expensive SymPy results. An entry is
+stored as text (generated source or srepr) under a key hashed from
+everything that determines it, typically the source of the modules that
+build it plus the SymPy version, so editing the formula invalidates it.
+
+The cache lives in $TCD_CACHE_DIR, else ~/.cache/tcd. Writes are atomic,
+and an unwritable directory only disables caching.
+
+Cached text is evaluated (srepr) or executed (generated source), so an
+entry is only used if it passes two checks. First, its header holds
+content_hash(key, text), so a truncated, corrupted or edited entry, or one
+written under another key, is rebuilt rather than run. Second, the file must
+be owned by the current user and not writable by group or others, since
+anyone who can write the file could also rewrite the digest.
+"""
+
+import hashlib
+import os
+import tempfile
+from importlib import metadata
+
+# First line of every entry, followed by content_hash(key, text)
+_HEADER = 'tcd-cache sha256='
+
+
+def cache_dir():
+    return os.environ.get('TCD_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'tcd')
+
+
+def content_hash(*parts):
+    """SHA-256 hex digest of the given str/bytes parts (length-prefixed)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode('utf-8') if isinstance(part, str) else bytes(part)
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def source_key(*paths, packages=('sympy',)):
+    """Key for artefacts built by the files at paths with the given package versions."""
+    parts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            parts.append(f.read())
+    parts += [f'{name}=={metadata.version(name)}' for name in packages]
+    return content_hash(*parts)
+
+
+def _read_verified(path, key):
+    """The text stored at path, or None if it is missing or fails the checks above."""
+    try:
+        with open(path, encoding='utf-8', newline='') as f:
+            stat = os.fstat(f.fileno())
+            header = f.readline()
+            text = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if hasattr(os, 'getuid') and (stat.st_uid != os.getuid() or stat.st_mode & 0o022):
+        return None
+    if header != f'{_HEADER}{content_hash(key, text)}\n':
+        return None
+    return text
+
+
+def cached_text(name, key, build):
+    """Return the text stored for (name, key), calling build() and storing it on a miss.
+
+    An entry that fails verification counts as a miss and is overwritten.
+    """
+    path = os.path.join(cache_dir(), f'{name}-{key[:24]}.txt')
+    text = _read_verified(path, key)
+    if text is not None:
+        return text
+
+    text = build()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(f'{_HEADER}{content_hash(key, text)}\n')
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return text
+
+
+def cached_expr(name, build, *inputs):
+    """build(*inputs) for SymPy expressions, cached as srepr.
+
+    The key hashes the srepr of the inputs and the SymPy version, so any
+    change to an input expression (and so to the formula it came from)
+    misses the cache. The verified srepr is evaluated with the SymPy
+    namespace only, without builtins.
+    """
+    import sympy
+
+    key = content_hash(*[sympy.srepr(e) for e in inputs], f'sympy=={sympy.__version__}')
+    text = cached_text(name, key, lambda: sympy.srepr(build(*inputs)))
+    return eval(text, {**vars(sympy), '__builtins__': {}})
@@ -0,0 +1,160 @@
+"""
+Enhanced Dysfunction Cost Formula v4.0 - Incremental What-If
+============================================================
+
+Slider-style what-if analysis: change one driver and update only the terms
+that driver feeds, instead of re-running calculate_tcd_v4.
+
+    state = WhatIfState(P, N, drivers, phi, rho, BV)
+    state = state.with_driver('trust', 5.5)      # recomputes C3, C6, E, ...
+    samples = WhatIfSamples(state, n_samples=100_000)
+    samples.update(state.with_driver('tms', 3.0))  # O(n_samples), no redraw
+
+Every recomputed term uses the formula's own expression and the driver sum
+keeps the input's key order, so state.result is bit-for-bit what
+calculate_tcd_v4 returns for the changed inputs.
+"""
+
+import numpy as np
+
+from .formula import calculate_anomaly_score, clamp, gaming_penalty, sigmoid_e_coef, team_size_factor
+
+# Terms fed by each driver (C1 and the readiness score depend on all of them)
+DRIVER_TERMS = {
+    'communication': {'C2', 'C5', 'collaboration', 'anomaly'},
+    'trust': {'C3', 'E', 'commitment', 'collaboration', 'anomaly'},
+    'psych_safety': {'C3', 'E', 'collaboration', 'anomaly'},
+    'goal_clarity': {'C4', 'criteria', 'commitment', 'change', 'anomaly'},
+    'coordination': {'C4', 'criteria', 'collaboration', 'change', 'anomaly'},
+    'tms': {'C5', 'collaboration'},
+    'team_cognition': {'C2', 'criteria', 'commitment', 'anomaly'},
+}
+
+
+def _terms(s, names):
+    """Evaluate the named driver-dependent terms of state s (formula expressions)."""
+    d, P = s.d, s.P
+    t = {}
+    if 'C2' in names:
+        Q_adj = ((7 - d['communication']) + (7 - d['team_cognition'])) / 12
+        t['C2'] = P * 0.10 * Q_adj
+    if 'C3' in names:
+        T_adj = ((7 - d['trust']) + (7 - d['psych_safety'])) / 12 * s.rho
+        t['C3'] = s.N * s.S_bar * 0.21 * T_adj
+    if 'C4' in names:
+        O_adj = ((7 - d['coordination']) + (7 - d['goal_clarity'])) / 12
+        t['C4'] = P * 0.15 * O_adj * s.BV
+    if 'C5' in names:
+        H_adj = ((7 - d['tms']) + (7 - d['communication'])) / 12
+        t['C5'] = P * 0.12 * H_adj
+    if 'E' in names:
+        t['E'] = E = (d['trust'] + d['psych_safety']) / 2
+        t['E_coef'] = E_coef = sigmoid_e_coef(E)
+        t['C6'] = P * E_coef * ((7 - E) / 6)
+    if 'criteria' in names:
+        t['criteria'] = (d['team_cognition'] + d['goal_clarity'] + d['coordination']) / 3
+    if 'commitment' in names:
+        t['commitment'] = (d['team_cognition'] + d['trust'] + d['goal_clarity']) / 3
+    if 'collaboration' in names:
+        t['collaboration'] = (d['tms'] + d['trust'] + d['psych_safety'] + d['coordination'] + d['communication']) / 5
+    if 'change' in names:
+        t['change'] = (d['goal_clarity'] + d['coordination']) / 2
+    if 'anomaly' in names:
+        t['anomaly_score'] = calculate_anomaly_score(d)
+    return t
+
+
+class WhatIfState:
+    """One team's evaluation with the intermediate terms kept for incremental updates.
+
+    Takes the calculate_tcd_v4 arguments; result holds its output dict.
+    """
+
+    def __init__(self, P, N, drivers, phi, rho, BV):
+        if P <= 0:
+            raise ValueError("Payroll must be positive")
+        if N < 1:
+            raise ValueError("Team size must be at least 1")
+        self.P, self.N = P, N
+        self.d = {k: clamp(v, 1, 7) for k, v in drivers.items()}
+        self.phi = clamp(phi, 0.7, 1.4)
+        self.rho = clamp(rho, 0.8, 1.3)
+        self.BV = clamp(BV, 1, 10)
+        self.S_bar = P / N
+        self.eta = team_size_factor(N)
+        self.terms = _terms(self, set().union(*DRIVER_TERMS.values()))
+        self._finish()
+
+    def _finish(self):
+        """Terms every driver feeds: readiness, C1, subtotal, M_4C, G and TCD."""
+        t = self.terms
+        avg_d = sum(self.d.values()) / 7
+        R = (avg_d - 1) / 6
+        C1 = self.P * 0.25 * (1 - R)
+        subtotal = (C1 + t['C2'] + t['C3'] + t['C4'] + t['C5'] + t['C6']) * 0.88
+        C_bar = (t['criteria'] + t['commitment'] + t['collaboration'] + t['change']) / 4
+        M_4C = 1 + 0.5 * (1 - C_bar / 7)
+        G = gaming_penalty(t['anomaly_score'])
+        TCD_raw = subtotal * M_4C * self.phi * self.eta * G
+        self.result = {
+            'TCD': min(TCD_raw, self.P * 3.5),
+            'C1': C1, 'C2': t['C2'], 'C3': t['C3'], 'C4': t['C4'], 'C5': t['C5'], 'C6': t['C6'],
+            'subtotal': subtotal,
+            'M_4C': M_4C, 'phi': self.phi, 'eta': self.eta, 'G': G,
+            'E': t['E'], 'E_coef': t['E_coef'],
+            'anomaly_score': t['anomaly_score'],
+        }
+
+    def with_driver(self, name, value):
+        """New state with one driver changed; only the terms it feeds are recomputed."""
+        if name not in DRIVER_TERMS:
+            raise ValueError(f"Unknown driver {name!r}")
+        new = object.__new__(WhatIfState)
+        new.__dict__.update(self.__dict__)
+        new.d = {**self.d, name: clamp(value, 1, 7)}
+        new.terms = {**self.terms, **_terms(new, DRIVER_TERMS[name])}
+        new._finish()
+        return new
+
+    def linear_terms(self):
+        """tcd_linear_terms of this state: (weights, offset, scale, cap)."""
+        from .ci import tcd_linear_terms
+        return tcd_linear_terms(self.P, self.result)
+
+
+class WhatIfSamples:
+    """A Monte Carlo sample set for one team that follows what-if changes.
+
+    The coefficient matrix is drawn once (as tcd_confidence_interval draws
+    it). update() adds the change of each affected component weight times
+    its coefficient column to the stored linear part, then re-applies
+    offset, scale and cap: O(n_samples) per change, never a redraw.
+    """
+
+    def __init__(self, state, n_samples=100_000, seed=42, method='random'):
+        from .ci import draw_coefficients, simulate_tcd
+        self.coefficients = draw_coefficients(n_samples, seed, method)
+        self.n_samples, self.seed, self.method = n_samples, seed, method
+        self.weights, offset, scale, cap = state.linear_terms()
+        self.linear = simulate_tcd(self.weights, 0.0, 1.0, np.inf, self.coefficients)[0]
+        self._apply(offset, scale, cap)
+
+    def _apply(self, offset, scale, cap):
+        self.samples = self.linear + offset
+        self.samples *= scale
+        np.minimum(self.samples, cap, out=self.samples)
+
+    def update(self, state):
+        """Follow state (the team after a what-if change); returns self."""
+        weights, offset, scale, cap = state.linear_terms()
+        for j in np.flatnonzero(weights != self.weights):
+            self.linear += self.coefficients[:, j] * (weights[j] - self.weights[j])
+        self.weights = weights
+        self._apply(offset, scale, cap)
+        return self
+
+    def interval(self, confidence=0.95):
+        """(low, high, mean) of the current samples."""
+        from .ci import _percentile_bounds
+        low, high = np.percentile(self.samples, _percentile_bounds(confidence))
+        return float(low), float(high), float(self.samples.mean())
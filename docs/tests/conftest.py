@@ -0,0 +1,62 @@
+"""
+Invariant test suite for the TCD formula (pytest + Hypothesis)
+==============================================================
+
+The Section 5 properties of symbolic_proofs.py as a test suite:
+
+    python -m pytest docs/tests -n auto           # default profile, all cores
+    python -m pytest docs/tests -n auto --deep    # 2k examples, ~1M batch teams per invariant
+
+-n needs pytest-xdist; without it the suite runs serially. The scalar
+properties draw one team per example. The batch properties draw a seed per
+example and check a whole generated portfolio (batch_rows teams) at once
+with calculate_tcd_v4_batch. --deep runs 2,000 examples per invariant:
+2,000 teams for a scalar property and about 1M (2,000 x 512) for a batch
+property.
+
+Hypothesis keeps its example database in docs/tests/.hypothesis, whatever
+the working directory, so a shrunk counterexample replays first on the
+next run.
+"""
+
+import os
+import sys
+
+import pytest
+from hypothesis import HealthCheck, settings
+from hypothesis.database import DirectoryBasedExampleDatabase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+# Profile name -> (Hypothesis max_examples, teams per batch example)
+PROFILES = {
+    'default': (500, 100),
+    'deep': (2_000, 512),
+}
+
+for name, (max_examples, _) in PROFILES.items():
+    settings.register_profile(
+        name,
+        max_examples=max_examples,
+        deadline=None,
+        database=DirectoryBasedExampleDatabase(os.path.join(HERE, '.hypothesis', 'examples')),
+        suppress_health_check=[HealthCheck.too_slow],
+    )
+settings.load_profile('default')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--deep', action='store_true',
+                     help="run the deep profile (2k examples per invariant, 512 teams per batch example)")
+
+
+def pytest_configure(config):
+    if config.getoption('--deep'):
+        settings.load_profile('deep')
+
+
+@pytest.fixture(scope='session')
+def batch_rows(pytestconfig):
+    """Teams per example in the batch properties."""
+    return PROFILES['deep' if pytestconfig.getoption('--deep') else 'default'][1]
@@ -0,0 +1,87 @@
+"""Portfolio aggregation: sketch percentiles and group CIs against np.percentile, and shard merging."""
+
+import numpy as np
+import pytest
+
+from tcd.aggregate import METRICS, PERCENTILE_ACCURACY, PortfolioAggregate, aggregate_portfolio
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.ci import COEFFICIENTS, draw_coefficients
+
+ROWS = 3_000
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99, 100)
+CI_SAMPLES = 400
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    teams = random_portfolio(ROWS, seed=21)
+    rng = np.random.default_rng(21)
+    keys = {'industry': rng.choice(['health', 'retail', 'tech'], ROWS), 'size': np.where(teams['N'] < 12, 's', 'l')}
+    return keys, teams
+
+
+def groups(keys, by):
+    """Row indices of every group label, as PortfolioAggregate sorts them."""
+    labels = sorted(set(zip(*[keys[k].tolist() for k in by])))
+    return {label: np.flatnonzero(np.logical_and.reduce([keys[k] == v for k, v in zip(by, label)]))
+            for label in labels}
+
+
+def test_sketch_percentiles_within_accuracy(portfolio):
+    keys, teams = portfolio
+    by = ['industry', 'size']
+    rows = aggregate_portfolio(keys, **teams, by=by, percentiles=PERCENTILES)
+    result = calculate_tcd_v4_batch(**teams)
+    members = groups(keys, by)
+    assert [tuple(row[k] for k in by) for row in rows] == list(members)
+    for row, index in zip(rows, members.values()):
+        assert row['teams'] == len(index)
+        for m in METRICS:
+            values = result[m][index]
+            assert row[f'{m}_sum'] == pytest.approx(values.sum())
+            assert row[f'{m}_wavg'] == pytest.approx((teams['P'][index] * values).sum() / teams['P'][index].sum())
+            # The sketch uses np.percentile's 'lower' rank convention
+            expected = np.percentile(values, PERCENTILES, method='lower')
+            for p, value in zip(PERCENTILES, expected):
+                assert row[f'{m}_p{p:g}'] == pytest.approx(value, rel=PERCENTILE_ACCURACY, abs=1e-12), (row, m, p)
+
+
+def test_group_ci_matches_brute_force(portfolio):
+    keys, teams = portfolio
+    rows = aggregate_portfolio(keys, **teams, by=['industry'], ci_samples=CI_SAMPLES, seed=4)
+    # Rescore the whole portfolio once per coefficient draw and sum each group
+    draws = draw_coefficients(CI_SAMPLES, seed=4)
+    members = groups(keys, ['industry'])
+    totals = np.empty((len(members), CI_SAMPLES))
+    for s, draw in enumerate(draws):
+        TCD = calculate_tcd_v4_batch(**teams, coefficients=dict(zip(COEFFICIENTS, draw)))['TCD']
+        totals[:, s] = [TCD[index].sum() for index in members.values()]
+    for row, total in zip(rows, totals):
+        low, high = np.percentile(total, [2.5, 97.5])
+        assert row['TCD_low'] == pytest.approx(low, rel=PERCENTILE_ACCURACY)
+        assert row['TCD_high'] == pytest.approx(high, rel=PERCENTILE_ACCURACY)
+        assert row['TCD_mean'] == pytest.approx(total.mean(), rel=PERCENTILE_ACCURACY)
+        assert row['TCD_low'] < row['TCD_sum'] < row['TCD_high']
+
+
+def test_shards_merge_to_one_pass(portfolio):
+    keys, teams = portfolio
+    options = {'by': ['industry'], 'ci_samples': CI_SAMPLES, 'percentiles': PERCENTILES}
+    whole = aggregate_portfolio(keys, **teams, **options)
+    shards = []
+    for start in range(0, ROWS, 700):
+        s = slice(start, start + 700)
+        agg = PortfolioAggregate(**options)
+        agg.add({k: v[s] for k, v in keys.items()}, teams['P'][s], teams['N'][s],
+                {k: v[s] for k, v in teams['drivers'].items()}, teams['phi'][s], teams['rho'][s], teams['BV'][s])
+        shards.append(agg)
+    merged = shards[0]
+    for agg in shards[1:]:
+        merged.merge(agg)
+    for a, b in zip(whole, merged.summary()):
+        assert a.keys() == b.keys()
+        for k in a:
+            assert a[k] == pytest.approx(b[k], rel=1e-12), k
+
+    with pytest.raises(ValueError, match="different grouping"):
+        merged.merge(PortfolioAggregate(by=['size']))
@@ -0,0 +1,184 @@
+"""Audit log: hash chain, verify, torn-tail recovery, indexed queries and recorded options."""
+
+import os
+
+import numpy as np
+import pytest
+
+from tcd.audit import BLOCK_DTYPE, AuditLog, AuditReader, as_dicts, variant_id
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.formula import DRIVERS, calculate_tcd_v4
+
+T0 = 1_700_000_000 * 10**9
+
+
+def team(i):
+    rng = np.random.default_rng(i)
+    return {'P': float(rng.uniform(1e5, 1e7)), 'N': float(rng.integers(3, 30)),
+            'drivers': {k: float(rng.uniform(1, 7)) for k in DRIVERS},
+            'phi': 1.1, 'rho': 1.0, 'BV': float(rng.uniform(1, 5))}
+
+
+def write_log(path, blocks=4, rows=50):
+    """blocks blocks of rows batch rows each: teams 0..9, one hour apart per block."""
+    teams = random_portfolio(blocks * rows, seed=1)
+    with AuditLog(path, commit_rows=rows, commit_interval=1e9) as log:
+        for b in range(blocks):
+            s = slice(b * rows, (b + 1) * rows)
+            inputs = {'P': teams['P'][s], 'N': teams['N'][s], 'drivers': {k: v[s] for k, v in teams['drivers'].items()},
+                      'phi': teams['phi'][s], 'rho': teams['rho'][s], 'BV': teams['BV'][s]}
+            result = calculate_tcd_v4_batch(**inputs)
+            log.record_batch(np.arange(rows) % 10, result=result, timestamp=T0 + b * 3600 * 10**9, **inputs)
+    return teams
+
+
+def test_round_trip_and_verify(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    teams = write_log(path)
+    reader = AuditReader(path)
+    assert reader.rows == 200 and len(reader.blocks) == 4
+    assert reader.verify() == {'ok': True, 'blocks': 4, 'rows': 200, 'first_bad_block': None, 'bad_variants': []}
+    records = np.concatenate(list(reader.iter_records(64)))
+    np.testing.assert_array_equal(records['inputs']['P'], teams['P'])
+    np.testing.assert_array_equal(records['result']['TCD'], calculate_tcd_v4_batch(**teams)['TCD'])
+
+
+def test_tampering_breaks_the_chain(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    write_log(path)
+    reader = AuditReader(path)
+    offset = int(reader.blocks['offset'][2]) + 200       # inside block 2's columns
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 1]))
+    report = AuditReader(path).verify()
+    assert not report['ok'] and report['first_bad_block'] == 2
+
+
+def test_query_matches_a_scan(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    write_log(path)
+    reader = AuditReader(path)
+    everything = reader.records(np.arange(reader.rows))
+    hour = 3600 * 10**9
+    for team_id, start, end in [(3, None, None), (3, T0 + hour, T0 + 3 * hour), (None, T0 + 2 * hour, None),
+                                (7, '2023-11-14T23:00', None), (11, None, None)]:
+        got = reader.query(team_id, start, end)
+        lo = -2**63 if start is None else (start if isinstance(start, int) else
+                                          int(np.datetime64(start, 'ns').astype(np.int64)))
+        hi = 2**63 - 1 if end is None else end
+        want = ((everything['time'] >= lo) & (everything['time'] < hi)
+                & (True if team_id is None else everything['team'] == team_id))
+        np.testing.assert_array_equal(got, everything[want])
+
+
+def test_torn_tail_is_truncated_on_reopen(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    write_log(path)
+    size = os.path.getsize(path)
+    reader = AuditReader(path)
+    last = int(reader.blocks['offset'][3])
+    # A crash mid-block: block 3 half written and its index entry missing
+    with open(path, 'r+b') as f:
+        f.truncate(last + (size - last) // 2)
+    with open(path + '.blocks', 'r+b') as f:
+        f.truncate(3 * BLOCK_DTYPE.itemsize)
+    with AuditLog(path) as log:
+        assert log.rows == 150
+        log.score(42, **team(42))
+    reader = AuditReader(path)
+    assert reader.rows == 151 and reader.verify()['ok']
+    assert reader.query(42)['result']['TCD'][0] == calculate_tcd_v4(**team(42))['TCD']
+
+
+def test_missing_index_entries_are_rebuilt(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    write_log(path)
+    before = AuditReader(path).query(5)
+    with open(path + '.blocks', 'r+b') as f:
+        f.truncate(BLOCK_DTYPE.itemsize + 7)            # one entry and a torn one
+    AuditLog(path).close()
+    reader = AuditReader(path)
+    assert reader.rows == 200 and reader.verify()['ok']
+    np.testing.assert_array_equal(reader.query(5), before)
+
+
+def test_scalar_and_batch_rows_keep_append_order(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    teams = random_portfolio(5, seed=2)
+    with AuditLog(path, commit_rows=4) as log:
+        log.score(100, **team(100))
+        log.score_batch(np.arange(5), **teams)
+        log.score(101, **team(101))
+        log.score(102, **team(102))
+    assert AuditReader(path).records(np.arange(8))['team'].tolist() == [100, 0, 1, 2, 3, 4, 101, 102]
+
+
+def test_options_are_recorded(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    teams = random_portfolio(10, seed=3)
+    with AuditLog(path) as log:
+        log.score(1, **team(1))
+        log.score(2, **team(2), sigmoid='table')
+        log.score_batch(np.arange(10), **teams, coefficients={'tau': 0.18, 'overlap': 0.88})
+    reader = AuditReader(path)
+    records = reader.records(np.arange(reader.rows))
+    options = [d['options'] for d in as_dicts(records, reader.variants)]
+    assert options[:2] == [{}, {'sigmoid': 'table'}]
+    assert options[2:] == [{'coefficients': {'tau': 0.18}}] * 10      # overrides equal to v4 are dropped
+    assert records['variant'][0] == variant_id({})
+    assert reader.verify()['ok']
+
+    # Editing the options of a variant is caught
+    with open(path + '.variants') as f:
+        text = f.read()
+    with open(path + '.variants', 'w') as f:
+        f.write(text.replace('0.18', '0.19'))
+    report = AuditReader(path).verify()
+    assert not report['ok'] and report['bad_variants'] == [variant_id({'coefficients': {'tau': 0.18}})]
+
+
+def test_unknown_option_is_rejected(tmp_path):
+    with AuditLog(str(tmp_path / 'scores.audit')) as log:
+        with pytest.raises(ValueError):
+            log.record(1, result=calculate_tcd_v4(**team(1)), options={'speed': 'fast'}, **team(1))
+
+
+def test_bad_rows_fail_alone(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    teams = random_portfolio(10, seed=4)
+    with AuditLog(path) as log:
+        for i in range(10):
+            log.score(i, **team(i))
+        with pytest.raises(ValueError, match="Team id must be an integer"):
+            log.score('team-x', **team(10))
+        with pytest.raises(ValueError, match="non-numeric"):
+            log.record(11, result=calculate_tcd_v4(**team(11)), **dict(team(11), BV='high'))
+        with pytest.raises(ValueError, match="Team ids must be integers"):
+            log.score_batch(np.array(['a'] * 10), **teams)
+        with pytest.raises(ValueError, match="Audit column 'P' has shape"):
+            log.record_batch(np.arange(10), result=calculate_tcd_v4_batch(**teams), **dict(teams, P=teams['P'][:5]))
+        log.flush()
+        log.score(12, **team(12))
+    reader = AuditReader(path)
+    assert reader.records(np.arange(reader.rows))['team'].tolist() == [*range(10), 12]
+    assert reader.verify()['ok']
+
+
+def test_calibration_is_recorded(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    teams = random_portfolio(10, seed=5)
+    per_row = np.linspace(0.8, 1.2, 10)
+    with AuditLog(path) as log:
+        log.score_batch(np.arange(10), **teams, calibration={'C2': 1.3, 'C3': 1.0})
+        log.score_batch(np.arange(10), **teams, calibration={'C3': per_row})
+        with pytest.raises(ValueError, match="Unknown component"):
+            log.score_batch(np.arange(10), **teams, calibration={'C9': 1.0})
+    reader = AuditReader(path)
+    options = [d['options'] for d in as_dicts(reader.records(np.arange(reader.rows)), reader.variants)]
+    assert options[:10] == [{'calibration': {'C2': 1.3}}] * 10           # κ = 1 is dropped
+    digest = options[10]['calibration']['C3']
+    assert digest.startswith('sha256:') and options[10:] == [{'calibration': {'C3': digest}}] * 10
+    assert reader.verify()['ok']
@@ -0,0 +1,87 @@
+"""Batch formula: bit-for-bit agreement with calculate_tcd_v4 on a large portfolio and on edge rows."""
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS, RESULT_KEYS, calculate_tcd_v4
+from tcd.batch import BATCH_BLOCK_SIZE, calculate_tcd_v4_batch, random_portfolio
+
+ROWS = 12 * BATCH_BLOCK_SIZE + 123
+BASE = {'P': 2_500_000.0, 'N': 9.0, 'phi': 1.1, 'rho': 1.0, 'BV': 4.0, 'drivers': {k: 4.0 for k in DRIVERS}}
+ANOMALY_PAIRS = [('trust', 'psych_safety', 1.5), ('communication', 'coordination', 2.0),
+                 ('goal_clarity', 'team_cognition', 2.5)]
+
+
+def team(drivers=None, **inputs):
+    return {**BASE, **inputs, 'drivers': {**BASE['drivers'], **(drivers or {})}}
+
+
+def edge_teams():
+    """Rows on and around every clamp bound, team size band, anomaly tolerance and the payroll cap."""
+    teams = []
+    for k in DRIVERS:
+        for v in [-1.0, 0.0, np.nextafter(1, 0), 1.0, np.nextafter(1, 2), np.nextafter(7, 0), 7.0, 7.5, 100.0]:
+            teams.append(team({k: float(v)}))
+    for name, values in [('phi', [0.5, 0.7, np.nextafter(0.7, 1), 1.4, 1.6]),
+                         ('rho', [0.5, 0.8, 1.3, np.nextafter(1.3, 2), 2.0]),
+                         ('BV', [0.0, 1.0, 10.0, 11.0]),
+                         ('N', [1.0, 1.5, 4.0, np.nextafter(5, 0), 5.0, 12.0, 12.5, 13.0, 60.0, 1e4]),
+                         ('P', [1e-6, 1.0, 1e12])]:
+        teams += [team(**{name: float(v)}) for v in values]
+    # Each anomaly pair below, at and above its tolerance, in both directions
+    for d1, d2, tol in ANOMALY_PAIRS:
+        for diff in [tol - 0.5, tol, float(np.nextafter(tol, 7)), tol + 1.5, 6.0]:
+            teams.append(team({d1: 1.0 + diff, d2: 1.0}))
+            teams.append(team({d1: 1.0, d2: 1.0 + diff}))
+    # All three pairs at once: anomaly on the 1.5 threshold, and far past the G_max cap
+    teams.append(team({'trust': 4.0, 'psych_safety': 1.0}))
+    teams.append(team({d1: 7.0 for d1, _, _ in ANOMALY_PAIRS} | {d2: 1.0 for _, d2, _ in ANOMALY_PAIRS}))
+    # Worst drivers on a large, high-value team hit the 350% cap; perfect drivers zero most components
+    teams.append(team({k: 1.0 for k in DRIVERS}, N=60.0, phi=1.4, rho=1.3, BV=10.0))
+    teams.append(team({k: 0.0 for k in DRIVERS}, N=1.0, phi=2.0, rho=2.0, BV=20.0))
+    teams.append(team({k: 7.0 for k in DRIVERS}))
+    return teams
+
+
+def stack(teams):
+    columns = {name: np.array([t[name] for t in teams]) for name in ('P', 'N', 'phi', 'rho', 'BV')}
+    columns['drivers'] = {k: np.array([t['drivers'][k] for t in teams]) for k in DRIVERS}
+    return columns
+
+
+def rows(portfolio):
+    for i in range(len(portfolio['P'])):
+        yield {**{name: float(portfolio[name][i]) for name in ('P', 'N', 'phi', 'rho', 'BV')},
+               'drivers': {k: float(portfolio['drivers'][k][i]) for k in DRIVERS}}
+
+
+def assert_bit_identical(portfolio):
+    batch = calculate_tcd_v4_batch(**portfolio)
+    teams = list(rows(portfolio))
+    scalar = [calculate_tcd_v4(**t) for t in teams]
+    for key in RESULT_KEYS:
+        expected = np.array([float(r[key]) for r in scalar])
+        same = batch[key] == expected
+        assert same.all(), (key, teams[int(np.argmin(same))])
+
+
+def test_large_portfolio_is_bit_identical():
+    assert_bit_identical(random_portfolio(ROWS, seed=1))
+
+
+def test_edge_rows_are_bit_identical():
+    teams = edge_teams()
+    portfolio = stack(teams)
+    assert_bit_identical(portfolio)
+    result = calculate_tcd_v4_batch(**portfolio)
+    # The edge rows reach both ends of the gaming penalty and the cap
+    assert result['G'].min() == 1.0 and result['G'].max() == 1.5
+    assert np.any(result['TCD'] == portfolio['P'] * 3.5)
+
+
+def test_zero_team_size_rejected_by_both():
+    portfolio = stack([team(), team(N=0.0), team(N=-3.0)])
+    with pytest.raises(ValueError, match=r"Team size must be at least 1 \(row 1\)"):
+        calculate_tcd_v4_batch(**portfolio)
+    with pytest.raises(ValueError, match="Team size must be at least 1"):
+        calculate_tcd_v4(**team(N=0.0))
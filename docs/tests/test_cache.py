@@ -0,0 +1,98 @@
+"""Scoring cache: LRU eviction, TTL expiry, the stats counters and sanitized keys."""
+
+import pytest
+
+from tcd import DRIVERS, calculate_tcd_v4
+from tcd.cache import TCDCache
+
+
+class Clock:
+    """Manually advanced clock for TTL tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def team(i):
+    return {'P': 1_000_000.0 + i, 'N': 10, 'drivers': dict.fromkeys(DRIVERS, 4.0), 'phi': 1.1, 'rho': 1.0, 'BV': 2.0}
+
+
+def counters(cache):
+    stats = cache.stats()
+    return stats['hits'], stats['misses'], stats['evictions'], stats['expirations'], stats['size']
+
+
+def test_hit_returns_formula_result():
+    cache = TCDCache()
+    expected = calculate_tcd_v4(**team(0))
+    first = cache.score(**team(0))
+    first['TCD'] = -1.0                 # callers get a fresh dict
+    assert cache.score(**team(0)) == expected
+    assert counters(cache) == (1, 1, 0, 0, 1)
+
+
+def test_lru_eviction():
+    cache = TCDCache(maxsize=3)
+    for i in range(3):
+        cache.score(**team(i))
+    cache.score(**team(0))              # 0 is now the most recently used
+    cache.score(**team(3))              # evicts 1, the least recently used
+    assert counters(cache) == (1, 4, 1, 0, 3)
+    cache.score(**team(0))
+    cache.score(**team(2))
+    cache.score(**team(3))
+    assert counters(cache) == (4, 4, 1, 0, 3)
+    cache.score(**team(1))              # recomputed; evicts 0
+    cache.score(**team(0))              # recomputed; evicts 2
+    assert counters(cache) == (4, 6, 3, 0, 3)
+
+    with pytest.raises(ValueError, match="maxsize must be at least 1"):
+        TCDCache(maxsize=0)
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = TCDCache(ttl=10, clock=clock)
+    cache.score(**team(0))
+    clock.now = 9.9
+    cache.score(**team(0))              # a hit does not extend the entry
+    cache.score(**team(1))
+    clock.now = 10.0
+    cache.score(**team(0))
+    assert counters(cache) == (1, 3, 0, 1, 2)
+    clock.now = 19.9
+    cache.score(**team(1))              # stored at 9.9: expired
+    cache.score(**team(0))              # recomputed at 10.0: still live
+    assert counters(cache) == (2, 4, 0, 2, 2)
+
+    forever = TCDCache(clock=clock)
+    forever.score(**team(0))
+    clock.now = 1e9
+    forever.score(**team(0))
+    assert counters(forever) == (1, 1, 0, 0, 1)
+
+
+def test_stats_and_clear():
+    cache = TCDCache(maxsize=8, ttl=60)
+    cache.score(**team(0))
+    cache.score(**team(0), ci={'n_samples': 1_000})
+    result = cache.score(**team(0), ci={'n_samples': 1_000})
+    assert 'ci' in result
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'evictions': 0, 'expirations': 0,
+                             'size': 2, 'maxsize': 8, 'ttl': 60}
+    cache.clear()
+    assert cache.stats()['size'] == 0
+    cache.score(**team(0))
+    assert counters(cache) == (1, 3, 0, 0, 1)
+
+
+def test_sanitized_inputs_share_an_entry():
+    cache = TCDCache()
+    high = dict(team(0), drivers=dict.fromkeys(DRIVERS, 9.0), phi=2.0, BV=50.0)
+    top = dict(team(0), drivers=dict.fromkeys(DRIVERS, 7.0), phi=1.4, BV=10.0)
+    assert cache.score(**high) == calculate_tcd_v4(**top)
+    assert cache.score(**top) == calculate_tcd_v4(**top)
+    assert counters(cache) == (1, 1, 0, 0, 1)
@@ -0,0 +1,157 @@
+"""Calibration against actuals: κ recovery, MAPE, bootstrap determinism and calibrated scoring."""
+
+import csv
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.calibration import Calibration, fit_calibration
+from tcd.parallel import score_shards
+from tcd.pipeline import score_file
+
+ROWS = 6_000
+TRUE_KAPPA = {'retail': {'C2': 1.3, 'C3': 0.7}, 'tech': {'C2': 0.9, 'C3': 1.6}, 'health': {'C2': 1.0, 'C3': 1.1}}
+NOISE = 0.1
+
+
+@pytest.fixture(scope='module')
+def data():
+    """Scored portfolio, segment labels and actuals = true κ x predicted x lognormal noise."""
+    portfolio = random_portfolio(ROWS, seed=3)
+    predicted = calculate_tcd_v4_batch(**portfolio)
+    rng = np.random.default_rng(3)
+    segments = rng.choice(sorted(TRUE_KAPPA), ROWS)
+    actual = {}
+    for c in ('C2', 'C3'):
+        kappa = np.array([TRUE_KAPPA[s][c] for s in segments])
+        actual[c] = kappa * predicted[c] * rng.lognormal(-NOISE ** 2 / 2, NOISE, ROWS)
+    return portfolio, predicted, segments, actual
+
+
+@pytest.fixture(scope='module')
+def calibration(data):
+    _, predicted, segments, actual = data
+    return fit_calibration(predicted, actual, segments, n_bootstrap=200, seed=7)
+
+
+def test_kappa_recovered_within_ci(calibration):
+    for i, segment in enumerate(calibration.segments):
+        for c in ('C2', 'C3'):
+            true = TRUE_KAPPA[segment][c]
+            assert calibration.kappa[c][i] == pytest.approx(true, rel=0.02)
+            assert calibration.low[c][i] <= true <= calibration.high[c][i]
+            assert calibration.high[c][i] - calibration.low[c][i] < 0.05 * true
+
+
+def test_mape_improves_to_noise_level(calibration):
+    for row in calibration.summary():
+        true = TRUE_KAPPA[row['segment']][row['component']]
+        # Before: |A - P| / A = |1 - 1/κ| on average; after: only the lognormal noise is left
+        assert row['mape_before'] == pytest.approx(abs(1 - 1 / true), abs=NOISE)
+        assert row['mape_after'] < 0.1
+        assert row['meets_target']
+
+
+def test_bootstrap_identical_across_workers(data, calibration):
+    _, predicted, segments, actual = data
+    parallel = fit_calibration(predicted, actual, segments, n_bootstrap=200, seed=7, workers=2)
+    for c in ('C2', 'C3'):
+        assert np.array_equal(parallel.kappa[c], calibration.kappa[c])
+        assert np.array_equal(parallel.low[c], calibration.low[c])
+        assert np.array_equal(parallel.high[c], calibration.high[c])
+    reseeded = fit_calibration(predicted, actual, segments, n_bootstrap=200, seed=8)
+    assert not np.array_equal(reseeded.low['C2'], calibration.low['C2'])
+
+
+def test_batch_calibration_matches_apply(data, calibration):
+    portfolio, predicted, segments, _ = data
+    factors = calibration.factors(segments)
+    scored = calculate_tcd_v4_batch(**portfolio, calibration=factors)
+    applied = calibration.apply(predicted, portfolio['P'], segments)
+    for k in scored:
+        assert np.array_equal(scored[k], applied[k]), k
+    kappa = factors['C3']
+    assert np.array_equal(scored['C3'], predicted['C3'] * kappa)
+    assert np.array_equal(scored['C1'], predicted['C1'])
+    assert not np.array_equal(scored['TCD'], predicted['TCD'])
+
+
+def test_apply_uses_coefficient_overrides(data, calibration):
+    portfolio, _, segments, _ = data
+    overrides = {'overlap': 0.8, 'cap': 2.0}
+    predicted = calculate_tcd_v4_batch(**portfolio, coefficients=overrides)
+    scored = calculate_tcd_v4_batch(**portfolio, coefficients=overrides, calibration=calibration.factors(segments))
+    applied = calibration.apply(predicted, portfolio['P'], segments, coefficients=overrides)
+    assert np.array_equal(scored['TCD'], applied['TCD'])
+    assert np.all(applied['TCD'] <= portfolio['P'] * 2.0)
+
+
+def test_unknown_component_and_segment_rejected(data, calibration):
+    portfolio = data[0]
+    with pytest.raises(ValueError, match="Unknown component"):
+        calculate_tcd_v4_batch(**portfolio, calibration={'C7': 1.0})
+    with pytest.raises(ValueError, match="No calibration for segment"):
+        calibration.factors(['mining'])
+
+
+def test_segment_without_actuals_left_uncalibrated(data, calibration):
+    _, predicted, segments, actual = data
+    actual = dict(actual, C3=np.where(segments == 'health', np.nan, actual['C3']))
+    with pytest.warns(RuntimeWarning, match=r"C3 in segment\(s\) \['health'\]"):
+        partial = fit_calibration(predicted, actual, segments, n_bootstrap=50, seed=7)
+    health = partial.segments.index('health')
+    assert partial.kappa['C3'][health] == 1.0 and partial.n['C3'][health] == 0
+    assert np.isnan(partial.low['C3'][health]) and np.isnan(partial.high['C3'][health])
+    np.testing.assert_array_equal(partial.kappa['C2'], calibration.kappa['C2'])
+    others = np.arange(len(partial.segments)) != health
+    np.testing.assert_array_equal(partial.kappa['C3'][others], calibration.kappa['C3'][others])
+    assert np.all(np.isfinite(partial.low['C3'][others]))
+    factors = partial.factors(segments)['C3']
+    assert np.all(factors[segments == 'health'] == 1.0)
+
+
+def test_sharded_scoring_carries_factors(data, calibration):
+    portfolio, _, segments, _ = data
+    factors = calibration.factors(segments)
+    expected = calculate_tcd_v4_batch(**portfolio, calibration=factors)
+    shards = [({**portfolio, 'calibration': factors}, None)]
+    for workers in (1, 2):
+        [(_, out)] = score_shards(shards, workers)
+        assert np.array_equal(out[0], expected['TCD'])
+
+
+def test_save_load_and_pipeline(tmp_path, data, calibration):
+    portfolio, _, segments, _ = data
+    path = tmp_path / 'calibration.json'
+    calibration.save(path)
+    loaded = Calibration.load(path)
+    assert loaded.segments == calibration.segments
+    for c in calibration.components:
+        assert np.array_equal(loaded.kappa[c], calibration.kappa[c])
+        assert np.array_equal(loaded.n[c], calibration.n[c])
+
+    rows = 500
+    source = tmp_path / 'teams.csv'
+    with open(source, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['team_id', 'segment', 'payroll', 'team_size', *DRIVERS, 'phi', 'turnover_multiplier', 'bv'])
+        for i in range(rows):
+            writer.writerow([i, segments[i], repr(float(portfolio['P'][i])), repr(float(portfolio['N'][i])),
+                             *[repr(float(portfolio['drivers'][k][i])) for k in DRIVERS],
+                             repr(float(portfolio['phi'][i])), repr(float(portfolio['rho'][i])),
+                             repr(float(portfolio['BV'][i]))])
+    output = tmp_path / 'scores.csv'
+    score_file(str(source), str(output), chunk_size=128, progress=None,
+               calibration={'path': str(path), 'segment': 'segment'})
+    with open(output) as f:
+        tcd = np.array([float(row['TCD']) for row in csv.DictReader(f)])
+    head = {k: v[:rows] for k, v in portfolio.items() if k != 'drivers'}
+    head['drivers'] = {k: v[:rows] for k, v in portfolio['drivers'].items()}
+    expected = calculate_tcd_v4_batch(**head, calibration=calibration.factors(segments[:rows]))
+    assert np.array_equal(tcd, expected['TCD'])
+
+    with pytest.raises(ValueError, match="Segment column 'unit'"):
+        score_file(str(source), str(tmp_path / 'other.csv'), progress=None,
+                   calibration={'path': str(path), 'segment': 'unit'})
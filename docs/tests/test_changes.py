@@ -0,0 +1,137 @@
+"""Material change detection between two scored snapshots."""
+
+import csv
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.batch import random_portfolio
+from tcd.changes import compare_snapshots
+from tcd.parallel import output_keys, score_portfolio
+from tcd.replay import materiality_threshold
+
+TEAMS = 12
+CI = {'n_samples': 500}
+
+
+def subset(portfolio, rows):
+    out = {k: v[rows] for k, v in portfolio.items() if k != 'drivers'}
+    out['drivers'] = {k: v[rows] for k, v in portfolio['drivers'].items()}
+    return out
+
+
+def write_snapshot(path, ids, portfolio, ci=CI):
+    scored = score_portfolio(**portfolio, ci=ci)
+    columns = ['team_id', 'payroll', *output_keys(ci)]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for i, team in enumerate(ids):
+            writer.writerow([team, repr(float(portfolio['P'][i]))] + [repr(float(scored[k][i])) for k in columns[2:]])
+    return scored
+
+
+@pytest.fixture
+def waves(tmp_path):
+    """Wave 1 holds teams t0-t9; wave 2 drops t0, adds t10 and t11, and lists the rest in reverse.
+
+    t3 gets much worse (material), t4 moves by a hair (not material), t5 improves (material).
+    """
+    portfolio = random_portfolio(TEAMS, seed=8)
+    portfolio['drivers'] = {k: np.full(TEAMS, 4.0) for k in DRIVERS}
+    ids = [f't{i}' for i in range(TEAMS)]
+    before_rows = list(range(10))
+    after_rows = list(range(11, 0, -1))
+    later = subset(portfolio, np.arange(TEAMS))
+    later['drivers']['trust'][3] = 1.0
+    later['drivers']['communication'][3] = 1.0
+    later['drivers']['tms'][4] = 4.0001
+    later['drivers']['goal_clarity'][5] = 6.5
+
+    before = write_snapshot(tmp_path / 'wave1.csv', [ids[i] for i in before_rows], subset(portfolio, before_rows))
+    after = write_snapshot(tmp_path / 'wave2.csv', [ids[i] for i in after_rows], subset(later, after_rows))
+    by_id = {ids[i]: (before['TCD'][j], None) for j, i in enumerate(before_rows)}
+    for j, i in enumerate(after_rows):
+        by_id[ids[i]] = (by_id.get(ids[i], (None,))[0], after['TCD'][j])
+    return lambda name: str(tmp_path / name), by_id
+
+
+def read(path):
+    with open(path, newline='') as f:
+        return {row['team_id']: row for row in csv.DictReader(f)}
+
+
+def test_material_changes_only(waves):
+    path, by_id = waves
+    summary = compare_snapshots(path('wave1.csv'), path('wave2.csv'), path('changes.csv'), ci_samples=0,
+                                chunk_size=3, progress=None)
+    rows = read(path('changes.csv'))
+    assert sorted(rows) == ['t3', 't5']
+    assert summary['before_rows'] == 10 and summary['after_rows'] == 11
+    assert (summary['matched'], summary['added'], summary['removed']) == (9, 2, 1)
+    assert (summary['material'], summary['material_up'], summary['material_down']) == (2, 1, 1)
+
+    for team, row in rows.items():
+        TCD_a, TCD_b = by_id[team]
+        assert row['status'] == 'changed'
+        assert float(row['TCD_before']) == TCD_a and float(row['TCD_after']) == TCD_b
+        assert float(row['TCD_delta']) == TCD_b - TCD_a
+        assert float(row['materiality_threshold']) == materiality_threshold(np.array([TCD_a]))[0]
+        assert 'p_material' not in row
+
+    # The hair-width change on t4 stays below the threshold
+    TCD_a, TCD_b = by_id['t4']
+    assert 0 < abs(TCD_b - TCD_a) < materiality_threshold(np.array([TCD_a]))[0]
+
+
+def test_membership_and_p_material(waves):
+    path, _ = waves
+    summary = compare_snapshots(path('wave1.csv'), path('wave2.csv'), path('changes.csv'), ci_samples=2000,
+                                membership=True, progress=None)
+    rows = read(path('changes.csv'))
+    assert {team: row['status'] for team, row in rows.items()} == {
+        't3': 'changed', 't5': 'changed', 't10': 'added', 't11': 'added', 't0': 'removed'}
+    assert rows['t0']['TCD_after'] == 'nan' and rows['t10']['TCD_before'] == 'nan'
+    assert rows['t10']['TCD_delta'] == 'nan' and rows['t10']['significant'] == 'False'
+
+    assert float(rows['t3']['p_material']) == 1.0 and rows['t3']['significant'] == 'True'
+    assert 0 <= float(rows['t5']['p_material']) <= 1
+    assert summary['significant'] == sum(row['significant'] == 'True' for row in rows.values())
+
+    # Same seed, same draws
+    again = compare_snapshots(path('wave1.csv'), path('wave2.csv'), path('again.csv'), ci_samples=2000,
+                              membership=True, progress=None)
+    assert again == summary
+    assert read(path('again.csv')) == rows
+
+
+def test_without_ci_columns_no_probability(tmp_path):
+    portfolio = random_portfolio(4, seed=1)
+    write_snapshot(tmp_path / 'a.csv', ['a', 'b', 'c', 'd'], portfolio, ci=None)
+    write_snapshot(tmp_path / 'b.csv', ['a', 'b', 'c', 'd'], portfolio, ci=None)
+    summary = compare_snapshots(str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv'), str(tmp_path / 'out.csv'),
+                                progress=None)
+    assert summary['material'] == 0 and 'significant' not in summary
+    assert read(tmp_path / 'out.csv') == {}
+
+
+@pytest.mark.parametrize('before_ids, after_ids, culprit', [
+    (['a', 'b', 'a', 'c'], ['a', 'b', 'c', 'd'], 'wave1'),   # duplicate in the index
+    (['a', 'b', 'c', 'd'], ['a', 'b', 'b', 'c'], 'wave2'),   # duplicate matched team, same chunk
+    (['a', 'b', 'c', 'd'], ['a', 'b', 'c', 'a'], 'wave2'),   # duplicate matched team, later chunk
+    (['a', 'b', 'c', 'd'], ['a', 'x', 'b', 'x'], 'wave2'),   # duplicate added team
+])
+def test_duplicate_ids_rejected(tmp_path, before_ids, after_ids, culprit):
+    portfolio = random_portfolio(4, seed=1)
+    write_snapshot(tmp_path / 'wave1.csv', before_ids, portfolio, ci=None)
+    write_snapshot(tmp_path / 'wave2.csv', after_ids, portfolio, ci=None)
+    with pytest.raises(ValueError, match=f"{culprit}.csv: team '.' appears more than once"):
+        compare_snapshots(str(tmp_path / 'wave1.csv'), str(tmp_path / 'wave2.csv'), chunk_size=2, progress=None)
+
+
+def test_missing_id_column(tmp_path):
+    portfolio = random_portfolio(2, seed=1)
+    write_snapshot(tmp_path / 'a.csv', ['a', 'b'], portfolio, ci=None)
+    with pytest.raises(ValueError, match="no 'team' column"):
+        compare_snapshots(str(tmp_path / 'a.csv'), str(tmp_path / 'a.csv'), id_column='team', progress=None)
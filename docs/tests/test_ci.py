@@ -0,0 +1,132 @@
+"""Confidence intervals: the analytic interval agrees with Monte Carlo sampling; sampling methods."""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import tcd.ci
+from tcd import DRIVERS
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.ci import (COEFFICIENT_HIGH, COEFFICIENT_LOW, SAMPLING_METHODS, ci_convergence, draw_coefficients,
+                    portfolio_percentiles, simulate_tcd, tcd_confidence_interval, tcd_confidence_intervals_batch,
+                    tcd_linear_terms_batch)
+
+TEAMS = 300
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    portfolio = random_portfolio(TEAMS, seed=4)
+    # Perfect drivers on some teams zero most coefficient terms (folded components)
+    for k in DRIVERS:
+        portfolio['drivers'][k][:20] = 7.0
+    return portfolio
+
+
+def test_batch_analytic_matches_monte_carlo(portfolio):
+    analytic = tcd_confidence_intervals_batch(**portfolio, method='analytic')
+    sampled = tcd_confidence_intervals_batch(**portfolio, n_samples=200_000, seed=1)
+    for k in ('low', 'high', 'mean'):
+        assert np.allclose(analytic[k], sampled[k], rtol=0.005), k
+    assert np.all(analytic['low'] <= analytic['TCD'] * (1 + 1e-12))
+    assert np.all(analytic['TCD'] <= analytic['high'] * (1 + 1e-12))
+
+
+def test_capped_teams_agree(portfolio):
+    capped = dict(portfolio, drivers={k: np.full(TEAMS, 1.0) for k in DRIVERS}, BV=10.0)
+    analytic = tcd_confidence_intervals_batch(**capped, method='analytic')
+    sampled = tcd_confidence_intervals_batch(**capped, n_samples=200_000, seed=1)
+    assert np.any(analytic['high'] == portfolio['P'] * 3.5)
+    for k in ('low', 'high', 'mean'):
+        assert np.allclose(analytic[k], sampled[k], rtol=0.005), k
+
+
+@pytest.mark.parametrize('row', [0, 25, 150])
+def test_single_team_cross_check(portfolio, row):
+    team = {k: v[row] for k, v in portfolio.items() if k != 'drivers'}
+    team['drivers'] = {k: v[row] for k, v in portfolio['drivers'].items()}
+    interval = tcd_confidence_interval(team, method='analytic')
+    assert interval['cross_check']['ok']
+    assert interval['n_samples'] == 0 and interval['cross_check']['n_samples'] == 20_000
+    batch = tcd_confidence_intervals_batch(**portfolio, method='analytic')
+    assert interval['low'] == pytest.approx(batch['low'][row], rel=1e-12)
+    assert interval['high'] == pytest.approx(batch['high'][row], rel=1e-12)
+
+
+def test_bad_confidence_rejected(portfolio):
+    with pytest.raises(ValueError, match="confidence"):
+        tcd_confidence_intervals_batch(**portfolio, method='analytic', confidence=1.0)
+
+
+def test_cross_check_reports_a_mismatch(portfolio, monkeypatch):
+    team = {k: v[150] for k, v in portfolio.items() if k != 'drivers'}
+    team['drivers'] = {k: v[150] for k, v in portfolio['drivers'].items()}
+    exact = tcd.ci.analytic_interval
+    monkeypatch.setattr(tcd.ci, 'analytic_interval', lambda *args: [v * 1.02 for v in exact(*args)])
+    with pytest.warns(RuntimeWarning, match="differs from Monte Carlo"):
+        interval = tcd_confidence_interval(team, method='analytic')
+    assert not interval['cross_check']['ok']
+    assert interval['cross_check']['max_rel_diff'] == pytest.approx(0.02, abs=0.005)
+    assert 'cross_check' not in tcd_confidence_interval(team, method='analytic', cross_check=False)
+
+
+@pytest.mark.parametrize('max_bytes', [1, 2 * 1000 * 8 * 7, 2 * 1000 * 8 * TEAMS - 1])
+def test_blocked_percentiles_equal_unblocked(portfolio, max_bytes):
+    terms = tcd_linear_terms_batch(portfolio['P'], calculate_tcd_v4_batch(**portfolio))
+    coefficients = draw_coefficients(1000, seed=2)
+    samples = simulate_tcd(*terms, coefficients)
+    q = [2.5, 50, 97.5]
+    portfolio_percentiles(*terms, coefficients[:16], q)  # first-call allocations are not the block's
+    tracemalloc.start()
+    percentiles, means = portfolio_percentiles(*terms, coefficients, q, max_bytes=max_bytes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # One-team blocks go through a matrix-vector product, which may round the last bit differently
+    np.testing.assert_allclose(percentiles, np.percentile(samples, q, axis=1), rtol=1e-15, atol=0)
+    np.testing.assert_allclose(means, samples.mean(axis=1), rtol=1e-15, atol=0)
+    # The block and np.percentile's copy of it stay within the budget (plus the results themselves)
+    assert peak <= max(max_bytes, 2 * 1000 * 8) + 32 * TEAMS * 8
+
+
+@pytest.mark.parametrize('method', SAMPLING_METHODS)
+@pytest.mark.filterwarnings('ignore:The balance properties')
+@pytest.mark.parametrize('n', [1, 1023, 1024])
+def test_draw_coefficients_shape_and_bounds(method, n):
+    draws = draw_coefficients(n, seed=5, method=method)
+    assert draws.shape == (n, 5)
+    assert np.all(draws >= COEFFICIENT_LOW) and np.all(draws <= COEFFICIENT_HIGH)
+    assert np.array_equal(draws, draw_coefficients(n, seed=5, method=method))
+    if n > 1:
+        assert not np.array_equal(draws, draw_coefficients(n, seed=6, method=method))
+
+
+def test_draw_coefficients_bad_arguments():
+    with pytest.raises(ValueError, match="at least 1"):
+        draw_coefficients(0)
+    with pytest.raises(ValueError, match="Unknown sampling method"):
+        draw_coefficients(16, method='stratified')
+
+
+@pytest.fixture(scope='module')
+def convergence(portfolio):
+    team = {k: v[150] for k, v in portfolio.items() if k != 'drivers'}
+    team['drivers'] = {k: v[150] for k, v in portfolio['drivers'].items()}
+    return {method: ci_convergence(team, method, sizes=(4096,), n_replicates=48)['convergence'][0]
+            for method in SAMPLING_METHODS}
+
+
+@pytest.mark.parametrize('method', ['sobol', 'halton'])
+def test_qmc_reduces_percentile_error(convergence, method):
+    """Measured gain is about 2-3x in standard error (see draw_coefficients)."""
+    for bound in ('low_se', 'high_se'):
+        assert convergence[method][bound] < convergence['random'][bound] / 1.5, bound
+
+
+@pytest.mark.parametrize('method', ['antithetic', 'lhs'])
+def test_other_methods_agree_with_random(convergence, method):
+    """No real gain for the bounds, but the same interval within the replicate noise."""
+    for bound in ('low', 'high'):
+        se = convergence['random'][f'{bound}_se']
+        assert convergence[method][bound] == pytest.approx(convergence['random'][bound], abs=2 * se)
+        assert convergence[method][f'{bound}_se'] < 2 * se
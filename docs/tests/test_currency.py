@@ -0,0 +1,131 @@
+"""Currency conversion: spot and period-average lookups, the content-hash cache and pipeline conversion."""
+
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.currency import RateTable, convert
+from tcd.pipeline import chunk_inputs, convert_chunk, main
+
+RATES = """date,EUR,GBP
+2024-01-02,1.10,1.27
+2024-01-03,1.12,
+2024-01-31,1.08,1.25
+2024-02-01,1.09,1.26
+2024-04-15,,1.30
+"""
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('TCD_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+
+@pytest.fixture
+def rates_csv(tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text(RATES)
+    return str(path)
+
+
+@pytest.fixture
+def rates(cache, rates_csv):
+    return RateTable.from_csv(rates_csv, base='USD')
+
+
+def test_spot_is_latest_on_or_before(rates):
+    got = rates.spot(['EUR', 'EUR', 'GBP', 'GBP', 'EUR', 'USD'],
+                     ['2024-01-02', '2024-01-04', '2024-01-03', '2024-03-01', '2024-12-31', '2024-02-10'])
+    assert got.tolist() == [1.10, 1.12, 1.27, 1.26, 1.09, 1.0]
+    with pytest.raises(ValueError, match="No EUR rate on or before 2023-12-31"):
+        rates.spot(['EUR'], ['2023-12-31'])
+    with pytest.raises(ValueError, match="No rates for currency 'JPY'"):
+        rates.spot(['JPY'], ['2024-01-02'])
+
+
+def test_period_averages(rates):
+    assert rates.average(['EUR'], ['2024-01-20'], 'M')[0] == pytest.approx((1.10 + 1.12 + 1.08) / 3)
+    # Blank cells are skipped, not counted as zero
+    assert rates.average(['GBP'], ['2024-01-20'], 'M')[0] == pytest.approx((1.27 + 1.25) / 2)
+    assert rates.average(['EUR'], ['2024-03-31'], 'Q')[0] == pytest.approx((1.10 + 1.12 + 1.08 + 1.09) / 4)
+    assert rates.average(['GBP'], ['2024-06-30'], 'Y')[0] == pytest.approx((1.27 + 1.25 + 1.26 + 1.30) / 4)
+    with pytest.raises(ValueError, match="No EUR rates in the M period"):
+        rates.average(['EUR'], ['2024-04-30'], 'M')
+    with pytest.raises(ValueError, match="method must be one of"):
+        rates.rate(['EUR'], ['2024-01-02'], method='close')
+
+
+def test_content_hash_cache(cache, rates_csv, rates, monkeypatch):
+    (directory,) = os.listdir(cache)
+    assert directory.startswith('rates-')
+
+    # Same content: memory-mapped from the cache without parsing
+    def no_parse(*args):
+        raise AssertionError("parsed again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(RateTable, '_parse_csv', staticmethod(no_parse))
+        again = RateTable.from_csv(rates_csv, base='USD')
+    assert isinstance(again.rates, np.memmap)
+    assert np.array_equal(again.rates, rates.rates, equal_nan=True)
+
+    # New content or another base currency: a new cache entry
+    with open(rates_csv, 'a') as f:
+        f.write('2024-05-01,1.07,1.24\n')
+    changed = RateTable.from_csv(rates_csv, base='USD')
+    assert changed.spot(['EUR'], ['2024-05-02'])[0] == 1.07
+    RateTable.from_csv(rates_csv, base='EUR')
+    assert len(os.listdir(cache)) == 3
+
+
+def test_ppp_multiplies_rate(rates):
+    amounts, rate = convert([100.0, 100.0], ['EUR', 'GBP'], ['2024-01-02'] * 2, rates, 'spot',
+                            ppp={'EUR': 0.5, 'GBP': 2.0})
+    assert rate.tolist() == [0.55, 2.54]
+    assert amounts.tolist() == pytest.approx([55.0, 254.0])
+    with pytest.raises(ValueError, match="No PPP factor for currency 'GBP'"):
+        convert([1.0], ['GBP'], ['2024-01-02'], rates, ppp={'EUR': 1.0})
+
+
+def chunk(**extra):
+    base = {'payroll': ['1000000', '2000000'], 'team_size': ['10', '12'], 'phi': ['1.0', '1.1'],
+            'turnover_multiplier': ['1.0', '1.0'], 'currency': ['EUR', 'GBP'], 'date': ['2024-01-02'] * 2}
+    base.update({k: ['4.0', '5.0'] for k in DRIVERS})
+    base.update(extra)
+    return base
+
+
+def test_revenue_converted_at_its_own_rate(rates):
+    raw = chunk(revenue=['3000000', '4000000'], revenue_currency=['USD', 'EUR'])
+    inputs, rate = convert_chunk(raw, chunk_inputs(raw), rates, {'method': 'spot'})
+    assert rate.tolist() == [1.10, 1.27]
+    assert inputs['P'].tolist() == pytest.approx([1_100_000, 2_540_000])
+    assert inputs['BV'].tolist() == pytest.approx([3_000_000 / 1_100_000, 4_000_000 * 1.10 / 2_540_000])
+
+
+def test_bv_column_not_rescaled(rates):
+    raw = chunk(bv=['2.5', '3.0'], revenue_currency=['USD', 'EUR'])
+    inputs, _ = convert_chunk(raw, chunk_inputs(raw), rates, {'method': 'spot'})
+    assert inputs['BV'].tolist() == [2.5, 3.0]
+
+
+def test_cli_ppp(cache, rates_csv, tmp_path):
+    source = tmp_path / 'teams.csv'
+    raw = chunk(bv=['2.5', '3.0'])
+    with open(source, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(raw))
+        writer.writerows(zip(*raw.values()))
+    output = tmp_path / 'scores.csv'
+    main([str(source), str(output), '--rates', rates_csv, '--rate-method', 'spot',
+          '--ppp', 'EUR=0.5', '--ppp', 'GBP=2', '--quiet'])
+    with open(output) as f:
+        assert [float(row['fx_rate']) for row in csv.DictReader(f)] == [0.55, 2.54]
+    with pytest.raises(SystemExit):
+        main([str(source), str(tmp_path / 'other.csv'), '--ppp', 'EUR=0.5'])
+    with pytest.raises(SystemExit):
+        main([str(source), str(tmp_path / 'other.csv'), '--rates', rates_csv, '--ppp', 'EUR=x'])
@@ -0,0 +1,85 @@
+"""Rolling assessment history: ring-buffer wrap, scalar vs batch averages and persistence."""
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.history import ROLLING_WEIGHTS, DriverHistory
+
+TEAMS = 50
+ROUNDS = 7
+
+
+def assessments(seed=0):
+    """ROUNDS assessments per team, as (team ids, {driver: scores}) per round; some out of [1, 7]."""
+    rng = np.random.default_rng(seed)
+    return [(rng.permutation(TEAMS), {k: rng.uniform(0, 8, TEAMS) for k in DRIVERS}) for _ in range(ROUNDS)]
+
+
+def expected_average(history_rows):
+    """FIX V10 weighted average of the last len(ROLLING_WEIGHTS) rows (most recent last)."""
+    recent = np.clip(history_rows[::-1][:len(ROLLING_WEIGHTS)], 1, 7)
+    w = np.array(ROLLING_WEIGHTS[:len(recent)])
+    return (w[:, None] * recent).sum(axis=0) / w.sum()
+
+
+def test_ring_buffer_wraps():
+    history = DriverHistory(1)
+    rows = []
+    for r in range(ROUNDS):
+        scores = {k: float(r + 1 + j / 10) for j, k in enumerate(DRIVERS)}
+        history.submit(0, scores)
+        rows.append([scores[k] for k in DRIVERS])
+        assert history.count[0] == min(r + 1, len(ROLLING_WEIGHTS))
+        assert history.head[0] == (r + 1) % len(ROLLING_WEIGHTS)
+        assert np.allclose(list(history.drivers(0).values()), expected_average(np.array(rows)))
+    # After ROUNDS submissions only the last three are kept, oldest overwritten
+    assert sorted(history.scores[0, :, 0].tolist()) == [5.0, 6.0, 7.0]
+
+
+def test_scalar_and_batch_averages_match():
+    scalar, batch = DriverHistory(TEAMS), DriverHistory(TEAMS)
+    for teams, scores in assessments():
+        for row, team in enumerate(teams):
+            scalar.submit(int(team), {k: v[row] for k, v in scores.items()})
+        batch.submit_batch(teams, scores)
+        assert np.array_equal(scalar.average, batch.average)
+        assert np.array_equal(scalar.head, batch.head)
+        assert np.array_equal(scalar.count, batch.count)
+
+
+def test_batch_duplicates_in_row_order():
+    once, repeated = DriverHistory(2), DriverHistory(2)
+    rounds = assessments()[:4]
+    for teams, scores in rounds:
+        once.submit_batch(teams[:2] % 2, {k: v[:2] for k, v in scores.items()})
+    teams = np.concatenate([t[:2] % 2 for t, _ in rounds])
+    repeated.submit_batch(teams, {k: np.concatenate([s[k][:2] for _, s in rounds]) for k in DRIVERS})
+    assert np.array_equal(once.average, repeated.average)
+
+
+def test_drivers_batch_requires_assessments():
+    history = DriverHistory(3)
+    history.submit(0, {k: 4.0 for k in DRIVERS})
+    assert history.drivers_batch([0])['trust'].tolist() == [4.0]
+    with pytest.raises(ValueError, match="Team 1 has no assessments"):
+        history.drivers_batch()
+    with pytest.raises(ValueError, match="Team ids must be in"):
+        history.submit_batch([3], {k: [4.0] for k in DRIVERS})
+
+
+def test_persisted_history_reopens_and_is_not_overwritten(tmp_path):
+    path = str(tmp_path / 'history')
+    history = DriverHistory(TEAMS, path=path)
+    for teams, scores in assessments():
+        history.submit_batch(teams, scores)
+    history.flush()
+    average = np.array(history.average)
+    del history
+
+    with pytest.raises(FileExistsError, match="DriverHistory.open"):
+        DriverHistory(TEAMS, path=path)
+    reopened = DriverHistory.open(path)
+    assert np.array_equal(reopened.average, average)
+    reopened.submit(0, {k: 1.0 for k in DRIVERS})
+    assert reopened.count[0] == len(ROLLING_WEIGHTS)
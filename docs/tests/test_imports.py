@@ -0,0 +1,32 @@
+"""Import cost: the tcd package leaves the heavy optional dependencies unimported."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+DOCS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('sympy', 'scipy', 'pandas', 'mpmath', 'hypothesis')
+
+
+def imported_after(code):
+    """Heavy modules in sys.modules after running code in a fresh interpreter."""
+    script = f"import sys\n{code}\nprint(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, '-c', script], cwd=DOCS, capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+
+@pytest.mark.parametrize('code', [
+    "import tcd",
+    "import tcd\ntcd.calculate_tcd_v4(1e6, 10, {k: 4.0 for k in tcd.DRIVERS}, 1.0, 1.0, 2.0)",
+    "import tcd\ntcd.calculate_tcd_v4_batch, tcd.tcd_confidence_interval, tcd.AuditLog",
+])
+def test_import_leaves_heavy_modules_out(code):
+    assert imported_after(code) == []
+
+
+def test_bare_import_leaves_numpy_out():
+    out = subprocess.run([sys.executable, '-c', "import sys, tcd; print('numpy' in sys.modules)"], cwd=DOCS,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == 'False'
@@ -0,0 +1,162 @@
+"""v4 invariants: Section 5 of symbolic_proofs.py, plus whole-portfolio checks."""
+
+import numpy as np
+from hypothesis import given, strategies as st
+
+from tcd import DRIVERS, calculate_tcd_v4, sigmoid_e_coef, team_size_factor
+from tcd.batch import calculate_tcd_v4_batch
+
+seeds = st.integers(min_value=0, max_value=2**32 - 1)
+
+
+def team_arrays(seed, rows):
+    """Random portfolio including out-of-range inputs and integer Likert scores."""
+    rng = np.random.default_rng(seed)
+    drivers = {}
+    for k in DRIVERS:
+        d = rng.uniform(-10, 20, rows)
+        likert = rng.random(rows) < 0.5
+        d[likert] = rng.integers(1, 8, likert.sum())
+        drivers[k] = d
+    return {
+        'P': rng.uniform(1000, 1e9, rows),
+        'N': rng.integers(1, 1001, rows).astype(float),
+        'drivers': drivers,
+        'phi': rng.uniform(0.5, 1.6, rows),
+        'rho': rng.uniform(0.6, 1.5, rows),
+        'BV': rng.uniform(0, 15, rows),
+    }
+
+
+def score(teams, **changes):
+    t = {**teams, **changes}
+    return calculate_tcd_v4_batch(t['P'], t['N'], t['drivers'], t['phi'], t['rho'], t['BV'])
+
+
+def row(teams, i):
+    """Row i as calculate_tcd_v4 keyword arguments, for failure messages."""
+    return {'P': float(teams['P'][i]), 'N': int(teams['N'][i]),
+            'drivers': {k: float(v[i]) for k, v in teams['drivers'].items()},
+            'phi': float(teams['phi'][i]), 'rho': float(teams['rho'][i]), 'BV': float(teams['BV'][i])}
+
+
+def assert_rows(ok, teams):
+    bad = np.flatnonzero(~ok)
+    assert bad.size == 0, f"{bad.size} teams fail, first {row(teams, bad[0])}"
+
+
+# Section 5, one team per example
+
+@given(
+    P=st.floats(min_value=1000, max_value=1e9),
+    N=st.integers(min_value=1, max_value=1000),
+    d=st.lists(st.floats(min_value=-10, max_value=20), min_size=7, max_size=7),
+)
+def test_boundedness_lower(P, N, d):
+    result = calculate_tcd_v4(P, N, dict(zip(DRIVERS, d)), 1.0, 1.0, 3.0)
+    assert result['TCD'] >= 0
+
+
+def test_perfect_team():
+    result = calculate_tcd_v4(1000000, 10, {k: 7.0 for k in DRIVERS}, 1.0, 1.0, 3.0)
+    assert abs(result['TCD']) < 0.01
+
+
+@given(base_score=st.floats(min_value=1, max_value=6), improvement=st.floats(min_value=0.1, max_value=1.0))
+def test_monotonicity(base_score, improvement):
+    base = {k: base_score for k in DRIVERS}
+    improved = {**base, 'trust': base_score + improvement}
+    assert (calculate_tcd_v4(1000000, 10, improved, 1.0, 1.0, 3.0)['TCD']
+            <= calculate_tcd_v4(1000000, 10, base, 1.0, 1.0, 3.0)['TCD'])
+
+
+@given(P=st.floats(min_value=100000, max_value=1e8), multiplier=st.floats(min_value=1.5, max_value=5.0))
+def test_proportionality(P, multiplier):
+    drivers = {k: 4.0 for k in DRIVERS}
+    ratio = (calculate_tcd_v4(P * multiplier, 10, drivers, 1.0, 1.0, 3.0)['TCD']
+             / calculate_tcd_v4(P, 10, drivers, 1.0, 1.0, 3.0)['TCD'])
+    assert abs(ratio - multiplier) < 0.01
+
+
+def test_continuity():
+    E_coefs = [sigmoid_e_coef(E) for E in np.linspace(1, 7, 1000)]
+    assert np.max(np.abs(np.diff(E_coefs))) < 0.01
+
+
+def test_gaming_detection():
+    normal = {'communication': 4.0, 'trust': 4.5, 'psych_safety': 4.3,
+              'goal_clarity': 4.2, 'coordination': 4.1, 'tms': 4.0, 'team_cognition': 4.4}
+    gaming = {**normal, 'trust': 7.0, 'psych_safety': 2.0}
+    assert calculate_tcd_v4(1000000, 10, normal, 1.0, 1.0, 3.0)['G'] == 1.0
+    result = calculate_tcd_v4(1000000, 10, gaming, 1.0, 1.0, 3.0)
+    assert result['G'] > 1.0
+    assert result['anomaly_score'] > 1.5
+
+
+def test_team_size_factor():
+    assert team_size_factor(3) == 1.2
+    assert team_size_factor(10) == 1.0
+    assert team_size_factor(20) > 1.0
+
+
+def test_input_sanitization():
+    drivers = {'communication': -5, 'trust': 15, 'psych_safety': 0,
+               'goal_clarity': 8, 'coordination': 100, 'tms': -100, 'team_cognition': 4}
+    result = calculate_tcd_v4(1000000, 10, drivers, 2.0, 2.0, 100)
+    assert result['TCD'] > 0
+    assert result['phi'] == 1.4
+
+
+def test_overlap_discount():
+    result = calculate_tcd_v4(1000000, 10, {k: 4.0 for k in DRIVERS}, 1.0, 1.0, 3.0)
+    C_sum = result['C1'] + result['C2'] + result['C3'] + result['C4'] + result['C5'] + result['C6']
+    assert abs(result['subtotal'] - C_sum * 0.88) < 1
+
+
+def test_upper_bound():
+    result = calculate_tcd_v4(1000000, 10, {k: 1.0 for k in DRIVERS}, 1.4, 1.3, 10)
+    assert result['TCD'] / 1000000 <= 3.5
+
+
+# Whole portfolios per example (batch_rows teams; the deep profile scales both)
+
+@given(seed=seeds)
+def test_batch_bounds(seed, batch_rows):
+    teams = team_arrays(seed, batch_rows)
+    TCD = score(teams)['TCD']
+    assert_rows((TCD >= 0) & (TCD <= 3.5 * teams['P']), teams)
+
+
+@given(seed=seeds)
+def test_batch_matches_scalar(seed, batch_rows):
+    teams = team_arrays(seed, batch_rows)
+    result = score(teams)
+    for i in range(min(batch_rows, 8)):
+        expected = calculate_tcd_v4(**row(teams, i))
+        assert all(result[k][i] == expected[k] for k in expected), row(teams, i)
+
+
+@given(seed=seeds, delta=st.floats(min_value=0.01, max_value=3))
+def test_batch_uniform_improvement(seed, delta, batch_rows):
+    """Raising every in-range driver by the same amount cannot raise the anomaly score or TCD."""
+    teams = team_arrays(seed, batch_rows)
+    teams['drivers'] = {k: np.clip(v, 1, 7) for k, v in teams['drivers'].items()}
+    improved = {k: v + delta for k, v in teams['drivers'].items()}
+    before, after = score(teams)['TCD'], score(teams, drivers=improved)['TCD']
+    assert_rows(after <= before * (1 + 1e-12), teams)
+
+
+@given(seed=seeds, driver=st.sampled_from(DRIVERS), delta=st.floats(min_value=0.01, max_value=3))
+def test_batch_single_driver_monotonicity(seed, driver, delta, batch_rows):
+    """Improving one driver never raises TCD unless it raises the gaming penalty."""
+    teams = team_arrays(seed, batch_rows)
+    improved = {**teams['drivers'], driver: teams['drivers'][driver] + delta}
+    before, after = score(teams), score(teams, drivers=improved)
+    assert_rows((after['TCD'] <= before['TCD'] * (1 + 1e-12)) | (after['G'] > before['G']), teams)
+
+
+@given(seed=seeds, multiplier=st.floats(min_value=0.1, max_value=10))
+def test_batch_proportionality(seed, multiplier, batch_rows):
+    teams = team_arrays(seed, batch_rows)
+    before, after = score(teams)['TCD'], score(teams, P=teams['P'] * multiplier)['TCD']
+    assert_rows(np.abs(after - before * multiplier) <= 1e-9 * np.abs(after), teams)
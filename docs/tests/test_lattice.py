@@ -0,0 +1,66 @@
+"""Likert lattice verifier: the invariants on a coarse lattice, checkpoint and resume."""
+
+import json
+import os
+
+import pytest
+
+from tcd import lattice
+from tcd.lattice import verify_lattice
+
+STEP = 2.0              # 4 levels: 4^7 = 16,384 points
+CHUNK_POINTS = 256      # 64 chunks
+
+
+class Interrupt(Exception):
+    pass
+
+
+class StopAfter:
+    """Progress stream that interrupts the run after a number of completed chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def write(self, text):
+        self.chunks -= 1
+        if self.chunks < 0:
+            raise Interrupt
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return verify_lattice(STEP, chunk_points=CHUNK_POINTS, progress=None)
+
+
+def test_invariants_hold(reference):
+    assert reference['points'] == 4 ** 7
+    assert reference['bound_failures'] == 0
+    assert 0 < reference['max_ratio'] <= 3.5
+    assert reference['violations_without_gaming'] == 0
+
+
+def test_resume_after_interruption(reference, tmp_path, monkeypatch):
+    monkeypatch.setattr(lattice, 'CHECKPOINT_INTERVAL', 0.0)
+    checkpoint = str(tmp_path / 'lattice.json')
+    with pytest.raises(Interrupt):
+        verify_lattice(STEP, chunk_points=CHUNK_POINTS, checkpoint=checkpoint, progress=StopAfter(10))
+    with open(checkpoint) as f:
+        assert json.load(f)['next_chunk'] == 11
+    assert verify_lattice(STEP, chunk_points=CHUNK_POINTS, checkpoint=checkpoint, resume=True,
+                          progress=None) == reference
+
+    with pytest.raises(ValueError, match="different lattice or setting"):
+        verify_lattice(STEP, P=2_000_000, chunk_points=CHUNK_POINTS, checkpoint=checkpoint, resume=True)
+
+
+def test_resume_without_checkpoint_starts_over(reference, tmp_path):
+    checkpoint = str(tmp_path / 'lattice.json')
+    assert verify_lattice(STEP, chunk_points=CHUNK_POINTS, checkpoint=checkpoint, resume=True,
+                          progress=None) == reference
+    assert os.path.exists(checkpoint)
+    with pytest.raises(ValueError, match="needs a checkpoint path"):
+        verify_lattice(STEP, chunk_points=CHUNK_POINTS, resume=True)
@@ -0,0 +1,54 @@
+"""Sharded parallel scoring: output byte-identical for any worker count."""
+
+import numpy as np
+import pytest
+
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.formula import RESULT_KEYS
+from tcd.parallel import output_keys, pack_inputs, score_portfolio, scaling_benchmark, unpack_inputs
+
+ROWS = 5_000
+SHARD = 1_024
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    return random_portfolio(ROWS, seed=11)
+
+
+def as_bytes(result, ci=None):
+    return np.stack([result[k] for k in output_keys(ci)]).tobytes()
+
+
+@pytest.mark.parametrize('ci', [None, {'n_samples': 500}, {'n_samples': 512, 'method': 'sobol'},
+                                {'method': 'analytic'}])
+def test_workers_byte_identical(portfolio, ci):
+    single = score_portfolio(**portfolio, workers=1, shard_size=SHARD, ci=ci, seed=9)
+    for workers in (2, 3):
+        parallel = score_portfolio(**portfolio, workers=workers, shard_size=SHARD, ci=ci, seed=9)
+        assert as_bytes(parallel, ci) == as_bytes(single, ci)
+
+
+def test_point_estimates_match_batch(portfolio):
+    scored = score_portfolio(**portfolio, workers=2, shard_size=SHARD)
+    batch = calculate_tcd_v4_batch(**portfolio)
+    for k in RESULT_KEYS:
+        assert np.array_equal(scored[k], batch[k]), k
+
+
+def test_ci_depends_on_seed_not_workers(portfolio):
+    ci = {'n_samples': 300}
+    a = score_portfolio(**portfolio, workers=1, shard_size=SHARD, ci=ci, seed=1)
+    b = score_portfolio(**portfolio, workers=1, shard_size=SHARD, ci=ci, seed=2)
+    assert not np.array_equal(a['TCD_low'], b['TCD_low'])
+
+
+def test_pack_round_trip(portfolio):
+    kwargs = unpack_inputs(pack_inputs(**portfolio))
+    assert np.array_equal(kwargs['P'], portfolio['P'])
+    assert all(np.array_equal(kwargs['drivers'][k], v) for k, v in portfolio['drivers'].items())
+
+
+def test_scaling_benchmark_checks_digests():
+    rows = scaling_benchmark(3_000, workers=(1, 2), shard_size=SHARD, ci={'n_samples': 100})
+    assert rows[0]['sha256'] == rows[1]['sha256']
@@ -0,0 +1,144 @@
+"""Streaming scorer: chunked CSV reading, checkpoint/resume and the Parquet dataset writer."""
+
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.pipeline import CsvChunkReader, checkpoint_path, score_file
+
+ROWS = 1_000
+COLUMNS = ['team_id', 'note', 'payroll', 'team_size', *DRIVERS, 'industry', 'turnover_multiplier', 'revenue']
+
+
+def note(i):
+    """Free text with quoted newlines, doubled quotes and commas on some rows."""
+    return f'line one\nline "two", of {i}' if i % 7 == 0 else f'team {i}'
+
+
+@pytest.fixture(scope='module')
+def teams(tmp_path_factory):
+    portfolio = random_portfolio(ROWS, seed=5)
+    path = tmp_path_factory.mktemp('input') / 'teams.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(ROWS):
+            if i == 500:
+                writer.writerow([])
+            writer.writerow([i, note(i), repr(float(portfolio['P'][i])), repr(float(portfolio['N'][i])),
+                             *[repr(float(portfolio['drivers'][k][i])) for k in DRIVERS], 'Technology',
+                             repr(float(portfolio['rho'][i])), repr(float(portfolio['BV'][i] * portfolio['P'][i]))])
+    return str(path), portfolio
+
+
+def expected_tcd(portfolio):
+    inputs = dict(portfolio, phi=1.20)
+    # The file holds revenue = BV x P; the pipeline divides it back by P
+    inputs['BV'] = portfolio['BV'] * portfolio['P'] / portfolio['P']
+    return calculate_tcd_v4_batch(**inputs)['TCD']
+
+
+def read_output(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 64, 333, ROWS + 1])
+def test_chunks_keep_quoted_newlines(teams, chunk_size):
+    path, _ = teams
+    reader = CsvChunkReader(path, chunk_size)
+    try:
+        chunks = list(reader)
+    finally:
+        reader.close()
+    assert reader.columns == COLUMNS
+    assert all(len(chunk['team_id']) == chunk_size for chunk in chunks[:-1])
+    assert [int(i) for chunk in chunks for i in chunk['team_id']] == list(range(ROWS))
+    assert [v for chunk in chunks for v in chunk['note']] == [note(i) for i in range(ROWS)]
+
+
+def test_unterminated_quote_rejected(tmp_path):
+    path = tmp_path / 'bad.csv'
+    path.write_text('team_id,note\n1,"open\n2,x\n')
+    reader = CsvChunkReader(str(path), 10)
+    with pytest.raises(ValueError, match="Unterminated quoted field"):
+        list(reader)
+    reader.close()
+
+
+def test_score_file_matches_batch(teams, tmp_path):
+    path, portfolio = teams
+    output = str(tmp_path / 'scores.csv')
+    assert score_file(path, output, chunk_size=128, keep=['team_id', 'note'], progress=None) == ROWS
+    rows = read_output(output)
+    assert [row['note'] for row in rows] == [note(i) for i in range(ROWS)]
+    assert np.array_equal([float(row['TCD']) for row in rows], expected_tcd(portfolio))
+    assert not os.path.exists(checkpoint_path(output))
+
+
+class Interrupt(Exception):
+    pass
+
+
+class StopAfter:
+    """Progress stream that interrupts the run after a number of completed chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def write(self, text):
+        self.chunks -= 1
+        if self.chunks < 0:
+            raise Interrupt
+
+    def flush(self):
+        pass
+
+
+def test_resume_after_interruption(teams, tmp_path):
+    path, _ = teams
+    reference = str(tmp_path / 'reference.csv')
+    score_file(path, reference, chunk_size=100, ci={'n_samples': 200}, seed=3, progress=None)
+
+    output = str(tmp_path / 'scores.csv')
+    with pytest.raises(Interrupt):
+        score_file(path, output, chunk_size=100, ci={'n_samples': 200}, seed=3, progress=StopAfter(3))
+    assert os.path.exists(checkpoint_path(output))
+    # Half-written rows after the checkpoint are rolled back on resume
+    with open(output, 'a') as f:
+        f.write('999,partial')
+    with pytest.raises(FileExistsError, match="pass resume=True"):
+        score_file(path, output, progress=None)
+
+    # The checkpoint restores chunk_size, ci and seed whatever is passed here
+    assert score_file(path, output, chunk_size=7, resume=True, progress=None) == ROWS - 400
+    with open(reference, 'rb') as a, open(output, 'rb') as b:
+        assert a.read() == b.read()
+    assert not os.path.exists(checkpoint_path(output))
+
+
+def test_resume_without_checkpoint(teams, tmp_path):
+    path, _ = teams
+    output = str(tmp_path / 'scores.csv')
+    score_file(path, output, progress=None)
+    with pytest.raises(FileExistsError, match="no checkpoint"):
+        score_file(path, output, resume=True, progress=None)
+    with pytest.raises(FileExistsError, match="remove it to start over"):
+        score_file(path, output, progress=None)
+
+
+def test_parquet_dataset_writer(teams, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path, portfolio = teams
+    output = str(tmp_path / 'scores.parquet')
+    with pytest.raises(Interrupt):
+        score_file(path, output, chunk_size=300, keep=['team_id'], progress=StopAfter(1))
+    score_file(path, output, resume=True, progress=None)
+    assert sorted(os.listdir(output)) == [f'part-{i:06d}.parquet' for i in range(4)]
+    table = pq.read_table(output)
+    assert table.column('team_id').to_pylist() == [str(i) for i in range(ROWS)]
+    assert np.array_equal(table.column('TCD').to_numpy(), expected_tcd(portfolio))
@@ -0,0 +1,52 @@
+"""Exact precision mode: Decimal/mpmath agreement and the precision_audit screen."""
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS, calculate_tcd_v4
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.precision import FLOAT_RELATIVE_ERROR, calculate_tcd_v4_exact, precision_audit
+
+
+def team(P, score=3.0):
+    return {'P': P, 'N': 12.0, 'drivers': {k: score for k in DRIVERS}, 'phi': 1.2, 'rho': 1.1, 'BV': 4.0}
+
+
+def test_decimal_and_mpmath_agree_with_float():
+    t = team(1_800_000.0)
+    exact = calculate_tcd_v4_exact(**t, precision='decimal')
+    assert exact == calculate_tcd_v4_exact(**t, precision='mpmath')
+    assert float(exact['TCD']) == pytest.approx(calculate_tcd_v4(**t)['TCD'], abs=0.005)
+
+
+def test_known_disagreement_flagged():
+    # At 1e15 the float spacing is 0.125, so the float TCD cannot match the exact cents
+    P = np.array([1e15, 1_800_000.0])
+    drivers = {k: np.array([3.3, 3.3]) for k in DRIVERS}
+    audit = precision_audit(P, 12.0, drivers, 1.2, 1.1, 4.0)
+    assert audit['checked'].tolist() == [0]
+    assert audit['flagged'].tolist() == [0]
+    float_TCD = calculate_tcd_v4_batch(P, 12.0, drivers, 1.2, 1.1, 4.0)['TCD'][0]
+    exact = calculate_tcd_v4_exact(1e15, 12.0, {k: 3.3 for k in DRIVERS}, 1.2, 1.1, 4.0)['TCD']
+    assert audit['exact_TCD'] == [exact]
+    assert audit['max_abs_diff'] == abs(exact - type(exact)(float(float_TCD)))
+    assert audit['max_abs_diff'] > type(exact)('0.01')
+
+
+def test_screen_uses_payroll_cap():
+    # A near-perfect team's TCD is far below 3.5 P, so a TCD-only screen would skip it
+    P = 3e9
+    low_tcd = calculate_tcd_v4_batch(**{**team(P, score=6.9), 'P': np.array([P])})['TCD'][0]
+    tolerance = 0.01
+    assert low_tcd * FLOAT_RELATIVE_ERROR < tolerance / 2 <= P * 3.5 * FLOAT_RELATIVE_ERROR
+    audit = precision_audit(np.array([P]), 12.0, {k: np.array([6.9]) for k in DRIVERS}, 1.2, 1.1, 4.0,
+                            tolerance=tolerance)
+    assert audit['checked'].tolist() == [0]
+
+
+def test_exhaustive_checks_every_row():
+    portfolio = random_portfolio(20, seed=2)
+    audit = precision_audit(**portfolio, exhaustive=True)
+    assert audit['checked'].tolist() == list(range(20))
+    assert audit['flagged'].size == 0
+    assert audit['max_abs_diff'] <= type(audit['max_abs_diff'])('0.005')
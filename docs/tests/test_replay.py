@@ -0,0 +1,147 @@
+"""Version replay: identical versions, single-coefficient overrides, corpus files and audit logs."""
+
+import csv
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.audit import AuditLog
+from tcd.batch import COMPONENTS, calculate_tcd_v4_batch, random_portfolio
+from tcd.replay import diff_versions, materiality_threshold, replay_file
+
+from test_audit import write_log
+
+ROWS = 2_000
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    return random_portfolio(ROWS, seed=11)
+
+
+def raw_tcd(result):
+    """TCD before the payroll cap."""
+    return result['subtotal'] * result['M_4C'] * result['phi'] * result['eta'] * result['G']
+
+
+@pytest.mark.parametrize('version', [None, {}, {'tau': 0.18, 'cap': 3.0}])
+def test_identical_versions_give_zero_diffs(portfolio, version):
+    diff = diff_versions(portfolio, version, version)
+    assert np.array_equal(diff['TCD_baseline'], diff['TCD_candidate'])
+    for key in ['TCD_delta', 'TCD_delta_pct', *[f'{c}_delta' for c in COMPONENTS]]:
+        assert not np.any(diff[key]), key
+    assert not diff['material'].any()
+
+
+def test_tau_override_moves_only_c3_on_uncapped_rows(portfolio):
+    a = calculate_tcd_v4_batch(**portfolio)
+    b = calculate_tcd_v4_batch(**portfolio, coefficients={'tau': 0.18})
+    diff = diff_versions(portfolio, candidate={'tau': 0.18})
+    for c in COMPONENTS:
+        if c != 'C3':
+            assert not np.any(diff[f'{c}_delta']), c
+    np.testing.assert_allclose(diff['C3_delta'], a['C3'] * (0.18 / 0.21 - 1), rtol=1e-12, atol=1e-6)
+
+    # A lower tau lowers every row that stays under the cap in both versions
+    cap = portfolio['P'] * 3.5
+    capped = (raw_tcd(a) >= cap) & (raw_tcd(b) >= cap)
+    assert 0 < capped.sum() < ROWS
+    assert np.array_equal(diff['TCD_delta'] != 0, ~capped & (a['C3'] > 0))
+    assert np.all(diff['TCD_delta'] <= 0)
+    assert np.array_equal(diff['material'], np.abs(diff['TCD_delta']) >= materiality_threshold(a['TCD']))
+
+
+def test_cap_override_moves_only_rows_above_the_new_cap(portfolio):
+    a = calculate_tcd_v4_batch(**portfolio)
+    diff = diff_versions(portfolio, candidate={'cap': 3.0})
+    above = raw_tcd(a) > portfolio['P'] * 3.0
+    assert np.array_equal(diff['TCD_delta'] != 0, above)
+    assert np.array_equal(diff['TCD_candidate'][above], portfolio['P'][above] * 3.0)
+    for c in COMPONENTS:
+        assert not np.any(diff[f'{c}_delta']), c
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory, portfolio):
+    path = tmp_path_factory.mktemp('replay') / 'teams.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['team_id', 'payroll', 'team_size', *DRIVERS, 'phi', 'turnover_multiplier', 'bv'])
+        for i in range(ROWS):
+            writer.writerow([f't{i}', repr(float(portfolio['P'][i])), repr(float(portfolio['N'][i])),
+                             *[repr(float(portfolio['drivers'][k][i])) for k in DRIVERS],
+                             repr(float(portfolio['phi'][i])), repr(float(portfolio['rho'][i])),
+                             repr(float(portfolio['BV'][i]))])
+    return str(path)
+
+
+def read_output(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_replay_file_matches_diff(corpus, portfolio, tmp_path):
+    diff = diff_versions(portfolio, candidate={'cap': 3.0})
+    output = str(tmp_path / 'diff.csv')
+    summary = replay_file(corpus, output, candidate={'cap': 3.0}, chunk_size=300, top=3, progress=None)
+    moved = diff['TCD_delta'] != 0
+    assert summary['rows'] == ROWS
+    assert summary['changed'] == summary['decreased'] == int(moved.sum())
+    assert summary['increased'] == 0
+    assert summary['material'] == int(diff['material'].sum())
+    assert summary['TCD_delta_sum'] == pytest.approx(diff['TCD_delta'].sum())
+    largest = np.argsort(diff['TCD_delta'], kind='stable')[:3]
+    assert [move['label'] for move in summary['largest']] == [f't{i}' for i in largest]
+
+    rows = read_output(output)
+    assert [row['team_id'] for row in rows] == [f't{i}' for i in range(ROWS)]
+    assert np.array_equal([float(row['TCD_delta']) for row in rows], diff['TCD_delta'])
+
+    material = str(tmp_path / 'material.csv')
+    replay_file(corpus, material, candidate={'cap': 3.0}, material_only=True, progress=None)
+    assert [row['team_id'] for row in read_output(material)] == [f't{i}' for i in np.flatnonzero(diff['material'])]
+
+    # The same version on both sides moves nothing, whatever the chunk size
+    same = replay_file(corpus, baseline={'tau': 0.18}, candidate={'tau': 0.18}, chunk_size=7, progress=None)
+    assert same['changed'] == same['material'] == 0 and same['largest'] == []
+
+
+def test_audit_log_replay(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    write_log(path)
+    summary = replay_file(path, candidate={'delta_4': 0.2}, progress=None)
+    assert summary['rows'] == 200
+    assert summary['baseline_mismatches'] == summary['baseline_unchecked'] == 0
+    assert summary['changed'] > 0 and summary['decreased'] == 0
+
+    # Recorded with v4: a different baseline cannot be checked against them
+    other = replay_file(path, baseline={'tau': 0.18}, progress=None)
+    assert 'baseline_mismatches' in other and other['baseline_unchecked'] == 200
+
+
+def test_bad_arguments(corpus, tmp_path):
+    with pytest.raises(ValueError, match="Unknown coefficient 'gamma'"):
+        replay_file(corpus, candidate={'gamma': 1.0}, progress=None)
+    output = tmp_path / 'diff.csv'
+    output.write_text('')
+    with pytest.raises(FileExistsError, match="remove it first"):
+        replay_file(corpus, str(output), progress=None)
+
+
+def test_audit_log_replays_recorded_calibration(tmp_path):
+    path = str(tmp_path / 'scores.audit')
+    teams = random_portfolio(20, seed=6)
+    with AuditLog(path) as log:
+        log.score_batch(np.arange(20), **teams, calibration={'C2': 1.3})
+        log.score_batch(np.arange(20), **teams, calibration={'C3': np.linspace(0.8, 1.2, 20)})
+    output = str(tmp_path / 'diff.csv')
+    summary = replay_file(path, output, candidate={'tau': 0.18}, progress=None)
+    assert summary['rows'] == 40
+    assert summary['baseline_mismatches'] == 0
+    assert summary['baseline_unchecked'] == summary['calibration_not_replayed'] == 20
+
+    rows = read_output(output)
+    calibrated = calculate_tcd_v4_batch(**teams, calibration={'C2': 1.3})['TCD']
+    assert np.array_equal([float(row['TCD_baseline']) for row in rows[:20]], calibrated)
+    assert np.array_equal([float(row['TCD_baseline']) for row in rows[20:]], calculate_tcd_v4_batch(**teams)['TCD'])
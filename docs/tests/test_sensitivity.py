@@ -0,0 +1,69 @@
+"""Sensitivity API: gradients against finite differences of the batch formula, and flat slopes outside the clamps."""
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS
+from tcd.batch import calculate_tcd_v4_batch
+from tcd.sensitivity import SENSITIVITY_INPUTS, rank_drivers, tcd_sensitivities
+
+ROWS = 2_000
+STEP = 1e-5
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    """Inputs inside every clamp range, so each slope is a genuine derivative."""
+    rng = np.random.default_rng(14)
+    return {'P': rng.uniform(1e5, 1e7, ROWS), 'N': rng.integers(1, 40, ROWS).astype(float),
+            'drivers': {k: rng.uniform(1.05, 6.95, ROWS) for k in DRIVERS},
+            'phi': rng.uniform(0.75, 1.35, ROWS), 'rho': rng.uniform(0.85, 1.25, ROWS),
+            'BV': rng.uniform(1.1, 9.9, ROWS)}
+
+
+def shifted(portfolio, name, h):
+    if name in DRIVERS:
+        return dict(portfolio, drivers={**portfolio['drivers'], name: portfolio['drivers'][name] + h})
+    return dict(portfolio, **{name: portfolio[name] + h})
+
+
+@pytest.mark.parametrize('name', SENSITIVITY_INPUTS)
+def test_matches_finite_differences(portfolio, name):
+    got = tcd_sensitivities(**portfolio)
+    TCD = calculate_tcd_v4_batch(**portfolio)['TCD']
+    np.testing.assert_allclose(got['TCD'], TCD, rtol=1e-12)
+    up = calculate_tcd_v4_batch(**shifted(portfolio, name, STEP))['TCD']
+    down = calculate_tcd_v4_batch(**shifted(portfolio, name, -STEP))['TCD']
+    forward, backward = (up - TCD) / STEP, (TCD - down) / STEP
+    # Rows within a step of a kink (anomaly tolerance, gaming cap, payroll cap) have no derivative to check
+    scale = portfolio['P'] * 1e-3
+    smooth = np.abs(forward - backward) <= 1e-3 * np.maximum(np.abs(forward), scale)
+    assert smooth.mean() > 0.9
+    central = (up - down) / (2 * STEP)
+    np.testing.assert_allclose(got[name][smooth], central[smooth], rtol=1e-5, atol=1e-5 * scale.max())
+
+
+def test_flat_outside_the_clamps(portfolio):
+    for name, outside in [('phi', [0.5, 1.6]), ('rho', [0.6, 1.5]), ('BV', [0.5, 12.0])]:
+        for value in outside:
+            got = tcd_sensitivities(**dict(portfolio, **{name: np.full(ROWS, value)}))
+            assert not np.any(got[name]), (name, value)
+    for name in DRIVERS:
+        for value in (0.5, 7.5):
+            got = tcd_sensitivities(**shifted(portfolio, name, value - portfolio['drivers'][name]))
+            assert not np.any(got[name]), (name, value)
+    # On the lower bound the in-range slope is taken (toward improvement), on the upper bound none
+    low = tcd_sensitivities(**shifted(portfolio, 'trust', 1.0 - portfolio['drivers']['trust']))
+    high = tcd_sensitivities(**shifted(portfolio, 'trust', 7.0 - portfolio['drivers']['trust']))
+    assert np.all(low['trust'] <= 0) and np.mean(low['trust'] < 0) > 0.9 and not np.any(high['trust'])
+
+
+def test_scalar_team_and_ranking():
+    team = {'P': 1_800_000, 'N': 15, 'phi': 1.2, 'rho': 1.15, 'BV': 3.0,
+            'drivers': {'communication': 4.2, 'trust': 5.1, 'psych_safety': 4.8, 'goal_clarity': 3.9,
+                        'coordination': 4.5, 'tms': 4.0, 'team_cognition': 4.3}}
+    got = tcd_sensitivities(**team)
+    assert isinstance(got['trust'], float)
+    ranked = rank_drivers(got)
+    assert sorted(ranked) == sorted(DRIVERS)
+    assert [got[k] for k in ranked] == sorted(got[k] for k in DRIVERS)
@@ -0,0 +1,44 @@
+"""Sigmoid lookup table: error bound, exact fallback and scalar-only use."""
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS, calculate_tcd_v4, sigmoid_e_coef
+from tcd.batch import calculate_tcd_v4_batch, random_portfolio
+from tcd.sigmoid import TABLE_MAX_ERROR, table_error
+
+
+def test_table_error_within_bound():
+    assert table_error(points_per_interval=2) < TABLE_MAX_ERROR
+
+
+def test_table_matches_exact_and_falls_back_outside():
+    for E in np.linspace(0, 8, 1201):
+        table, exact = sigmoid_e_coef(float(E), 'table'), sigmoid_e_coef(float(E))
+        if 1 <= E <= 7:
+            assert abs(table - exact) < TABLE_MAX_ERROR
+        else:
+            assert table == exact
+
+
+def test_scalar_table_scoring_close_to_exact():
+    drivers = {k: 3.7 for k in DRIVERS}
+    exact = calculate_tcd_v4(1e6, 10, drivers, 1.0, 1.0, 2.0)
+    table = calculate_tcd_v4(1e6, 10, drivers, 1.0, 1.0, 2.0, sigmoid='table')
+    assert table['TCD'] == pytest.approx(exact['TCD'], rel=1e-9)
+
+
+def test_table_is_scalar_only():
+    with pytest.raises(ValueError, match="scalar-only"):
+        sigmoid_e_coef(np.linspace(1, 7, 10), 'table')
+    with pytest.raises(ValueError, match="sigmoid='exact'"):
+        calculate_tcd_v4_batch(**random_portfolio(10), sigmoid='table')
+
+
+@pytest.mark.parametrize('E', [np.float64(3.7), np.float32(3.7), np.int64(4), np.float64(0.5), 5])
+def test_table_accepts_numpy_scalars(E):
+    assert sigmoid_e_coef(E, 'table') == sigmoid_e_coef(float(E), 'table')
+    assert abs(sigmoid_e_coef(E, 'table') - sigmoid_e_coef(float(E))) < TABLE_MAX_ERROR
+    drivers = {k: E for k in DRIVERS}
+    exact = calculate_tcd_v4(1e6, 10, drivers, 1.0, 1.0, 2.0)
+    assert calculate_tcd_v4(1e6, 10, drivers, 1.0, 1.0, 2.0, sigmoid='table')['TCD'] == pytest.approx(exact['TCD'])
@@ -0,0 +1,71 @@
+"""Symbolic artefact cache: cold vs warm equivalence and rejection of unverified entries."""
+
+import os
+
+import numpy as np
+import pytest
+import sympy
+
+from tcd import sensitivity
+from tcd.batch import random_portfolio
+from tcd.symcache import cached_expr, cached_text
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('TCD_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+
+def never_built(*args):
+    raise AssertionError("built again")
+
+
+def test_sensitivities_cold_and_warm(cache, monkeypatch):
+    portfolio = random_portfolio(500, seed=9)
+    monkeypatch.setattr(sensitivity, '_GRADIENT', None)
+    cold = sensitivity.tcd_sensitivities(**portfolio)
+    (entry,) = os.listdir(cache)
+    assert entry.startswith('sensitivity-')
+
+    # A fresh process: the gradient is loaded from the cache, never rebuilt
+    monkeypatch.setattr(sensitivity, '_GRADIENT', None)
+    monkeypatch.setattr(sensitivity, '_gradient_source', never_built)
+    warm = sensitivity.tcd_sensitivities(**portfolio)
+    assert warm.keys() == cold.keys()
+    for k in cold:
+        assert np.array_equal(warm[k], cold[k]), k
+
+
+def test_expression_cold_and_warm(cache):
+    x = sympy.Symbol('x', positive=True)
+    expr = sympy.diff(0.18 / (1 + sympy.exp(2 * (x - 4))), x)
+    cold = cached_expr('simplify', sympy.simplify, expr)
+    warm = cached_expr('simplify', never_built, expr)
+    assert warm == cold and sympy.srepr(warm) == sympy.srepr(cold)
+
+
+def test_unverified_entries_rebuilt(cache):
+    key = 'ab' * 32
+    assert cached_text('demo', key, lambda: 'first') == 'first'
+    (path,) = [os.path.join(cache, name) for name in os.listdir(cache)]
+    with open(path) as f:
+        header, body = f.read().split('\n', 1)
+    assert header.startswith('tcd-cache sha256=') and body == 'first'
+    assert cached_text('demo', key, never_built) == 'first'
+
+    # Edited text no longer matches its digest
+    with open(path, 'w') as f:
+        f.write(f'{header}\nimport os')
+    os.chmod(path, 0o600)
+    assert cached_text('demo', key, lambda: 'second') == 'second'
+    # An entry from before the digest, or under another key sharing the prefix
+    with open(path, 'w') as f:
+        f.write('third')
+    assert cached_text('demo', key, lambda: 'fourth') == 'fourth'
+    assert cached_text('demo', key[:24] + 'cd' * 20, lambda: 'fifth') == 'fifth'
+
+    # A verified entry others can write is not trusted either
+    os.chmod(path, 0o666)
+    assert cached_text('demo', key[:24] + 'cd' * 20, lambda: 'sixth') == 'sixth'
+    assert cached_text('demo', key[:24] + 'cd' * 20, never_built) == 'sixth'
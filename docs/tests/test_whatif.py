@@ -0,0 +1,59 @@
+"""Incremental what-if: bit-for-bit agreement with calculate_tcd_v4 and with a fresh confidence interval."""
+
+import numpy as np
+import pytest
+
+from tcd import DRIVERS, calculate_tcd_v4
+from tcd.ci import tcd_confidence_interval
+from tcd.whatif import WhatIfSamples, WhatIfState
+
+TEAMS = 300
+
+
+def random_team(rng):
+    """Inputs that overshoot the sanitized ranges, so the clamps are exercised."""
+    return {'P': float(rng.uniform(1e5, 1e7)), 'N': float(rng.integers(1, 40)),
+            'drivers': {k: float(rng.uniform(0, 8)) for k in DRIVERS},
+            'phi': float(rng.uniform(0.5, 1.6)), 'rho': float(rng.uniform(0.7, 1.4)), 'BV': float(rng.uniform(0, 12))}
+
+
+def test_with_driver_is_bit_for_bit():
+    rng = np.random.default_rng(12)
+    for _ in range(TEAMS):
+        team = random_team(rng)
+        state = WhatIfState(**team)
+        assert state.result == calculate_tcd_v4(**team)
+        # A chain of slider moves, each compared with a full evaluation
+        for _ in range(5):
+            name = DRIVERS[rng.integers(len(DRIVERS))]
+            value = float(rng.choice([rng.uniform(0, 8), 1.0, 7.0, round(rng.uniform(1, 7), 1)]))
+            state = state.with_driver(name, value)
+            team['drivers'] = {**team['drivers'], name: value}
+            assert state.result == calculate_tcd_v4(**team), (team, name)
+
+
+def test_with_driver_leaves_the_original_state():
+    team = random_team(np.random.default_rng(1))
+    state = WhatIfState(**team)
+    before = dict(state.result)
+    state.with_driver('trust', 6.5)
+    assert state.result == before
+    with pytest.raises(ValueError, match="Unknown driver"):
+        state.with_driver('morale', 4.0)
+
+
+@pytest.mark.parametrize('seed', [3, 42])
+def test_samples_follow_changes(seed):
+    rng = np.random.default_rng(seed)
+    team = random_team(rng)
+    state = WhatIfState(**team)
+    samples = WhatIfSamples(state, n_samples=20_000, seed=seed)
+    for name in ['trust', 'tms', 'goal_clarity', 'communication']:
+        value = float(rng.uniform(1, 7))
+        state = state.with_driver(name, value)
+        team['drivers'] = {**team['drivers'], name: value}
+        low, high, mean = samples.update(state).interval()
+        fresh = tcd_confidence_interval(team, n_samples=20_000, seed=seed)
+        assert low == pytest.approx(fresh['low'], rel=1e-9)
+        assert high == pytest.approx(fresh['high'], rel=1e-9)
+        assert mean == pytest.approx(fresh['mean'], rel=1e-9)